@@ -1,22 +1,35 @@
 """Main module to run server and serve endpoints for clients."""
 
-from asyncio import run
-from datetime import datetime
-import sqlite3
+import argparse
+from asyncio import create_task, run
+import os
 
-from fastapi import FastAPI, HTTPException, status
-from fastapi.responses import JSONResponse
+from fastapi import Depends, FastAPI, HTTPException, Query, Request, status
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
 from loguru import logger
 import uvicorn
 from uvicorn.server import Server
-from typing import Optional
-
+from typing import AsyncIterator, Callable, List, Optional
+
+from .admission import AdmissionControl, get_admission
+from .cache import catalog_cache, etag_matches, role_cache, section_cache
+from .cache_sync import CacheSync, sync_caches
+from .catalog_import import CATALOG_FORMATS, CatalogImport, LineDecoder
+from .database import (
+    AsyncDatabase,
+    DatabaseBusy,
+    PoolTimeout,
+    checkpoint_in_background,
+    database,
+    get_database,
+    pool,
+    tag_change_log,
+)
 from .database_query import (
     DBException,
-    check_enrollment_eligibility,
-    check_user_role,
-    complete_registration,
-    get_available_classes,
+    enroll_student,
+    enroll_cart,
+    load_catalog,
     update_student_registration_status,
     addClass,
     check_class_exists,
@@ -25,19 +38,44 @@ from .database_query import (
     deleteSection,
     changeSectionInstructor,
     freezeEnrollment,
-    check_status_query,
-    check_is_instructor,
+    resolve_role,
     get_enrolled_students,
     get_dropped_students,
     get_waitlist_status,
     get_waitlist,
+    waitlist_position_rows,
+    waitlist_rows,
     check_is_enrolled,
     check_is_instructor_of_section,
     get_waitlisted_students,
-    drop_student
+    drop_student,
+    decode_roster_cursor,
+    encode_roster_cursor,
+    roster_key,
+)
+from .log import configure_logging
+from .metrics import CONTENT_TYPE, MetricsMiddleware, render_metrics
+from .migrations import apply_migrations
+from .read_replica import get_read_database, read_replica, refresh_snapshots
+from .reconcile import reconcile_in_background
+from .write_queue import WriteQueue, get_write_queue, write_queue
+from .responses import FastJSONResponse, dumps
+from .settings import (
+    CACHE_SYNC_INTERVAL,
+    DATABASE_URL,
+    DB_CHECKPOINT_INTERVAL,
+    FAST_RESPONSES,
+    READ_REPLICA,
+    RECONCILE_INTERVAL,
+    ROSTER_STREAM_PAGE_SIZE,
+    WEB_WORKERS,
+    WRITE_QUEUE,
 )
 from .models import (
     AvailableClassResponse,
+    BatchEnrollmentRequest,
+    BatchEnrollmentResponse,
+    CatalogImportResponse,
     EnrollmentRequest,
     EnrollmentResponse,
     QueryStatus,
@@ -68,41 +106,113 @@ from .models import (
 )
 
 app = FastAPI()
-DATABASE_URL = "./api/share/classes.db"
-db_connection = sqlite3.connect(DATABASE_URL)
-db_connection.isolation_level = None
-
+app.add_middleware(MetricsMiddleware)
+
+
+@app.on_event("startup")
+async def startup():
+    configure_logging()
+    with pool.connection() as db_connection:
+        version = apply_migrations(db_connection)
+        # Opened before the migrations, so it could not tag its changes yet
+        tag_change_log(db_connection)
+    logger.info(f'Database schema at version {version}')
+    if CACHE_SYNC_INTERVAL > 0:
+        app.state.cache_sync = CacheSync(DATABASE_URL)
+        app.state.cache_sync_task = create_task(sync_caches(app.state.cache_sync))
+    if WRITE_QUEUE:
+        write_queue.start()
+    if RECONCILE_INTERVAL > 0:
+        app.state.reconcile_task = create_task(reconcile_in_background(database))
+    if DB_CHECKPOINT_INTERVAL > 0:
+        app.state.checkpoint_task = create_task(checkpoint_in_background(database))
+    if READ_REPLICA != 'off':
+        read_replica.start()
+        logger.info(f'Serving reads from a {READ_REPLICA} replica')
+    if READ_REPLICA == 'snapshot':
+        app.state.snapshot_task = create_task(refresh_snapshots(read_replica))
 
 @app.on_event("shutdown")
 async def shutdown():
-    db_connection.close()
+    for task_name in ('cache_sync_task', 'reconcile_task', 'checkpoint_task', 'snapshot_task'):
+        if getattr(app.state, task_name, None) is not None:
+            getattr(app.state, task_name).cancel()
+    if getattr(app.state, 'cache_sync', None) is not None:
+        app.state.cache_sync.close()
+    await write_queue.stop()
+    read_replica.close()
+    database.close()
+    # Flush records still queued for the background sink
+    await logger.complete()
+
+@app.exception_handler(PoolTimeout)
+async def pool_timeout_handler(request: Request, exc: PoolTimeout):
+    return JSONResponse(content= {'detail': exc.error_detail}, status_code = status.HTTP_503_SERVICE_UNAVAILABLE)
+
+@app.exception_handler(DatabaseBusy)
+async def database_busy_handler(request: Request, exc: DatabaseBusy):
+    return JSONResponse(content= {'detail': exc.error_detail}, status_code = status.HTTP_503_SERVICE_UNAVAILABLE,
+                        headers = {'Retry-After': '1'})
 
 @app.get(path='/db_liveness', operation_id='check_db_health')
-async def check_db_health():
+async def check_db_health(db: AsyncDatabase = Depends(get_database)):
     try:
-        db_connection.cursor()
-        return JSONResponse(content= {'status': 'ok'}, status_code = status.HTTP_200_OK)
+        await db.run(lambda db_connection: db_connection.execute("SELECT 1"))
+        content = {'status': 'ok', 'executor': db.stats(), 'section_cache': section_cache.stats(),
+                   'catalog_cache': catalog_cache.stats(), 'role_cache': role_cache.stats()}
+        if read_replica.started:
+            content['read_replica'] = read_replica.stats()
+        return JSONResponse(content= content, status_code = status.HTTP_200_OK)
     except Exception as ex:
         return JSONResponse(content= {'status': 'not connected'}, status_code = status.HTTP_503_SERVICE_UNAVAILABLE)
 
+@app.get(path='/metrics', operation_id='metrics', response_class=PlainTextResponse)
+async def metrics(db: AsyncDatabase = Depends(get_database)):
+    """Request, query, statement, pool and cache metrics in Prometheus text format."""
+    executor = db.stats()
+    gauges = {
+        'db_executor_queued': ('Query functions waiting for an executor thread.', executor['queued']),
+        'db_executor_running': ('Query functions running on an executor thread.', executor['running']),
+    }
+    if read_replica.started:
+        gauges['db_read_snapshot_age_seconds'] = ('Seconds since the read snapshot was taken; 0 for read-only connections.',
+                                                  read_replica.age())
+    counters = {}
+    for name, cache in (('section', section_cache), ('catalog', catalog_cache), ('role', role_cache)):
+        stats = cache.stats()
+        gauges[f'{name}_cache_entries'] = (f'Entries in the {name} cache.', stats['size'])
+        counters[f'{name}_cache_hits_total'] = (f'Lookups answered by the {name} cache.', stats['hits'])
+        counters[f'{name}_cache_misses_total'] = (f'Lookups the {name} cache could not answer.', stats['misses'])
+    return PlainTextResponse(content = render_metrics(gauges, counters), media_type = CONTENT_TYPE)
+
 
 ##########   STUDENTS ENDPOINTS     ######################
 @app.get(path="/classes", operation_id="available_classes", response_model = AvailableClassResponse)
-async def available_classes(department_name: str):
+async def available_classes(department_name: str, request: Request, db: AsyncDatabase = Depends(get_read_database)):
     """API to fetch list of available classes for a given department name.
 
+    The serialized catalog is cached per department and tagged with an ETag;
+    a request whose If-None-Match matches gets 304 with no body.
+
     Args:
         department_name (str): Department name
 
     Returns:
         AvailableClassResponse: AvailableClassResponse model
     """
-    result = get_available_classes(db_connection=db_connection, department_name=department_name)
-    logger.info('Succesffuly exexuted available')
-    return AvailableClassResponse(available_classes = result)
+    entry = catalog_cache.get(department_name)
+    if entry is None:
+        entry = await db.run(load_catalog, department_name=department_name)
+        logger.info('Succesffuly exexuted available')
+    headers = {'ETag': entry.etag, 'Cache-Control': 'no-cache'}
+    if etag_matches(request.headers.get('if-none-match'), entry.etag):
+        return Response(status_code = status.HTTP_304_NOT_MODIFIED, headers = headers)
+    return Response(content = entry.body, media_type = 'application/json', headers = headers)
 
 @app.post(path ="/enrollment", operation_id="course_enrollment", response_model= EnrollmentResponse)
-async def course_enrollment(enrollment_request: EnrollmentRequest):
+async def course_enrollment(enrollment_request: EnrollmentRequest, db: AsyncDatabase = Depends(get_database),
+                            queue: WriteQueue = Depends(get_write_queue),
+                            admission: AdmissionControl = Depends(get_admission)):
     """Allow enrollment of a course under given section for a student
 
     Args:
@@ -110,52 +220,66 @@ async def course_enrollment(enrollment_request: EnrollmentRequest):
 
     Raises:
         HTTPException: Raise HTTP exception when role is not authrorized
+        HTTPException: Raise HTTP exception when the student or section is over its request rate
         HTTPException: Raise HTTP exception when query fail to execute in database
 
     Returns:
         EnrollmentResponse: EnrollmentResponse model
     """
+    admission.admit_enrollment(enrollment_request.student_id, enrollment_request.course_code,
+                               enrollment_request.section_number)
+    try:
+        if WRITE_QUEUE:
+            return await queue.enroll(enrollment_request)
+        return await db.run(enroll_student, enrollment_request)
+    except DBException as err:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail= err.error_detail)
 
-    role = check_user_role(db_connection, enrollment_request.student_id)
-    if role == UserRole.NOT_FOUND or role != UserRole.STUDENT:
-        raise HTTPException(status_code = status.HTTP_401_UNAUTHORIZED, detail= f'Enrollment not authorized for role:{role}')
-    check_if_already_enrolled = check_status_query(db_connection, enrollment_request)
-    if check_if_already_enrolled :
-        return check_if_already_enrolled
-    eligibility_status = check_enrollment_eligibility(db_connection, enrollment_request.section_number, enrollment_request.course_code)
-    if eligibility_status == RegistrationStatus.NOT_ELIGIBLE:
-        return EnrollmentResponse(enrollment_status = 'not eligible')
+@app.post(path ="/enrollment/batch", operation_id="batch_course_enrollment", response_model= BatchEnrollmentResponse)
+async def batch_course_enrollment(batch_request: BatchEnrollmentRequest, db: AsyncDatabase = Depends(get_database)):
+    """Enroll a student in several sections at once
 
-    try:
-        registration = Registration(student_id = enrollment_request.student_id, enrollment_status = eligibility_status, 
-                                    section_number = enrollment_request.section_number, course_code = enrollment_request.course_code) 
-        insert_status = complete_registration(db_connection,registration)
-        if insert_status == QueryStatus.SUCCESS:
-            return EnrollmentResponse(enrollment_date = datetime.utcnow(), enrollment_status = eligibility_status)
+    Args:
+        batch_request (BatchEnrollmentRequest): Student and the sections in the cart
+
+    Raises:
+        HTTPException: Raise HTTP exception when role is not authrorized
+        HTTPException: Raise HTTP exception when query fail to execute in database
 
+    Returns:
+        BatchEnrollmentResponse: one result per section, in cart order
+    """
+    try:
+        return await db.run(enroll_cart, batch_request)
     except DBException as err:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail= err.error_detail)
 
-
 @app.put(path = "/dropcourse", operation_id= "update_registration_status",response_model= DropCourseResponse)
-async def update_registration_status(enrollment_request:EnrollmentRequest):
+async def update_registration_status(enrollment_request:EnrollmentRequest, db: AsyncDatabase = Depends(get_database),
+                                     queue: WriteQueue = Depends(get_write_queue),
+                                     admission: AdmissionControl = Depends(get_admission)):
     """API for students to drop a course
 
     Args:
         enrollment_request (EnrollmentRequest): Enrollment request
 
     Raises:
+        HTTPException: Raise Exception when the student is over their request rate
         HTTPException: Raise Exception if database fail to execute query
 
     Returns:
         DropCourseResponse : drop course response
     """
+    admission.admit_drop(enrollment_request.student_id)
     try:
         registration = Registration(section_number= enrollment_request.section_number,
                                     student_id=enrollment_request.student_id,
                                     course_code=enrollment_request.course_code,
                                     enrollment_status='enrolled')
-        result = update_student_registration_status(db_connection,registration)
+        if WRITE_QUEUE:
+            result = await queue.drop_course(registration)
+        else:
+            result = await db.run(update_student_registration_status, registration)
         
         if result == RegistrationStatus.DROPPED:
             return DropCourseResponse(course_code=enrollment_request.course_code,
@@ -170,11 +294,11 @@ async def update_registration_status(enrollment_request:EnrollmentRequest):
 
 ##########   REGISTRAR ENDPOINTS     ######################
 @app.post(path="/classes", operation_id="add_class", response_model=AddClassResponse)
-async def add_class(addClass_request: AddClassRequest):
-    classExists = check_class_exists(db_connection, addClass_request.course_code)
+async def add_class(addClass_request: AddClassRequest, db: AsyncDatabase = Depends(get_database)):
+    classExists = await db.run(check_class_exists, addClass_request.course_code)
     if classExists:
         try:
-            response = addSection(db_connection, addClass_request.section_number, addClass_request.course_code, addClass_request.instructor_id, addClass_request.max_enrollment)
+            response = await db.run(addSection, addClass_request.section_number, addClass_request.course_code, addClass_request.instructor_id, addClass_request.max_enrollment)
             if response == QueryStatus.SUCCESS:
                 return AddClassResponse(addClass_status = 'Successfully added new section')
             else:
@@ -184,9 +308,9 @@ async def add_class(addClass_request: AddClassRequest):
             raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail= err.error_detail)
     else:
         try:
-            addClassResponse = addClass(db_connection, addClass_request.course_code, addClass_request.class_name, addClass_request.department)
+            addClassResponse = await db.run(addClass, addClass_request.course_code, addClass_request.class_name, addClass_request.department)
             if addClassResponse == QueryStatus.SUCCESS:
-                addSectionResponse = addSection(db_connection, addClass_request.section_number, addClass_request.course_code, addClass_request.instructor_id, addClass_request.max_enrollment)
+                addSectionResponse = await db.run(addSection, addClass_request.section_number, addClass_request.course_code, addClass_request.instructor_id, addClass_request.max_enrollment)
                 if addSectionResponse == QueryStatus.SUCCESS:
                     return AddClassResponse(addClass_status = 'Successfully added Class & Section')
                 else:
@@ -195,34 +319,66 @@ async def add_class(addClass_request: AddClassRequest):
         except DBException as err:
             raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail= err.error_detail)
 
+@app.post(path="/classes/import", operation_id="import_catalog", response_model=CatalogImportResponse)
+async def import_classes(request: Request, format: str = 'csv', db: AsyncDatabase = Depends(get_database)):
+    """Bulk add or update classes and sections from a CSV or JSON-lines request body
+
+    Args:
+        format (str): 'csv' (with a header line) or 'jsonl'
+
+    Raises:
+        HTTPException: Raise HTTP exception when the body cannot be read
+        HTTPException: Raise HTTP exception when query fail to execute in database
+
+    Returns:
+        CatalogImportResponse: rows imported, rejected rows and throughput
+    """
+    if format not in CATALOG_FORMATS:
+        raise HTTPException(status_code = status.HTTP_400_BAD_REQUEST, detail= f'Unsupported catalog format: {format}')
+    # The body is parsed here as it arrives, and only full chunks go to a database thread, so a slow
+    # upload holds no connection. Chunks already imported stay imported if the body turns out not to be UTF-8.
+    catalog = CatalogImport(format)
+    decoder = LineDecoder()
+    try:
+        async for data in request.stream():
+            for chunk in catalog.chunks(decoder.feed(data)):
+                await db.run(catalog.write, chunk)
+        for chunk in catalog.chunks(decoder.close(), final=True):
+            await db.run(catalog.write, chunk)
+        return catalog.report()
+    except UnicodeDecodeError:
+        raise HTTPException(status_code = status.HTTP_400_BAD_REQUEST, detail= 'Catalog must be UTF-8 text')
+    except DBException as err:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail= err.error_detail)
+
 @app.delete(path="/sections", operation_id="delete_section", response_model=DeleteSectionResponse)  
-async def delete_section(deleteSection_Request: DeleteSectionRequest):
-    sectionExists = check_section_exists(db_connection, deleteSection_Request.course_code, deleteSection_Request.section_number)
+async def delete_section(deleteSection_Request: DeleteSectionRequest, db: AsyncDatabase = Depends(get_database)):
+    sectionExists = await db.run(check_section_exists, deleteSection_Request.course_code, deleteSection_Request.section_number)
     if not sectionExists:
         raise HTTPException(status_code = status.HTTP_401_UNAUTHORIZED, detail= f'This section does not exist')
-    response = deleteSection(db_connection, deleteSection_Request.course_code, deleteSection_Request.section_number)
+    response = await db.run(deleteSection, deleteSection_Request.course_code, deleteSection_Request.section_number)
     if response == QueryStatus.SUCCESS:
         return DeleteSectionResponse(deleteSection_status = 'Successfully deleted section ' + str(deleteSection_Request.section_number) + ' of course ' + deleteSection_Request.course_code)
     else:
         return DeleteSectionResponse(deleteSection_status = 'Failed to delete section')
     
 @app.post(path="/changeSectionInstructor", operation_id="change_section_instructor", response_model=ChangeInstructorResponse)
-async def change_section_instructor(changeInstructor_Request: ChangeInstructorRequest):
-    sectionExists = check_section_exists(db_connection, changeInstructor_Request.course_code, changeInstructor_Request.section_number)
+async def change_section_instructor(changeInstructor_Request: ChangeInstructorRequest, db: AsyncDatabase = Depends(get_database)):
+    sectionExists = await db.run(check_section_exists, changeInstructor_Request.course_code, changeInstructor_Request.section_number)
     if sectionExists == 0:
         raise HTTPException(status_code = status.HTTP_401_UNAUTHORIZED, detail= f'This section does not exist')
-    response = changeSectionInstructor(db_connection, changeInstructor_Request.course_code, changeInstructor_Request.section_number, changeInstructor_Request.instructor_id)
+    response = await db.run(changeSectionInstructor, changeInstructor_Request.course_code, changeInstructor_Request.section_number, changeInstructor_Request.instructor_id)
     if response == QueryStatus.SUCCESS:
         return ChangeInstructorResponse(changeInstructor_status = 'Successfully changed instructor of section ' + str(changeInstructor_Request.section_number))
     else:
         return ChangeInstructorResponse(changeInstructor_status = 'Failed to change instructor')
     
 @app.post(path="/freezeEnrollment", operation_id='freeze_enrollment', response_model=FreezeEnrollmentResponse)
-async def freeze_enrollment(freezeEnrollment_Request: FreezeEnrollmentRequest):
-    sectionExists = check_section_exists(db_connection, freezeEnrollment_Request.course_code, freezeEnrollment_Request.section_number)
+async def freeze_enrollment(freezeEnrollment_Request: FreezeEnrollmentRequest, db: AsyncDatabase = Depends(get_database)):
+    sectionExists = await db.run(check_section_exists, freezeEnrollment_Request.course_code, freezeEnrollment_Request.section_number)
     if sectionExists == 0:
         raise HTTPException(status_code = status.HTTP_401_UNAUTHORIZED, detail= f'This section does not exist')
-    response = freezeEnrollment(db_connection, freezeEnrollment_Request.course_code, freezeEnrollment_Request.section_number)
+    response = await db.run(freezeEnrollment, freezeEnrollment_Request.course_code, freezeEnrollment_Request.section_number)
     if response == QueryStatus.SUCCESS:
         return FreezeEnrollmentResponse(freezeEnrollment_status = 'Successfully freezed enrollment for section ' + str(freezeEnrollment_Request.section_number))
     else:
@@ -234,21 +390,23 @@ async def freeze_enrollment(freezeEnrollment_Request: FreezeEnrollmentRequest):
 ##########   WAITLIST ENDPOINTS     ######################
 # student viewing their position in the waitlist
 @app.get(path="/waitlist_position", operation_id="waitlist_position", response_model = WaitlistPositionRes)
-async def waitlist_position(waitlist_request: WaitlistPositionReq):
+async def waitlist_position(waitlist_request: WaitlistPositionReq, db: AsyncDatabase = Depends(get_read_database)):
     """API to fetch the current position of a student in a waitlist.
     Args:
         student_id: int
     Returns:
         WaitlistPositionRes: WaitlistPositionRes model
     """
-    result = get_waitlist_status(db_connection=db_connection, 
-                                 student_id=waitlist_request.student_id)
+    if FAST_RESPONSES:
+        rows = await db.run(waitlist_position_rows, student_id=waitlist_request.student_id)
+        return FastJSONResponse({'waitlist_positions': rows})
+    result = await db.run(get_waitlist_status, student_id=waitlist_request.student_id)
     logger.info('Succesffuly executed the query')
     return WaitlistPositionRes(waitlist_positions = result)
 
 # instructors viewing the current waitlist for a course and section
 @app.get(path="/view_waitlist", operation_id="view_waitlist", response_model = ViewWaitlistRes)
-async def view_waitlist(view_waitlist_req: ViewWaitlistReq):
+async def view_waitlist(view_waitlist_req: ViewWaitlistReq, db: AsyncDatabase = Depends(get_read_database)):
     """API to fetch the students in a waitlist.
     Args:
         section_number: int
@@ -256,8 +414,11 @@ async def view_waitlist(view_waitlist_req: ViewWaitlistReq):
     Returns:
         ViewWaitlistRes: ViewWaitlistRes model
     """
-    result = get_waitlist(db_connection=db_connection, 
-                                 course_code=view_waitlist_req.course_code, 
+    if FAST_RESPONSES:
+        rows = await db.run(waitlist_rows, course_code=view_waitlist_req.course_code,
+                            section_number=view_waitlist_req.section_number)
+        return FastJSONResponse({'waitlisted_students': rows})
+    result = await db.run(get_waitlist, course_code=view_waitlist_req.course_code, 
                                  section_number=view_waitlist_req.section_number)
     logger.info('Succesffuly executed the query')
     return ViewWaitlistRes(waitlisted_students = result)
@@ -266,69 +427,127 @@ async def view_waitlist(view_waitlist_req: ViewWaitlistReq):
 
 
 ##########   INSTRUCTOR ENDPOINTS     ######################
+async def stream_roster(db: AsyncDatabase, fetch: Callable, instructor_id: int, course_code: Optional[str],
+                        section_number: Optional[int], page: List[dict]) -> AsyncIterator[bytes]:
+    """Yield roster rows as NDJSON, reading the next keyset page only when the previous one is sent."""
+    while True:
+        for row in page:
+            yield dumps(row) + b'\n'
+        if len(page) < ROSTER_STREAM_PAGE_SIZE:
+            return
+        page = await db.run(fetch, instructor_id, course_code, section_number, roster_key(page[-1]), ROSTER_STREAM_PAGE_SIZE)
+
+async def roster_response(db: AsyncDatabase, fetch: Callable, instructor_id: int, course_code: Optional[str],
+                          section_number: Optional[int], limit: Optional[int], cursor: Optional[str], stream: bool):
+    """Read one roster page, or start an NDJSON stream of the whole roster.
+
+    Returns a StreamingResponse when streaming, otherwise the page rows and the
+    cursor of the next page (None on the last page).
+    """
+    after = decode_roster_cursor(cursor) if cursor else None
+    if stream:
+        # The first page is read here so a missing roster still answers 404
+        page = await db.run(fetch, instructor_id, course_code, section_number, after, ROSTER_STREAM_PAGE_SIZE)
+        return StreamingResponse(stream_roster(db, fetch, instructor_id, course_code, section_number, page),
+                                 media_type = 'application/x-ndjson')
+    result = await db.run(fetch, instructor_id, course_code, section_number, after, limit)
+    next_cursor = encode_roster_cursor(result[-1]) if limit is not None and len(result) == limit else None
+    return result, next_cursor
+
 @app.get(path="/classEnrollment", operation_id="list_enrollment", response_model=RecordsEnrollmentResponse)
-async def list_enrollment(instructor_id: int, section_number: Optional[int] = None, course_code: Optional[str] = None):
+async def list_enrollment(instructor_id: int, section_number: Optional[int] = None, course_code: Optional[str] = None,
+                  limit: Optional[int] = Query(None, ge=1), cursor: Optional[str] = None, stream: bool = False,
+                  db: AsyncDatabase = Depends(get_read_database)):
     """API to fetch list of enrolled students for a given instructor.
 
     Args:
         instructor_id (int): Instructor id
         section_number (Optional[int]): Section number (optional)
         course_code (Optional[str]): Course code (optional)
+        limit (Optional[int]): Page size; the response carries next_cursor when more rows follow (optional)
+        cursor (Optional[str]): next_cursor of the previous page (optional)
+        stream (bool): Stream every row as NDJSON instead of one JSON document (optional)
 
     Returns:
         RecordsEnrollmentResponse: RecordsEnrollmentResponse model
     """
-    role = check_is_instructor(db_connection, instructor_id)
+    role = await db.run(resolve_role, instructor_id)
     if role == UserRole.NOT_FOUND or role != UserRole.INSTRUCTOR:
         logger.info('List Class Enrollment not authorized for role')
         raise HTTPException(status_code = status.HTTP_401_UNAUTHORIZED, detail= f'List Class Enrollment not authorized for role: {role}')
-    result = get_enrolled_students(db_connection, instructor_id, course_code, section_number)
+    response = await roster_response(db, get_enrolled_students, instructor_id, course_code, section_number, limit, cursor, stream)
     logger.info('Successfully executed list_enrollment')
-    return RecordsEnrollmentResponse(enrolled_students = result)
+    if stream:
+        return response
+    result, next_cursor = response
+    if FAST_RESPONSES:
+        return FastJSONResponse({'enrolled_students': result, 'next_cursor': next_cursor})
+    return RecordsEnrollmentResponse(enrolled_students = result, next_cursor = next_cursor)
 
 # TODO: test this endpoint 
 @app.get(path="/classWaitlist", operation_id="list_waitlist", response_model=RecordsWaitlistResponse)
-async def list_waitlist(instructor_id: int, section_number: Optional[int] = None, course_code: Optional[str] = None):
+async def list_waitlist(instructor_id: int, section_number: Optional[int] = None, course_code: Optional[str] = None,
+                  limit: Optional[int] = Query(None, ge=1), cursor: Optional[str] = None, stream: bool = False,
+                  db: AsyncDatabase = Depends(get_read_database)):
     """API to fetch list of enrolled students for a given instructor.
 
     Args:
         instructor_id (int): Instructor id
         section_number (Optional[int]): Section number (optional)
         course_code (Optional[str]): Course code (optional)
+        limit (Optional[int]): Page size; the response carries next_cursor when more rows follow (optional)
+        cursor (Optional[str]): next_cursor of the previous page (optional)
+        stream (bool): Stream every row as NDJSON instead of one JSON document (optional)
 
     Returns:
         RecordsWaitlistResponse: RecordsWaitlistResponse model
     """
-    role = check_is_instructor(db_connection, instructor_id)
+    role = await db.run(resolve_role, instructor_id)
     if role == UserRole.NOT_FOUND or role != UserRole.INSTRUCTOR:
         logger.info('List Class Waitlist not authorized for role')
         raise HTTPException(status_code = status.HTTP_401_UNAUTHORIZED, detail= f'List Class Waitlist not authorized for role: {role}')
-    result = get_waitlisted_students(db_connection, instructor_id, course_code, section_number)
+    response = await roster_response(db, get_waitlisted_students, instructor_id, course_code, section_number, limit, cursor, stream)
     logger.info('Successfully executed list_waitlist')
-    return RecordsWaitlistResponse(waitlisted_students = result)
+    if stream:
+        return response
+    result, next_cursor = response
+    if FAST_RESPONSES:
+        return FastJSONResponse({'waitlisted_students': result, 'next_cursor': next_cursor})
+    return RecordsWaitlistResponse(waitlisted_students = result, next_cursor = next_cursor)
 
 @app.get(path="/classDropped", operation_id="list_dropped", response_model=RecordsDroppedResponse)
-async def list_dropped(instructor_id: int, section_number: Optional[int] = None, course_code: Optional[str] = None):
+async def list_dropped(instructor_id: int, section_number: Optional[int] = None, course_code: Optional[str] = None,
+                  limit: Optional[int] = Query(None, ge=1), cursor: Optional[str] = None, stream: bool = False,
+                  db: AsyncDatabase = Depends(get_read_database)):
     """API to fetch list of dropped students for a given section.
 
     Args:
         instructor_id (int): Instructor id
         section_number (Optional[int]): Section number (optional)
         course_code (Optional[str]): Course code (optional)
+        limit (Optional[int]): Page size; the response carries next_cursor when more rows follow (optional)
+        cursor (Optional[str]): next_cursor of the previous page (optional)
+        stream (bool): Stream every row as NDJSON instead of one JSON document (optional)
 
     Returns:
         RecordsDroppedResponse: RecordsDroppedResponse model
     """
-    role = check_is_instructor(db_connection, instructor_id)
+    role = await db.run(resolve_role, instructor_id)
     if role == UserRole.NOT_FOUND or role != UserRole.INSTRUCTOR:
         logger.info('List Class Dropped not authorized for role')
         raise HTTPException(status_code = status.HTTP_401_UNAUTHORIZED, detail= f'List Class Dropped not authorized for role: {role}')
-    result = get_dropped_students(db_connection, instructor_id, course_code, section_number)
+    response = await roster_response(db, get_dropped_students, instructor_id, course_code, section_number, limit, cursor, stream)
     logger.info('Successfully executed list_dropped')
-    return RecordsDroppedResponse(dropped_students = result)
+    if stream:
+        return response
+    result, next_cursor = response
+    if FAST_RESPONSES:
+        return FastJSONResponse({'dropped_students': result, 'next_cursor': next_cursor})
+    return RecordsDroppedResponse(dropped_students = result, next_cursor = next_cursor)
 
 @app.post(path="/dropStudent", operation_id="instructor_drop_student", response_model=DroppedResponse)
-async def instructor_drop_student(DropRequest: DropStudentRequest):
+async def instructor_drop_student(DropRequest: DropStudentRequest, db: AsyncDatabase = Depends(get_database),
+                                  queue: WriteQueue = Depends(get_write_queue)):
     """API to drop a student from a section.
 
     Args:
@@ -340,23 +559,26 @@ async def instructor_drop_student(DropRequest: DropStudentRequest):
     Returns:
         droppedResponse: droppedResponse model
     """
-    role = check_is_instructor(db_connection, DropRequest.instructor_id)
+    role = await db.run(resolve_role, DropRequest.instructor_id)
     # # check if action is being perform by instructor 
     if role == UserRole.NOT_FOUND or role != UserRole.INSTRUCTOR:
         logger.info('Drop Student not authorized for role')
         raise HTTPException(status_code = status.HTTP_401_UNAUTHORIZED, detail= f'Drop Student not authorized for role: {role}')
     # # check if instructor teaches the section 
-    check_instructor = check_is_instructor_of_section(db_connection, DropRequest)
+    check_instructor = await db.run(check_is_instructor_of_section, DropRequest)
     if check_instructor == False:
         logger.info('Instructor does not teach the section')
         raise HTTPException(status_code = status.HTTP_401_UNAUTHORIZED, detail= f'Instructor does not teach the section')
     # # check if student is enrolled in the section or waitlisted
-    check_status = check_is_enrolled(db_connection, DropRequest)
+    check_status = await db.run(check_is_enrolled, DropRequest)
     if check_status == False:
         logger.info('Student is not enrolled in the section')
         raise HTTPException(status_code = status.HTTP_401_UNAUTHORIZED, detail= f'Student is not enrolled in the section')
     try:    
-        result = drop_student(db_connection, DropRequest)
+        if WRITE_QUEUE:
+            result = await queue.drop_student(DropRequest)
+        else:
+            result = await db.run(drop_student, DropRequest)
         logger.info('Successfully executed drop_student')
         if result == QueryStatus.SUCCESS:
             return DroppedResponse(drop_status = "Student was dropped")
@@ -365,11 +587,29 @@ async def instructor_drop_student(DropRequest: DropStudentRequest):
     
 ##########   INSTRUCTOR ENDPOINTS ENDS    ######################
 
-async def main():
-    """Start the server."""
-    server = Server(uvicorn.Config(app=app, host="0.0.0.0", timeout_graceful_shutdown=30))
+async def serve(host: str, port: int):
+    """Start the server in this process."""
+    server = Server(uvicorn.Config(app=app, host=host, port=port, timeout_graceful_shutdown=30))
     await server.serve()
 
+def main():
+    """Start the server, as ``--workers`` processes sharing classes.db when more than one.
+
+    Every worker applies pending migrations at startup (only the first one
+    finds any), retries writes that find the database busy, and follows the
+    other workers' writes through the change log (api/cache_sync.py).
+    """
+    parser = argparse.ArgumentParser(description='Run the registration API.')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=int(os.environ.get('PORT', '8000')))
+    parser.add_argument('--workers', type=int, default=WEB_WORKERS, help='server processes (default: WEB_WORKERS)')
+    args = parser.parse_args()
+    if args.workers > 1:
+        # uvicorn imports the app in each worker process it supervises
+        uvicorn.run('api.__main__:app', host=args.host, port=args.port, workers=args.workers, timeout_graceful_shutdown=30)
+    else:
+        run(serve(args.host, args.port))
+
 if __name__ == "__main__":
-    run(main())
+    main()
 
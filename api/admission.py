@@ -0,0 +1,127 @@
+"""Admission control in front of the enrollment and drop endpoints.
+
+During registration rush the same few full sections get hammered, mostly by
+retries from students who are already enrolled or waitlisted. Each retry
+costs a connection and, for sections that still have room, the write lock.
+Token buckets per student and per section cap how fast those requests reach
+SQLite. Anything over the cap is answered 429 with a Retry-After header and
+never touches the database.
+
+While the section limit is on, a section the section cache already knows is
+full, with its waitlist full too, is rejected as full before any bucket is
+touched. This way clients can tell "try again shortly" from "there is
+nothing to get". A request the section rejects gets its student token back,
+so a hot section does not use up the student's budget for other sections.
+Drops are limited per student only, because they free seats and should never
+queue behind enrollments.
+"""
+
+from collections import OrderedDict
+from math import ceil
+from threading import Lock
+from time import monotonic
+from typing import Hashable
+
+from fastapi import HTTPException, status
+
+from .cache import section_cache, section_key
+from .database_query import eligibility_for
+from .metrics import admission_shed
+from .models import RegistrationStatus
+from .settings import (
+    ADMISSION_MAX_KEYS,
+    ADMISSION_SECTION_BURST,
+    ADMISSION_SECTION_RATE,
+    ADMISSION_STUDENT_BURST,
+    ADMISSION_STUDENT_RATE,
+)
+
+
+class TokenBuckets:
+    """One token bucket per key, refilled at ``rate`` tokens per second up to ``burst``.
+
+    Keys are kept in LRU order and the least recently used is forgotten past
+    ``max_keys``; a forgotten key starts again with a full bucket. A ``rate``
+    of 0 admits everything.
+    """
+
+    def __init__(self, rate: float, burst: float, max_keys: int) -> None:
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.max_keys = max_keys
+        self._buckets: OrderedDict = OrderedDict()
+        self._lock = Lock()
+
+    def take(self, key: Hashable) -> float:
+        """Take a token for ``key``; returns 0 when admitted, else the seconds until a token is available."""
+        if self.rate <= 0:
+            return 0.0
+        now = monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            wait = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / self.rate
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+            return wait
+
+    def refund(self, key: Hashable) -> None:
+        """Give back the token a request took for ``key`` when a later check rejected it."""
+        if self.rate <= 0:
+            return
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                self._buckets[key] = (min(self.burst, bucket[0] + 1), bucket[1])
+
+
+def shed(reason: str, detail: str, wait: float) -> HTTPException:
+    admission_shed.inc(reason)
+    return HTTPException(status_code = status.HTTP_429_TOO_MANY_REQUESTS, detail = detail,
+                         headers = {'Retry-After': str(max(1, ceil(wait)))})
+
+
+def section_known_full(course_code: str, section_number: int) -> bool:
+    state = section_cache.get(section_key(course_code, section_number))
+    return state is not None and eligibility_for(state) == RegistrationStatus.NOT_ELIGIBLE
+
+
+class AdmissionControl:
+    """Per-student and per-section rate limits for the write endpoints."""
+
+    def __init__(self, student_rate: float = ADMISSION_STUDENT_RATE, student_burst: float = ADMISSION_STUDENT_BURST,
+                 section_rate: float = ADMISSION_SECTION_RATE, section_burst: float = ADMISSION_SECTION_BURST,
+                 max_keys: int = ADMISSION_MAX_KEYS) -> None:
+        self.students = TokenBuckets(student_rate, student_burst, max_keys)
+        self.sections = TokenBuckets(section_rate, section_burst, max_keys)
+
+    def admit_enrollment(self, student_id: int, course_code: str, section_number: int) -> None:
+        """Raise 429 for a section known to be full, or unless both the student and the section are under their rate."""
+        if self.sections.rate > 0 and section_known_full(course_code, section_number):
+            raise shed('section_full', f'Section {section_number} of {course_code} is full', 1)
+        wait = self.students.take(student_id)
+        if wait:
+            raise shed('student_rate', f'Too many requests for student {student_id}', wait)
+        wait = self.sections.take(section_key(course_code, section_number))
+        if wait:
+            self.students.refund(student_id)
+            raise shed('section_rate', f'Too many enrollment requests for section {section_number} of {course_code}', wait)
+
+    def admit_drop(self, student_id: int) -> None:
+        """Raise 429 unless the student is under their rate."""
+        wait = self.students.take(student_id)
+        if wait:
+            raise shed('student_rate', f'Too many requests for student {student_id}', wait)
+
+
+admission = AdmissionControl()
+
+
+def get_admission() -> AdmissionControl:
+    """FastAPI dependency returning the process' admission control."""
+    return admission
@@ -0,0 +1,203 @@
+"""Seeded synthetic databases for benchmarks and query-plan checks.
+
+The same arguments and seed always produce the same rows. The shape follows a
+real registration period rather than the handful of rows in classes.sql:
+
+- department sizes follow a Zipf-like curve (``department_skew``);
+- section demand is log-normal (``popularity_skew``), so a few sections are
+  heavily over-subscribed with full waitlists while most fill partly;
+- registrations arrive in EnrollmentDate order, each section fills seats
+  then its waitlist, and students beyond that give up and show as dropped;
+- a ``drop_rate`` share of registrations are dropped as churn.
+
+Everything is written with ``executemany`` in one transaction on top of the
+migrated schema, and the Section counters agree with RegistrationList.
+
+    python -m api.bench.dataset /tmp/campus.db
+    python -m api.bench.dataset /tmp/small.db --users 5000 --sections 500 --registrations 50000 --check-plans
+"""
+
+import argparse
+from datetime import datetime, timedelta
+import os
+import random
+import sqlite3
+from time import perf_counter
+from typing import Dict, List, NamedTuple, Tuple
+
+from ..database_query import WAITLIST_ALLOWED
+from ..migrations import apply_migrations, check_query_plans
+
+DEPARTMENTS = ['Computer Science', 'Mathematics', 'Physics', 'Chemistry', 'Biology', 'English', 'History',
+               'Art', 'Music', 'Economics', 'Psychology', 'Sociology', 'Philosophy', 'Engineering',
+               'Business', 'Nursing', 'Kinesiology', 'Geology', 'Communications', 'Theatre']
+FIRST_NAMES = ['Emily', 'John', 'Jane', 'Robert', 'Mark', 'Catherine', 'Matthew', 'Jennifer', 'Kevin', 'Linda',
+               'Michael', 'Susan', 'David', 'Richard', 'Sarah', 'William', 'Karen', 'Thomas', 'Jason', 'Paul']
+LAST_NAMES = ['Davis', 'Smith', 'Doe', 'Johnson', 'Wilson', 'Harris', 'Williams', 'Brown', 'Miller', 'Clark',
+              'White', 'Anderson', 'Lee', 'Martinez', 'Taylor', 'Turner', 'Robinson', 'Lopez', 'Young', 'King']
+SECTION_CAPACITIES = [20, 30, 40, 60, 120]
+SECTION_CAPACITY_WEIGHTS = [2, 4, 3, 2, 1]
+SECTIONS_PER_CLASS = 3
+INSTRUCTORS_PER_USER = 1 / 50
+REGISTRATION_START = datetime(2023, 8, 1)
+REGISTRATION_WINDOW = timedelta(days=30)
+
+
+class Dataset(NamedTuple):
+    registrar: int
+    instructors: Tuple[int, int]
+    students: Tuple[int, int]
+    departments: List[str]
+    sections: List[Tuple[str, int, int]]
+
+
+def department_weights(rng: random.Random, skew: float) -> Dict[str, float]:
+    """Zipf-like share of the catalog for each department, in a seeded random rank order."""
+    ranked = rng.sample(DEPARTMENTS, len(DEPARTMENTS))
+    return {department: 1 / (rank ** skew) for rank, department in enumerate(ranked, start=1)}
+
+
+def section_demand(rng: random.Random, capacities: List[int], registrations: int, skew: float, limit: int) -> List[int]:
+    """Registrations per section: capacity times a log-normal popularity, scaled to ``registrations`` and capped at ``limit``."""
+    weights = [capacity * rng.lognormvariate(0, skew) for capacity in capacities]
+    total = sum(weights)
+    return [min(limit, round(registrations * weight / total)) for weight in weights]
+
+
+def create_dataset(path: str, users: int = 50000, sections: int = 5000, registrations: int = 250000,
+                   seed: int = 449, drop_rate: float = 0.1, popularity_skew: float = 1.0,
+                   department_skew: float = 0.8) -> Dataset:
+    """Create a database at ``path`` with the given number of users, sections and registrations."""
+    if os.path.exists(path):
+        raise FileExistsError(f'{path} already exists')
+    rng = random.Random(seed)
+    instructor_count = max(1, int(users * INSTRUCTORS_PER_USER))
+    instructors = (2, instructor_count + 1)
+    students = (instructor_count + 2, max(users, instructor_count + 2))
+    student_ids = range(students[0], students[1] + 1)
+
+    db_connection = sqlite3.connect(path, isolation_level=None)
+    apply_migrations(db_connection)
+    db_connection.execute("PRAGMA journal_mode = WAL")
+    # Only this connection writes while the file is built; a crash just means rebuilding it
+    db_connection.execute("PRAGMA synchronous = OFF")
+    db_connection.execute("PRAGMA cache_size = -262144")
+    db_connection.execute("BEGIN")
+    db_connection.executemany("INSERT INTO Users (CWID, Name, LastName, Role) VALUES (?, ?, ?, ?)",
+                              ((cwid, rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES),
+                                'registrar' if cwid == 1 else 'instructor' if cwid <= instructors[1] else 'student')
+                               for cwid in range(1, students[1] + 1)))
+
+    weights = department_weights(rng, department_skew)
+    class_count = max(1, sections // SECTIONS_PER_CLASS)
+    class_departments = rng.choices(list(weights), list(weights.values()), k=class_count)
+    classes = [(f'{department[:4].upper()}-{number}', number, department)
+               for number, department in enumerate(class_departments, start=100)]
+    db_connection.executemany("INSERT INTO Class (CourseCode, Name, Department) VALUES (?, ?, ?)",
+                              ((course_code, f'{department} {number}', department) for course_code, number, department in classes))
+
+    section_rows = []
+    for index in range(sections):
+        course_code = classes[index % class_count][0]
+        capacity = rng.choices(SECTION_CAPACITIES, SECTION_CAPACITY_WEIGHTS)[0]
+        section_rows.append((course_code, index // class_count + 1, rng.randint(*instructors), capacity))
+
+    window = int(REGISTRATION_WINDOW.total_seconds())
+    counters = []
+    registration_rows = []
+    for (course_code, section_number, _, max_enrollment), demand in zip(
+            section_rows, section_demand(rng, [row[3] for row in section_rows], registrations, popularity_skew, len(student_ids))):
+        dates = sorted(REGISTRATION_START + timedelta(seconds=rng.randrange(window)) for _ in range(demand))
+        enrolled = waitlisted = 0
+        for student_id, enrollment_date in zip(rng.sample(student_ids, demand), dates):
+            if rng.random() < drop_rate:
+                registration_status = 'dropped'
+            elif enrolled < max_enrollment:
+                registration_status = 'enrolled'
+                enrolled += 1
+            elif waitlisted <= WAITLIST_ALLOWED:
+                registration_status = 'waitlisted'
+                waitlisted += 1
+            else:
+                registration_status = 'dropped'
+            registration_rows.append((student_id, course_code, section_number, enrollment_date.isoformat(' '), registration_status))
+        counters.append((enrolled, waitlisted))
+
+    db_connection.executemany("""INSERT INTO Section (SectionNumber, CourseCode, InstructorID, MaxEnrollment, CurrentEnrollment, Waitlist, SectionStatus)
+                              VALUES (?, ?, ?, ?, ?, ?, 'open')""",
+                              ((section_number, course_code, instructor_id, max_enrollment, enrolled, waitlisted)
+                               for (course_code, section_number, instructor_id, max_enrollment), (enrolled, waitlisted)
+                               in zip(section_rows, counters)))
+    db_connection.executemany("""INSERT INTO RegistrationList (StudentID, CourseCode, SectionNumber, EnrollmentDate, Status)
+                              VALUES (?, ?, ?, ?, ?)""", registration_rows)
+    db_connection.execute("COMMIT")
+    db_connection.close()
+    return Dataset(registrar=1, instructors=instructors, students=students,
+                   departments=sorted(set(class_departments)),
+                   sections=[(course_code, section_number, instructor_id)
+                             for course_code, section_number, instructor_id, _ in section_rows])
+
+
+def load_dataset(path: str) -> Dataset:
+    """Describe an existing database the way ``create_dataset`` would."""
+    db_connection = sqlite3.connect(path)
+    ranges = dict((role, (low, high)) for role, low, high in
+                  db_connection.execute("SELECT Role, MIN(CWID), MAX(CWID) FROM Users GROUP BY Role"))
+    departments = [row[0] for row in db_connection.execute("SELECT DISTINCT Department FROM Class ORDER BY Department")]
+    sections = db_connection.execute("SELECT CourseCode, SectionNumber, InstructorID FROM Section ORDER BY CourseCode, SectionNumber").fetchall()
+    db_connection.close()
+    return Dataset(registrar=ranges.get('registrar', (0, 0))[0], instructors=ranges['instructor'],
+                   students=ranges['student'], departments=departments, sections=sections)
+
+
+def describe(path: str) -> List[str]:
+    """One line per shape statistic, for checking that a dataset looks the way it should."""
+    db_connection = sqlite3.connect(path)
+    statuses = dict(db_connection.execute("SELECT Status, COUNT(*) FROM RegistrationList GROUP BY Status"))
+    sections, full, waitlisted_sections, longest = db_connection.execute(
+        "SELECT COUNT(*), SUM(CurrentEnrollment >= MaxEnrollment), SUM(Waitlist > 0), MAX(Waitlist) FROM Section").fetchone()
+    largest = db_connection.execute("""SELECT Department, COUNT(*) FROM Class GROUP BY Department
+                                    ORDER BY COUNT(*) DESC LIMIT 3""").fetchall()
+    db_connection.close()
+    return [f'registrations: {statuses}',
+            f'sections: {sections}, full: {full}, with a waitlist: {waitlisted_sections}, longest waitlist: {longest}',
+            f'largest departments: {", ".join(f"{department} ({count} classes)" for department, count in largest)}']
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Generate a seeded synthetic classes database.')
+    parser.add_argument('database', help='SQLite file to create')
+    parser.add_argument('--users', type=int, default=50000)
+    parser.add_argument('--sections', type=int, default=5000)
+    parser.add_argument('--registrations', type=int, default=250000)
+    parser.add_argument('--seed', type=int, default=449)
+    parser.add_argument('--drop-rate', type=float, default=0.1, help='share of registrations dropped as churn')
+    parser.add_argument('--popularity-skew', type=float, default=1.0, help='log-normal sigma of section demand')
+    parser.add_argument('--department-skew', type=float, default=0.8, help='Zipf exponent of department sizes')
+    parser.add_argument('--force', action='store_true', help='replace the database if it exists')
+    parser.add_argument('--check-plans', action='store_true', help='run the query-plan check against the new data')
+    args = parser.parse_args()
+
+    if args.force:
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(args.database + suffix):
+                os.remove(args.database + suffix)
+    start = perf_counter()
+    create_dataset(args.database, args.users, args.sections, args.registrations, args.seed,
+                   args.drop_rate, args.popularity_skew, args.department_skew)
+    print(f'Created {args.database} in {perf_counter() - start:.1f}s')
+    for line in describe(args.database):
+        print(line)
+    if args.check_plans:
+        db_connection = sqlite3.connect(args.database)
+        failures = check_query_plans(db_connection)
+        db_connection.close()
+        for name, scans in failures.items():
+            print(f'{name}: {"; ".join(scans)}')
+        if failures:
+            raise SystemExit(1)
+        print('Every registered statement uses an index')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""Throughput of drops with automatic waitlist promotion.
+
+Fills a set of sections and their waitlists, then drops every enrolled student,
+either one transaction per drop (drop_student) or in batches (drop_students).
+Each drop promotes the head of the waitlist in the same transaction. The run
+fails if any section ends with counters that disagree with RegistrationList.
+
+    python -m api.bench.drop_promotion --sections 50 --capacity 30 --batch-size 100
+"""
+
+import argparse
+import os
+import sqlite3
+import tempfile
+from time import perf_counter
+from typing import List
+
+from loguru import logger
+
+from ..database_query import WAITLIST_ALLOWED, drop_student, drop_students, enroll_student
+from ..models import DropStudentRequest, EnrollmentRequest
+from .enrollment_stress import COURSE_CODE, INSTRUCTOR_ID, create_database, verify
+
+
+def fill_sections(db_connection: sqlite3.Connection, sections: int, capacity: int) -> None:
+    """Enroll students in order until every section and its waitlist are full."""
+    per_section = capacity + WAITLIST_ALLOWED + 1
+    for student_id in range(2, sections * per_section + 2):
+        section_number = (student_id - 2) // per_section + 1
+        enroll_student(db_connection, EnrollmentRequest(student_id=student_id, course_code=COURSE_CODE,
+                                                        section_number=section_number))
+
+
+def enrolled_drops(db_connection: sqlite3.Connection) -> List[DropStudentRequest]:
+    rows = db_connection.execute("""SELECT StudentID, SectionNumber FROM RegistrationList
+                                 WHERE CourseCode = ? AND Status = 'enrolled' ORDER BY RecordID""", (COURSE_CODE,))
+    return [DropStudentRequest(instructor_id=INSTRUCTOR_ID, student_id=student_id, course_code=COURSE_CODE,
+                               section_number=section_number)
+            for student_id, section_number in rows]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Measure drops per second with waitlist promotion.')
+    parser.add_argument('--sections', type=int, default=50)
+    parser.add_argument('--capacity', type=int, default=30)
+    parser.add_argument('--batch-size', type=int, default=0, help='drops per transaction; 0 runs one drop_student call per drop')
+    args = parser.parse_args()
+    logger.remove()
+
+    with tempfile.TemporaryDirectory() as directory:
+        database_url = os.path.join(directory, 'drops.db')
+        per_section = args.capacity + WAITLIST_ALLOWED + 1
+        create_database(database_url, args.sections * per_section, args.sections, args.capacity)
+        db_connection = sqlite3.connect(database_url, isolation_level=None)
+        db_connection.execute("PRAGMA journal_mode = WAL")
+        db_connection.execute("PRAGMA synchronous = NORMAL")
+        fill_sections(db_connection, args.sections, args.capacity)
+        drops = enrolled_drops(db_connection)
+
+        start = perf_counter()
+        if args.batch_size:
+            for index in range(0, len(drops), args.batch_size):
+                drop_students(db_connection, drops[index:index + args.batch_size])
+        else:
+            for drop_request in drops:
+                drop_student(db_connection, drop_request)
+        elapsed = perf_counter() - start
+
+        promoted = db_connection.execute("""SELECT COUNT(*) FROM RegistrationList
+                                         WHERE CourseCode = ? AND Status = 'enrolled'""", (COURSE_CODE,)).fetchone()[0]
+        db_connection.close()
+        mode = f'batches of {args.batch_size}' if args.batch_size else 'one transaction per drop'
+        print(f'{len(drops)} drops in {elapsed:.2f}s ({len(drops) / elapsed:.0f}/s, {mode}), {promoted} promoted')
+        problems = verify(database_url)
+        for problem in problems:
+            print(problem)
+        if problems:
+            raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
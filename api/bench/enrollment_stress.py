@@ -0,0 +1,126 @@
+"""Concurrency stress check for the atomic enrollment transaction.
+
+Many processes, each with several threads and its own connections, enroll
+distinct students into the same few small sections at once. Afterwards the
+check fails if any section holds more enrolled students than MaxEnrollment, more
+waitlisted students than the waitlist allows, or counters that disagree with
+RegistrationList.
+
+    python -m api.bench.enrollment_stress --students 2000 --sections 3 --processes 4 --threads 8
+"""
+
+import argparse
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from collections import Counter
+import os
+import sqlite3
+import tempfile
+from time import perf_counter
+from typing import List, Tuple
+
+from fastapi import HTTPException
+from loguru import logger
+
+from ..database import ConnectionPool
+from ..database_query import WAITLIST_ALLOWED, DBException, enroll_student
+from ..migrations import apply_migrations
+from ..models import EnrollmentRequest
+
+COURSE_CODE = 'STRESS-101'
+INSTRUCTOR_ID = 1
+
+
+def create_database(path: str, students: int, sections: int, capacity: int) -> None:
+    db_connection = sqlite3.connect(path, isolation_level=None)
+    apply_migrations(db_connection)
+    db_connection.execute("PRAGMA journal_mode = WAL")
+    db_connection.execute("BEGIN")
+    db_connection.execute("INSERT INTO Users (CWID, Name, LastName, Role) VALUES (?, 'Stress', 'Instructor', 'instructor')", (INSTRUCTOR_ID,))
+    db_connection.executemany("INSERT INTO Users (CWID, Name, LastName, Role) VALUES (?, 'Student', ?, 'student')",
+                              ((student_id, str(student_id)) for student_id in range(2, students + 2)))
+    db_connection.execute("INSERT INTO Class (CourseCode, Name, Department) VALUES (?, 'Stress Test', 'Testing')", (COURSE_CODE,))
+    db_connection.executemany("""INSERT INTO Section (SectionNumber, CourseCode, InstructorID, CurrentEnrollment, MaxEnrollment, Waitlist, SectionStatus)
+                              VALUES (?, ?, ?, 0, ?, 0, 'open')""",
+                              ((section_number, COURSE_CODE, INSTRUCTOR_ID, capacity) for section_number in range(1, sections + 1)))
+    db_connection.execute("COMMIT")
+    db_connection.close()
+
+
+def enroll_batch(database_url: str, requests: List[Tuple[int, int]], threads: int) -> Counter:
+    """Run one process' share of the enrollments on its own thread pool and connections."""
+    logger.remove()
+    pool = ConnectionPool(database_url, size=threads, timeout=60)
+
+    def enroll(request: Tuple[int, int]) -> str:
+        student_id, section_number = request
+        with pool.connection() as db_connection:
+            try:
+                response = enroll_student(db_connection, EnrollmentRequest(student_id=student_id, course_code=COURSE_CODE,
+                                                                           section_number=section_number))
+                return response.enrollment_status
+            except (DBException, HTTPException):
+                return 'error'
+
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        outcomes = Counter(executor.map(enroll, requests))
+    pool.close()
+    return outcomes
+
+
+def verify(database_url: str) -> List[str]:
+    """Return every invariant violation found in the stress sections."""
+    db_connection = sqlite3.connect(database_url)
+    problems = []
+    sections = db_connection.execute("""SELECT SectionNumber, CurrentEnrollment, MaxEnrollment, Waitlist FROM Section
+                                     WHERE CourseCode = ?""", (COURSE_CODE,)).fetchall()
+    for section_number, current_enrollment, max_enrollment, waitlist in sections:
+        counts = dict(db_connection.execute("""SELECT Status, COUNT(*) FROM RegistrationList
+                                            WHERE CourseCode = ? AND SectionNumber = ? GROUP BY Status""",
+                                            (COURSE_CODE, section_number)).fetchall())
+        enrolled = counts.get('enrolled', 0)
+        waitlisted = counts.get('waitlisted', 0)
+        if enrolled > max_enrollment:
+            problems.append(f'section {section_number}: {enrolled} enrolled, max {max_enrollment}')
+        if enrolled != current_enrollment:
+            problems.append(f'section {section_number}: CurrentEnrollment {current_enrollment}, {enrolled} rows')
+        if waitlisted > WAITLIST_ALLOWED + 1:
+            problems.append(f'section {section_number}: {waitlisted} waitlisted')
+        if waitlisted != waitlist:
+            problems.append(f'section {section_number}: Waitlist {waitlist}, {waitlisted} rows')
+    db_connection.close()
+    return problems
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Hammer a few sections with concurrent enrollments.')
+    parser.add_argument('--students', type=int, default=2000)
+    parser.add_argument('--sections', type=int, default=3)
+    parser.add_argument('--capacity', type=int, default=30)
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--threads', type=int, default=8)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        database_url = os.path.join(directory, 'stress.db')
+        create_database(database_url, args.students, args.sections, args.capacity)
+        requests = [(student_id, (student_id % args.sections) + 1) for student_id in range(2, args.students + 2)]
+        shares = [requests[index::args.processes] for index in range(args.processes)]
+
+        start = perf_counter()
+        outcomes = Counter()
+        with ProcessPoolExecutor(max_workers=args.processes) as executor:
+            for result in executor.map(enroll_batch, [database_url] * args.processes, shares, [args.threads] * args.processes):
+                outcomes.update(result)
+        elapsed = perf_counter() - start
+
+        print(f'{len(requests)} enrollments in {elapsed:.2f}s ({len(requests) / elapsed:.0f}/s): {dict(outcomes)}')
+        problems = verify(database_url)
+        for problem in problems:
+            print(problem)
+        if problems:
+            raise SystemExit(1)
+        print(f'No section oversubscribed ({args.sections} sections, capacity {args.capacity})')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+"""Writes per second with and without the group-commit write queue.
+
+Simulates registration open: every student enrolls in one of a few hot
+sections at once, and a share of them drop again right after. The same
+workload runs once with one transaction per request (the default endpoints)
+and once through ``WriteQueue`` per ``--batch-sizes`` entry. Each run reports
+writes per second, latency percentiles and the outcomes. The run fails if
+any section ends oversubscribed or with counters that disagree with
+RegistrationList.
+
+    python -m api.bench.group_commit --students 5000 --concurrency 256 --batch-sizes 16,64
+"""
+
+import argparse
+import asyncio
+from collections import Counter
+import os
+import random
+import tempfile
+from time import perf_counter
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+from loguru import logger
+
+from ..cache import catalog_cache, role_cache, section_cache
+from ..database import AsyncDatabase, ConnectionPool, DatabaseBusy
+from ..database_query import DBException, enroll_student, update_student_registration_status
+from ..models import EnrollmentRequest, Registration
+from ..write_queue import WriteQueue
+from .enrollment_stress import COURSE_CODE, create_database, verify
+from .load import percentile
+
+
+async def run_workload(db: AsyncDatabase, queue: Optional[WriteQueue], students: int, sections: int,
+                       concurrency: int, drop_share: float, seed: int) -> Tuple[Dict[str, float], Counter]:
+    rng = random.Random(seed)
+    plans = [(student_id, student_id % sections + 1, rng.random() < drop_share) for student_id in range(2, students + 2)]
+    latencies: List[float] = []
+    outcomes: Counter = Counter()
+    slots = asyncio.Semaphore(concurrency)
+
+    async def write(operation) -> None:
+        start = perf_counter()
+        try:
+            outcome = await operation
+            outcomes[outcome.enrollment_status if hasattr(outcome, 'enrollment_status') else f'drop {outcome}'] += 1
+        except (DBException, DatabaseBusy, HTTPException) as err:
+            outcomes[f'error {type(err).__name__}'] += 1
+        latencies.append(perf_counter() - start)
+
+    async def student(student_id: int, section_number: int, drops: bool) -> None:
+        async with slots:
+            enrollment = EnrollmentRequest(student_id=student_id, course_code=COURSE_CODE, section_number=section_number)
+            await write(queue.enroll(enrollment) if queue else db.run(enroll_student, enrollment))
+            if drops:
+                registration = Registration(student_id=student_id, course_code=COURSE_CODE, section_number=section_number,
+                                            enrollment_status='enrolled')
+                await write(queue.drop_course(registration) if queue
+                            else db.run(update_student_registration_status, registration))
+
+    if queue:
+        queue.start()
+    start = perf_counter()
+    await asyncio.gather(*(student(*plan) for plan in plans))
+    elapsed = perf_counter() - start
+    if queue:
+        await queue.stop()
+    latencies.sort()
+    return {'writes': len(latencies), 'writes_per_second': len(latencies) / elapsed,
+            'p50_ms': percentile(latencies, 50) * 1000, 'p99_ms': percentile(latencies, 99) * 1000}, outcomes
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Compare per-request transactions with group-committed writes.')
+    parser.add_argument('--students', type=int, default=5000)
+    parser.add_argument('--sections', type=int, default=10)
+    parser.add_argument('--capacity', type=int, default=300)
+    parser.add_argument('--concurrency', type=int, default=256, help='requests in flight')
+    parser.add_argument('--drop-share', type=float, default=0.2, help='share of students who drop right after enrolling')
+    parser.add_argument('--batch-sizes', default='16,64', help='comma-separated WRITE_QUEUE_MAX_BATCH values to run')
+    parser.add_argument('--max-wait', type=float, default=0.002, help='seconds the writer waits for a batch to fill')
+    parser.add_argument('--pool-size', type=int, default=8)
+    parser.add_argument('--seed', type=int, default=449)
+    args = parser.parse_args()
+    logger.remove()
+
+    modes = [('per-request', None)] + [(f'queue, batch {size}', int(size)) for size in args.batch_sizes.split(',')]
+    print(f'{"mode":<22}{"writes":>8}{"writes/s":>10}{"p50 ms":>10}{"p99 ms":>10}  outcomes')
+    failed = False
+    for name, batch_size in modes:
+        with tempfile.TemporaryDirectory() as directory:
+            database_url = os.path.join(directory, 'group_commit.db')
+            create_database(database_url, args.students, args.sections, args.capacity)
+            for cache in (section_cache, catalog_cache, role_cache):
+                cache.clear()
+            db = AsyncDatabase(ConnectionPool(database_url, size=args.pool_size, timeout=60), max_workers=args.pool_size)
+            queue = WriteQueue(db, max_batch=batch_size, max_wait=args.max_wait) if batch_size else None
+            try:
+                stats, outcomes = asyncio.run(run_workload(db, queue, args.students, args.sections, args.concurrency,
+                                                           args.drop_share, args.seed))
+            finally:
+                db.close()
+            print(f'{name:<22}{stats["writes"]:>8}{stats["writes_per_second"]:>10.0f}{stats["p50_ms"]:>10.2f}'
+                  f'{stats["p99_ms"]:>10.2f}  {dict(outcomes)}')
+            for problem in verify(database_url):
+                print(f'  {problem}')
+                failed = True
+    if failed:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
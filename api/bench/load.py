@@ -0,0 +1,293 @@
+"""Mixed-workload load test of the registration API, driven in-process.
+
+Requests go straight into the FastAPI app through its ASGI interface, with no
+sockets or HTTP client, so the numbers measure the app and SQLite. The app's
+database dependency is pointed at a synthetic campus database created by
+``api.bench.dataset`` (created on the first run, then reused).
+
+Each operation is named by its ``operation_id``, and ``--mix`` sets their
+relative weights. The run reports throughput and latency percentiles per
+operation. ``--output`` saves them as JSON, and ``--compare`` prints the
+change against a saved run.
+
+    python -m api.bench.load --database /tmp/campus.db --duration 30 --output results/before.json
+    python -m api.bench.load --database /tmp/campus.db --duration 30 --compare results/before.json
+"""
+
+import argparse
+import asyncio
+from collections import Counter, deque
+from datetime import datetime
+import json
+import os
+import random
+import sqlite3
+import subprocess
+from time import perf_counter
+from typing import Any, Deque, Dict, List, Optional, Tuple
+from urllib.parse import urlencode
+
+from loguru import logger
+
+from ..database import AsyncDatabase, ConnectionPool, get_database
+from ..migrations import apply_migrations
+from ..read_replica import REPLICA_MODES, ReadReplica, get_read_database, refresh_snapshots
+from ..settings import DB_POOL_SIZE, DB_POOL_TIMEOUT, READ_SNAPSHOT_INTERVAL, WRITE_QUEUE
+from ..write_queue import WriteQueue, get_write_queue
+from .dataset import Dataset, create_dataset, load_dataset
+
+DEFAULT_MIX = {
+    'available_classes': 30,
+    'course_enrollment': 20,
+    'update_registration_status': 10,
+    'waitlist_position': 20,
+    'list_enrollment': 20,
+}
+PERCENTILES = (50, 90, 99)
+
+Request = Tuple[str, str, str, Optional[dict]]
+
+
+async def call(app, method: str, path: str, query: str = '', body: Optional[dict] = None) -> Tuple[int, bytes]:
+    """Send one request through the app's ASGI interface and return the status and body."""
+    payload = json.dumps(body).encode() if body is not None else b''
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': method, 'scheme': 'http',
+        'path': path, 'raw_path': path.encode(), 'query_string': query.encode(), 'root_path': '',
+        'headers': [(b'host', b'bench'), (b'content-type', b'application/json'),
+                    (b'content-length', str(len(payload)).encode())],
+        'client': ('127.0.0.1', 0), 'server': ('bench', 80),
+    }
+    sent = False
+    response_complete = asyncio.Event()
+    response: Dict[str, Any] = {'status': 0, 'body': []}
+
+    async def receive() -> dict:
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {'type': 'http.request', 'body': payload, 'more_body': False}
+        await response_complete.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(message: dict) -> None:
+        if message['type'] == 'http.response.start':
+            response['status'] = message['status']
+        elif message['type'] == 'http.response.body':
+            response['body'].append(message.get('body', b''))
+            if not message.get('more_body', False):
+                response_complete.set()
+
+    await app(scope, receive, send)
+    return response['status'], b''.join(response['body'])
+
+
+class Workload:
+    """Builds random requests against a dataset and tracks registrations the run can drop."""
+
+    def __init__(self, dataset: Dataset, mix: Dict[str, int], seed: int) -> None:
+        self.dataset = dataset
+        self.rng = random.Random(seed)
+        self.operations = list(mix)
+        self.weights = list(mix.values())
+        self.droppable: Deque[dict] = deque(maxlen=10000)
+
+    def student(self) -> int:
+        return self.rng.randint(*self.dataset.students)
+
+    def section(self) -> Tuple[str, int, int]:
+        return self.rng.choice(self.dataset.sections)
+
+    def next_request(self) -> Tuple[str, Request]:
+        operation = self.rng.choices(self.operations, self.weights)[0]
+        if operation == 'available_classes':
+            query = urlencode({'department_name': self.rng.choice(self.dataset.departments)})
+            return operation, ('GET', '/classes', query, None)
+        if operation == 'course_enrollment':
+            course_code, section_number, _ = self.section()
+            body = {'student_id': self.student(), 'course_code': course_code, 'section_number': section_number}
+            return operation, ('POST', '/enrollment', '', body)
+        if operation == 'update_registration_status':
+            if self.droppable:
+                body = self.droppable.popleft()
+            else:
+                course_code, section_number, _ = self.section()
+                body = {'student_id': self.student(), 'course_code': course_code, 'section_number': section_number}
+            return operation, ('PUT', '/dropcourse', '', body)
+        if operation == 'waitlist_position':
+            return operation, ('GET', '/waitlist_position', '', {'student_id': self.student()})
+        if operation == 'list_enrollment':
+            course_code, section_number, instructor_id = self.section()
+            query = urlencode({'instructor_id': instructor_id, 'limit': 50})
+            return operation, ('GET', '/classEnrollment', query, None)
+        raise ValueError(f'Unknown operation {operation}')
+
+    def record(self, operation: str, request: Request, status_code: int, body: bytes) -> None:
+        if operation == 'course_enrollment' and status_code == 200 and b'"enrolled"' in body:
+            self.droppable.append(request[3])
+
+
+def percentile(latencies: List[float], percent: float) -> float:
+    """Nearest-rank percentile of sorted latencies."""
+    if not latencies:
+        return 0.0
+    rank = max(1, round(percent / 100 * len(latencies)))
+    return latencies[min(rank, len(latencies)) - 1]
+
+
+def summarize(latencies: Dict[str, List[float]], statuses: Dict[str, Counter], elapsed: float) -> Dict[str, dict]:
+    summary = {}
+    for operation in sorted(latencies):
+        values = sorted(latencies[operation])
+        summary[operation] = {
+            'requests': len(values),
+            'throughput': len(values) / elapsed,
+            **{f'p{percent}_ms': percentile(values, percent) * 1000 for percent in PERCENTILES},
+            'max_ms': values[-1] * 1000,
+            'statuses': {str(code): count for code, count in sorted(statuses[operation].items())},
+        }
+    all_values = sorted(value for values in latencies.values() for value in values)
+    summary['total'] = {
+        'requests': len(all_values),
+        'throughput': len(all_values) / elapsed,
+        **{f'p{percent}_ms': percentile(all_values, percent) * 1000 for percent in PERCENTILES},
+        'max_ms': all_values[-1] * 1000 if all_values else 0.0,
+    }
+    return summary
+
+
+async def run_load(app, workload: Workload, concurrency: int, duration: float,
+                   requests: Optional[int]) -> Tuple[Dict[str, dict], float]:
+    latencies: Dict[str, List[float]] = {operation: [] for operation in workload.operations}
+    statuses: Dict[str, Counter] = {operation: Counter() for operation in workload.operations}
+    issued = 0
+    start = perf_counter()
+    deadline = start + duration
+
+    async def client() -> None:
+        nonlocal issued
+        while perf_counter() < deadline and (requests is None or issued < requests):
+            issued += 1
+            operation, request = workload.next_request()
+            sent_at = perf_counter()
+            status_code, body = await call(app, *request)
+            latencies[operation].append(perf_counter() - sent_at)
+            statuses[operation][status_code] += 1
+            workload.record(operation, request, status_code, body)
+
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = perf_counter() - start
+    return summarize(latencies, statuses, elapsed), elapsed
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_summary(summary: Dict[str, dict], baseline: Optional[Dict[str, dict]] = None) -> None:
+    header = f'{"operation":<28}{"requests":>10}{"req/s":>10}' + ''.join(f'{f"p{percent} ms":>10}' for percent in PERCENTILES) + f'{"max ms":>10}'
+    print(header)
+    for operation, stats in summary.items():
+        print(f'{operation:<28}{stats["requests"]:>10}{stats["throughput"]:>10.0f}'
+              + ''.join(f'{stats[f"p{percent}_ms"]:>10.2f}' for percent in PERCENTILES) + f'{stats["max_ms"]:>10.2f}')
+        previous = (baseline or {}).get(operation)
+        if previous:
+            changes = [f'{key} {(stats[key] - previous[key]) / previous[key] * 100:+.0f}%'
+                       for key in ('throughput', 'p50_ms', 'p99_ms') if previous[key]]
+            print(f'{"":<28}vs baseline: {", ".join(changes)}')
+
+
+def parse_mix(value: str) -> Dict[str, int]:
+    mix = {}
+    for item in value.split(','):
+        operation, _, weight = item.partition('=')
+        if operation not in DEFAULT_MIX:
+            raise argparse.ArgumentTypeError(f'unknown operation {operation}, expected one of {", ".join(DEFAULT_MIX)}')
+        mix[operation] = int(weight or 1)
+    return mix
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Drive a mixed workload through the API and report latency percentiles.')
+    parser.add_argument('--database', default='/tmp/campus.db', help='benchmark database, created if missing')
+    parser.add_argument('--users', type=int, default=50000)
+    parser.add_argument('--sections', type=int, default=5000)
+    parser.add_argument('--registrations', type=int, default=250000)
+    parser.add_argument('--seed', type=int, default=449)
+    parser.add_argument('--mix', type=parse_mix, default=DEFAULT_MIX,
+                        help='operation=weight list, e.g. available_classes=5,course_enrollment=1')
+    parser.add_argument('--concurrency', type=int, default=32, help='requests in flight')
+    parser.add_argument('--duration', type=float, default=30, help='seconds to run')
+    parser.add_argument('--requests', type=int, help='stop after this many requests')
+    parser.add_argument('--pool-size', type=int, default=DB_POOL_SIZE)
+    parser.add_argument('--read-replica', choices=REPLICA_MODES, default='off',
+                        help='where the read-only endpoints read (READ_REPLICA)')
+    parser.add_argument('--output', help='save the results as JSON')
+    parser.add_argument('--compare', help='JSON results of an earlier run')
+    parser.add_argument('--log', action='store_true', help='keep the API request logging on')
+    args = parser.parse_args()
+
+    if not args.log:
+        logger.remove()
+    if os.path.exists(args.database):
+        # A database created by an older checkout is brought up to the current schema
+        db_connection = sqlite3.connect(args.database, isolation_level=None)
+        apply_migrations(db_connection)
+        db_connection.close()
+        dataset = load_dataset(args.database)
+    else:
+        seed_start = perf_counter()
+        dataset = create_dataset(args.database, args.users, args.sections, args.registrations, args.seed)
+        print(f'Created {args.database} in {perf_counter() - seed_start:.1f}s')
+
+    from ..__main__ import app
+    database = AsyncDatabase(ConnectionPool(args.database, size=args.pool_size, timeout=DB_POOL_TIMEOUT),
+                             max_workers=args.pool_size)
+    replica = ReadReplica(database, args.database, args.read_replica, size=args.pool_size)
+    replica.start()
+    # With WRITE_QUEUE=1 writes go through a queue; the app's own is bound to api/share/classes.db
+    queue = WriteQueue(database)
+    app.dependency_overrides[get_database] = lambda: database
+    app.dependency_overrides[get_read_database] = lambda: replica if replica.started else database
+    app.dependency_overrides[get_write_queue] = lambda: queue
+
+    async def run_with_replica() -> Tuple[Dict[str, dict], float]:
+        refresh = asyncio.create_task(refresh_snapshots(replica, READ_SNAPSHOT_INTERVAL)) if args.read_replica == 'snapshot' else None
+        if WRITE_QUEUE:
+            queue.start()
+        try:
+            return await run_load(app, Workload(dataset, args.mix, args.seed), args.concurrency, args.duration,
+                                  args.requests)
+        finally:
+            if refresh is not None:
+                refresh.cancel()
+            await queue.stop()
+
+    try:
+        summary, elapsed = asyncio.run(run_with_replica())
+    finally:
+        replica.close()
+        database.close()
+        app.dependency_overrides.clear()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)['operations']
+    print(f'{summary["total"]["requests"]} requests in {elapsed:.1f}s, concurrency {args.concurrency}')
+    print_summary(summary, baseline)
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+        with open(args.output, 'w') as output_file:
+            json.dump({'started': datetime.now().isoformat(timespec='seconds'), 'commit': git_commit(),
+                       'config': {key: value for key, value in vars(args).items() if key not in ('output', 'compare')},
+                       'operations': summary}, output_file, indent=2)
+        print(f'Saved results to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
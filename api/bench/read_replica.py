@@ -0,0 +1,153 @@
+"""Serve reads from every READ_REPLICA mode and check them against the primary.
+
+For each mode, a ``ReadReplica`` is started on a fresh synthetic database and
+the read-only endpoints (``GET /classes`` and the three instructor rosters)
+are sent through the app with its read dependency pointed at the replica. The
+run fails unless:
+
+- every read answers 200 with the same body as the main pool;
+- after a write to the main database, ``off`` and ``ro`` serve it at once,
+  while ``snapshot`` keeps serving the copy until it is refreshed and serves
+  the write after the refresh;
+- a snapshot older than ``READ_SNAPSHOT_MAX_AGE`` sends reads to the main
+  pool, which serves the write without a refresh.
+
+    python -m api.bench.read_replica
+    python -m api.bench.read_replica --modes ro,snapshot --sections 500
+"""
+
+import argparse
+import asyncio
+import os
+import sqlite3
+import tempfile
+from typing import List, Tuple
+from urllib.parse import urlencode
+
+from loguru import logger
+
+from ..cache import catalog_cache, role_cache, section_cache
+from ..database import AsyncDatabase, ConnectionPool, get_database
+from ..metrics import replica_reads
+from ..read_replica import REPLICA_MODES, ReadReplica, get_read_database
+from .dataset import create_dataset
+from .load import call
+
+Read = Tuple[str, str]
+Answer = Tuple[int, bytes]
+
+
+def pick_reads(database_url: str) -> Tuple[List[Read], Tuple[str, int]]:
+    """Reads of an instructor with enrolled, waitlisted and dropped students, and a section in the catalog read."""
+    db_connection = sqlite3.connect(database_url)
+    instructor_id, course_code, section_number, department = db_connection.execute("""
+        SELECT Section.InstructorID, Section.CourseCode, Section.SectionNumber, Class.Department
+        FROM Section
+        JOIN Class ON Class.CourseCode = Section.CourseCode
+        JOIN RegistrationList ON RegistrationList.CourseCode = Section.CourseCode
+            AND RegistrationList.SectionNumber = Section.SectionNumber
+        GROUP BY Section.InstructorID
+        HAVING COUNT(DISTINCT RegistrationList.Status) = 3
+        LIMIT 1
+    """).fetchone()
+    db_connection.close()
+    roster = urlencode({'instructor_id': instructor_id, 'limit': 50})
+    reads = [('/classes', urlencode({'department_name': department})),
+             ('/classEnrollment', roster), ('/classWaitlist', roster), ('/classDropped', roster)]
+    return reads, (course_code, section_number)
+
+
+async def read_all(app, reads: List[Read]) -> List[Answer]:
+    # Caches would answer /classes without reaching the replica
+    for cache in (section_cache, catalog_cache, role_cache):
+        cache.clear()
+    return [await call(app, 'GET', path, query) for path, query in reads]
+
+
+def compare(mode: str, step: str, reads: List[Read], answers: List[Answer], expected: List[Answer]) -> List[str]:
+    problems = []
+    for (path, _), (status_code, body), expected_answer in zip(reads, answers, expected):
+        if status_code != 200:
+            problems.append(f'{mode} {step}: GET {path} answered {status_code}: {body[:200]!r}')
+        elif (status_code, body) != expected_answer:
+            problems.append(f'{mode} {step}: GET {path} differs from the main pool')
+    return problems
+
+
+def write_to(database_url: str, section: Tuple[str, int]) -> None:
+    """Change the section's capacity from outside the app, as another process would."""
+    writer = sqlite3.connect(database_url, isolation_level=None)
+    writer.execute("UPDATE Section SET MaxEnrollment = MaxEnrollment + 1 WHERE CourseCode = ? AND SectionNumber = ?", section)
+    writer.close()
+
+
+def check_mode(app, database: AsyncDatabase, database_url: str, mode: str, reads: List[Read],
+               section: Tuple[str, int]) -> List[str]:
+    """Serve ``reads`` from a replica in ``mode`` before and after writes to ``section``; return what went wrong."""
+    replica = ReadReplica(database, database_url, mode, size=2)
+    replica.start()
+
+    def read_from(db: AsyncDatabase) -> List[Answer]:
+        app.dependency_overrides[get_read_database] = lambda: db
+        return asyncio.run(read_all(app, reads))
+
+    serving = replica if replica.started else database
+    try:
+        expected = read_from(database)
+        problems = compare(mode, 'before the write', reads, read_from(serving), expected)
+        write_to(database_url, section)
+        written = read_from(database)
+        if written[0] == expected[0]:
+            problems.append(f'{mode}: the write did not change GET /classes on the main pool')
+        if mode != 'snapshot':
+            return problems + compare(mode, 'after the write', reads, read_from(serving), written)
+        problems += compare(mode, 'before the refresh', reads, read_from(serving), expected)
+        replica.refresh()
+        problems += compare(mode, 'after the refresh', reads, read_from(serving), written)
+        # Past max_age the copy is skipped, so a second write shows without a refresh
+        write_to(database_url, section)
+        written = read_from(database)
+        replica.max_age = 0
+        primary_reads = replica_reads.value('primary')
+        problems += compare(mode, 'past max_age', reads, read_from(serving), written)
+        if replica_reads.value('primary') == primary_reads:
+            problems.append(f'{mode} past max_age: no read went to the main pool')
+        return problems
+    finally:
+        replica.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Check that every read replica mode serves the read endpoints.')
+    parser.add_argument('--modes', default=','.join(REPLICA_MODES), help=f'comma-separated, from {", ".join(REPLICA_MODES)}')
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--sections', type=int, default=200)
+    parser.add_argument('--registrations', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=449)
+    args = parser.parse_args()
+    logger.remove()
+
+    from ..__main__ import app
+    failed = False
+    with tempfile.TemporaryDirectory() as directory:
+        database_url = os.path.join(directory, 'read_replica.db')
+        create_dataset(database_url, args.users, args.sections, args.registrations, args.seed)
+        reads, section = pick_reads(database_url)
+        database = AsyncDatabase(ConnectionPool(database_url, size=2, timeout=5), max_workers=2)
+        app.dependency_overrides[get_database] = lambda: database
+        try:
+            for mode in args.modes.split(','):
+                problems = check_mode(app, database, database_url, mode, reads, section)
+                print(f'{mode:<10}{"ok" if not problems else "FAILED"}')
+                for problem in problems:
+                    print(f'  {problem}')
+                    failed = True
+        finally:
+            database.close()
+            app.dependency_overrides.clear()
+    if failed:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
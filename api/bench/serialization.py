@@ -0,0 +1,108 @@
+"""Response serialization cost of large rosters, with and without FAST_RESPONSES.
+
+Builds one instructor's roster of ``--rows`` enrolled students, then requests
+GET /classEnrollment pages of each ``--sizes`` entry through the app's ASGI
+interface, alternating the default path (pydantic models validated against
+response_model) and the fast path (plain rows encoded directly). Both paths
+must return the same body; the run fails if they differ.
+
+    python -m api.bench.serialization --rows 50000 --sizes 100,1000,10000,50000
+"""
+
+import argparse
+import asyncio
+import os
+import sqlite3
+import tempfile
+from statistics import median
+from time import perf_counter
+from typing import List, Tuple
+
+from loguru import logger
+
+from .. import __main__ as main_module
+from ..database import AsyncDatabase, ConnectionPool, get_database
+from ..read_replica import get_read_database
+from ..responses import orjson
+from .enrollment_stress import COURSE_CODE, INSTRUCTOR_ID, create_database
+from .load import call
+
+SECTION_CAPACITY = 500
+WAITLIST_SECTION = 1
+
+
+def fill_roster(path: str, rows: int) -> None:
+    """Enroll ``rows`` students across sections of SECTION_CAPACITY and waitlist a few in section 1."""
+    sections = -(-rows // SECTION_CAPACITY)
+    create_database(path, rows + 16, sections, SECTION_CAPACITY)
+    db_connection = sqlite3.connect(path, isolation_level=None)
+    db_connection.execute("BEGIN")
+    db_connection.executemany("""INSERT INTO RegistrationList (StudentID, CourseCode, SectionNumber, EnrollmentDate, Status)
+                              VALUES (?, ?, ?, datetime('2023-08-01', ?), ?)""",
+                              [(student_id, COURSE_CODE, (student_id - 2) // SECTION_CAPACITY + 1, f'+{student_id} seconds', 'enrolled')
+                               for student_id in range(2, rows + 2)]
+                              + [(student_id, COURSE_CODE, WAITLIST_SECTION, f'+{student_id} seconds', 'waitlisted')
+                                 for student_id in range(rows + 2, rows + 18)])
+    db_connection.execute("UPDATE Section SET CurrentEnrollment = MaxEnrollment")
+    db_connection.execute("UPDATE Section SET Waitlist = 16 WHERE SectionNumber = ?", (WAITLIST_SECTION,))
+    db_connection.execute("COMMIT")
+    db_connection.close()
+
+
+async def time_requests(app, fast: bool, method: str, path: str, query: str, body, repeat: int) -> Tuple[List[float], bytes]:
+    main_module.FAST_RESPONSES = fast
+    timings = []
+    response = b''
+    for _ in range(repeat):
+        start = perf_counter()
+        status_code, response = await call(app, method, path, query, body)
+        timings.append(perf_counter() - start)
+        if status_code != 200:
+            raise SystemExit(f'{path}?{query} answered {status_code}: {response[:200]!r}')
+    return timings, response
+
+
+async def compare(app, sizes: List[int], repeat: int) -> bool:
+    identical = True
+    requests = [(f'list_enrollment limit={size}', 'GET', '/classEnrollment', f'instructor_id={INSTRUCTOR_ID}&limit={size}', None)
+                for size in sizes]
+    requests.append(('view_waitlist', 'GET', '/view_waitlist', '',
+                     {'course_code': COURSE_CODE, 'section_number': WAITLIST_SECTION}))
+    print(f'{"request":<32}{"default ms":>12}{"fast ms":>12}{"speedup":>10}')
+    for name, method, path, query, body in requests:
+        default, default_body = await time_requests(app, False, method, path, query, body, repeat)
+        fast, fast_body = await time_requests(app, True, method, path, query, body, repeat)
+        print(f'{name:<32}{median(default) * 1000:>12.2f}{median(fast) * 1000:>12.2f}{median(default) / median(fast):>9.1f}x')
+        if default_body != fast_body:
+            print(f'{name}: the fast body differs from the default body')
+            identical = False
+    return identical
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Compare default and fast serialization of large roster responses.')
+    parser.add_argument('--rows', type=int, default=50000, help='students on the roster')
+    parser.add_argument('--sizes', default='100,1000,10000,50000', help='comma-separated page sizes to request')
+    parser.add_argument('--repeat', type=int, default=5, help='requests per size and path; the median is reported')
+    args = parser.parse_args()
+    logger.remove()
+    sizes = [int(size) for size in args.sizes.split(',')]
+
+    with tempfile.TemporaryDirectory() as directory:
+        database_url = os.path.join(directory, 'roster.db')
+        fill_roster(database_url, args.rows)
+        database = AsyncDatabase(ConnectionPool(database_url, size=1, timeout=5), max_workers=1)
+        main_module.app.dependency_overrides[get_database] = lambda: database
+        main_module.app.dependency_overrides[get_read_database] = lambda: database
+        try:
+            print(f'Encoder for the fast path: {"orjson" if orjson is not None else "json (orjson is not installed)"}')
+            identical = asyncio.run(compare(main_module.app, sizes, args.repeat))
+        finally:
+            database.close()
+            main_module.app.dependency_overrides.clear()
+    if not identical:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
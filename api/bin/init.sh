@@ -1,3 +1,3 @@
 #!/bin/sh
 
-sqlite3 ./api/share/classes.db < ./api/share/classes.sql
+python3 -m api.migrations --seed
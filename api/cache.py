@@ -0,0 +1,255 @@
+"""Process-local caches kept coherent by the write paths in database_query.py."""
+
+from collections import OrderedDict
+import hashlib
+from threading import Lock
+from time import monotonic
+from typing import Dict, FrozenSet, Hashable, NamedTuple, Optional, Tuple
+
+from .settings import CATALOG_CACHE_SIZE, ROLE_CACHE_SIZE, ROLE_CACHE_TTL, SECTION_CACHE_SIZE
+
+
+class SectionState(NamedTuple):
+    current_enrollment: int
+    max_enrollment: int
+    waitlist: int
+
+
+class SectionCache:
+    """Bounded LRU of section counters keyed by ``(course_code, section_number)``.
+
+    Every invalidation bumps a version counter. Readers take ``token()`` before
+    they query SQLite and hand it back to ``put``; if anything was invalidated in
+    between the value may already be stale, so ``put`` does not store it. Storing
+    a value leaves the version alone, so concurrent readers do not void each
+    other's tokens. Writers call ``put`` with a token taken while they still
+    held the write lock, or ``invalidate`` after committing. Only enrollments
+    put, and they only raise counters, so when two puts race the one that
+    lands last can at worst hold counters that are too low. Anything that
+    lowers counters invalidates.
+    """
+
+    def __init__(self, max_size: int) -> None:
+        self.max_size = max_size
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = Lock()
+        self._version = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def token(self) -> int:
+        return self._version
+
+    def get(self, key: Hashable) -> Optional[SectionState]:
+        with self._lock:
+            state = self._entries.get(key)
+            if state is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return state
+
+    def put(self, key: Hashable, state: SectionState, token: int) -> None:
+        with self._lock:
+            if token != self._version:
+                return
+            self._entries[key] = state
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key: Hashable) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+            self._version += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._version += 1
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {'size': len(self._entries),
+                    'max_size': self.max_size,
+                    'hits': self.hits,
+                    'misses': self.misses,
+                    'evictions': self.evictions,
+                    'hit_rate': self.hits / lookups if lookups else 0.0}
+
+
+class CatalogEntry(NamedTuple):
+    body: bytes
+    etag: str
+    course_codes: FrozenSet[str]
+
+
+class CatalogCache:
+    """Bounded LRU of serialized ``GET /classes`` responses keyed by department.
+
+    Uses the same version-token protocol as ``SectionCache``. Writers only know
+    the course they touched, so ``invalidate_course`` drops every department
+    whose cached catalog lists that course.
+    """
+
+    def __init__(self, max_size: int) -> None:
+        self.max_size = max_size
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = Lock()
+        self._version = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def token(self) -> int:
+        return self._version
+
+    def get(self, department: str) -> Optional[CatalogEntry]:
+        with self._lock:
+            entry = self._entries.get(department)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(department)
+            self.hits += 1
+            return entry
+
+    def put(self, department: str, entry: CatalogEntry, token: int) -> None:
+        with self._lock:
+            if token != self._version:
+                return
+            self._entries[department] = entry
+            self._entries.move_to_end(department)
+            if len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate_department(self, department: str) -> None:
+        with self._lock:
+            if self._entries.pop(department, None) is not None:
+                self.invalidations += 1
+            self._version += 1
+
+    def invalidate_course(self, course_code: str) -> None:
+        with self._lock:
+            stale = [department for department, entry in self._entries.items() if course_code in entry.course_codes]
+            for department in stale:
+                del self._entries[department]
+            self.invalidations += len(stale)
+            self._version += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+            self._version += 1
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {'size': len(self._entries),
+                    'max_size': self.max_size,
+                    'hits': self.hits,
+                    'misses': self.misses,
+                    'invalidations': self.invalidations,
+                    'hit_rate': self.hits / lookups if lookups else 0.0}
+
+
+class RoleCache:
+    """Bounded LRU of user roles keyed by CWID, each entry trusted for ``ttl`` seconds.
+
+    Roles are only changed outside the API, so the TTL bounds how long such a
+    change goes unnoticed; code that changes a role calls ``invalidate``. Uses
+    the same version-token protocol as ``SectionCache``.
+    """
+
+    def __init__(self, max_size: int, ttl: float) -> None:
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = Lock()
+        self._version = 0
+        self.hits = 0
+        self.misses = 0
+        self.expirations = 0
+
+    def token(self) -> int:
+        return self._version
+
+    def get(self, cwid: int) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(cwid)
+            if entry is not None and entry[1] <= monotonic():
+                del self._entries[cwid]
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(cwid)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, cwid: int, role: str, token: int) -> None:
+        with self._lock:
+            if token != self._version:
+                return
+            self._entries[cwid] = (role, monotonic() + self.ttl)
+            self._entries.move_to_end(cwid)
+            if len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, cwid: int) -> None:
+        with self._lock:
+            self._entries.pop(cwid, None)
+            self._version += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._version += 1
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {'size': len(self._entries),
+                    'max_size': self.max_size,
+                    'ttl': self.ttl,
+                    'hits': self.hits,
+                    'misses': self.misses,
+                    'expirations': self.expirations,
+                    'hit_rate': self.hits / lookups if lookups else 0.0}
+
+
+def section_key(course_code: str, section_number: int) -> Tuple[str, int]:
+    return (course_code, section_number)
+
+
+def catalog_entry(body: bytes, course_codes: FrozenSet[str]) -> CatalogEntry:
+    etag = '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+    return CatalogEntry(body=body, etag=etag, course_codes=course_codes)
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """True when an ``If-None-Match`` header names ``etag`` (weak or strong) or ``*``."""
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        if candidate == '*' or candidate.removeprefix('W/') == etag:
+            return True
+    return False
+
+
+section_cache = SectionCache(max_size=SECTION_CACHE_SIZE)
+catalog_cache = CatalogCache(max_size=CATALOG_CACHE_SIZE)
+role_cache = RoleCache(max_size=ROLE_CACHE_SIZE, ttl=ROLE_CACHE_TTL)
+
+
+def invalidate_section(course_code: str, section_number: int) -> None:
+    """Forget everything cached about a section after its row changed."""
+    section_cache.invalidate(section_key(course_code, section_number))
+    catalog_cache.invalidate_course(course_code)
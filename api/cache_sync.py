@@ -0,0 +1,82 @@
+"""Keeps the in-memory caches coherent with writes made by other processes.
+
+Every worker process (and tools such as ``api.catalog_import`` or
+``api.reconcile``) writes to the same classes.db, but each keeps its own
+section, catalog and role caches. Triggers from migration 0004 record every
+changed Section, Class and Users row in ChangeLog. Each process polls the log
+every ``CACHE_SYNC_INTERVAL`` seconds and invalidates what changed since its
+last poll, so a cache is at most one interval behind another process' commit.
+Rows its own pooled connections wrote carry its ``WRITER_TOKEN`` and are
+skipped: the write already updated this process' caches.
+
+A poll first reads ``PRAGMA data_version``, which only changes when another
+connection commits, so an idle database costs one pragma per interval.
+"""
+
+import asyncio
+import sqlite3
+from typing import Optional
+
+from loguru import logger
+
+from .cache import catalog_cache, invalidate_section, role_cache, section_cache
+from .database import DEFAULT_PRAGMAS, WRITER_TOKEN
+from .settings import CACHE_SYNC_INTERVAL
+from .statements import SELECT_CHANGE_LOG_HEAD, SELECT_CHANGES_SINCE, execute
+
+
+class CacheSync:
+    """Applies ChangeLog entries newer than the last one seen to this process' caches."""
+
+    def __init__(self, database_url: str) -> None:
+        # Its own connection: data_version is per connection and must not see this process' other writes as its own
+        self.connection = sqlite3.connect(database_url, check_same_thread=False, isolation_level=None)
+        for pragma in DEFAULT_PRAGMAS:
+            self.connection.execute(pragma)
+        self.data_version: Optional[int] = None
+        self.last_seq = execute(self.connection, SELECT_CHANGE_LOG_HEAD).fetchone()[0] or 0
+
+    def poll(self) -> int:
+        """Invalidate every cache entry other processes changed since the last poll and return how many changes were read."""
+        data_version = self.connection.execute("PRAGMA data_version").fetchone()[0]
+        if data_version == self.data_version:
+            return 0
+        self.data_version = data_version
+        changes = execute(self.connection, SELECT_CHANGES_SINCE, (self.last_seq,)).fetchall()
+        if not changes:
+            return 0
+        if changes[0][0] != self.last_seq + 1:
+            # Entries were pruned before this process read them
+            logger.warning(f'Change log moved past {self.last_seq}, clearing caches')
+            section_cache.clear()
+            catalog_cache.clear()
+            role_cache.clear()
+        else:
+            for _, kind, course_code, section_number, cwid, writer in changes:
+                if writer == WRITER_TOKEN:
+                    continue
+                if kind == 'section':
+                    invalidate_section(course_code, section_number)
+                elif kind == 'class':
+                    # A class can move between departments, so every catalog may list it
+                    catalog_cache.clear()
+                elif kind == 'user':
+                    role_cache.invalidate(cwid)
+                    # Instructor names appear in the catalogs
+                    catalog_cache.clear()
+        self.last_seq = changes[-1][0]
+        return len(changes)
+
+    def close(self) -> None:
+        self.connection.close()
+
+
+async def sync_caches(cache_sync: CacheSync, interval: float = CACHE_SYNC_INTERVAL) -> None:
+    """Poll the change log every ``interval`` seconds until cancelled."""
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await loop.run_in_executor(None, cache_sync.poll)
+        except sqlite3.Error as err:
+            logger.error(f'Cache sync failed: {err}')
@@ -0,0 +1,315 @@
+"""Bulk import of a semester catalog into Class and Section.
+
+A catalog has one section per row with the columns course_code, class_name,
+department, section_number, instructor_id and max_enrollment, as CSV with a
+header line or as JSON lines. Rows are validated, then upserted
+``CATALOG_IMPORT_CHUNK_SIZE`` at a time with ``executemany`` in one transaction
+per chunk. Existing classes and sections are updated in place and keep their
+enrollment counters. Rows whose instructor_id is not an instructor are
+rejected before the chunk is written; connections do not enforce foreign keys,
+and such a section would never show up in the catalog. If a chunk fails, or
+would lower a section's capacity below its enrollment, it is replayed row by
+row under savepoints so only the bad rows are rejected.
+
+    python -m api.catalog_import fall.csv
+    python -m api.catalog_import fall.jsonl --chunk-size 5000
+"""
+
+import argparse
+import codecs
+from collections import deque
+import csv
+from itertools import chain
+import json
+import os
+import sqlite3
+from sqlite3 import Connection
+from time import perf_counter
+from typing import Iterable, Iterator, List, Set, Tuple, Union
+
+from loguru import logger
+from pydantic import ValidationError
+
+from .cache import catalog_cache, section_cache
+from .database import ConnectionPool, retry_on_busy
+from .database_query import DBException
+from .models import CatalogImportFailure, CatalogImportResponse, CatalogImportRow
+from .settings import CATALOG_IMPORT_CHUNK_SIZE, DATABASE_URL, DB_POOL_TIMEOUT
+from .statements import SELECT_INSTRUCTORS_AMONG, UPSERT_CLASS, UPSERT_SECTION, execute, execute_many
+
+CATALOG_FORMATS = ('csv', 'jsonl')
+# Errors that reject one row instead of the whole import
+ROW_ERRORS = (sqlite3.Error, OverflowError)
+
+ParsedRow = Tuple[int, Union[CatalogImportRow, str]]
+
+
+def validation_message(err: ValidationError) -> str:
+    messages = []
+    for error in err.errors():
+        field = '.'.join(str(part) for part in error['loc'])
+        messages.append(f"{field}: {error['msg']}" if field else error['msg'])
+    return '; '.join(messages)
+
+
+class LineDecoder:
+    """Decodes UTF-8 byte chunks as they arrive into whole lines, with their line endings."""
+
+    def __init__(self) -> None:
+        self._decoder = codecs.getincrementaldecoder('utf-8')()
+        self._pending = ''
+
+    def feed(self, data: bytes) -> List[str]:
+        lines = (self._pending + self._decoder.decode(data)).splitlines(keepends=True)
+        # The last line may continue in the next chunk, and so may a '\r' before its '\n'
+        self._pending = lines.pop() if lines and not lines[-1].endswith('\n') else ''
+        return lines
+
+    def close(self) -> List[str]:
+        pending = self._pending + self._decoder.decode(b'', final=True)
+        self._pending = ''
+        return [pending] if pending else []
+
+
+class FedLines:
+    """Iterator over lines fed in so far; it stops when they run out and resumes once more are fed."""
+
+    def __init__(self) -> None:
+        self._lines: deque = deque()
+
+    def extend(self, lines: Iterable[str]) -> None:
+        self._lines.extend(lines)
+
+    def __iter__(self) -> 'FedLines':
+        return self
+
+    def __next__(self) -> str:
+        if not self._lines:
+            raise StopIteration
+        return self._lines.popleft()
+
+
+class CatalogParser:
+    """Parses catalog lines fed in batches, keeping the CSV header and line numbers across batches."""
+
+    def __init__(self, catalog_format: str) -> None:
+        if catalog_format not in CATALOG_FORMATS:
+            raise ValueError(f'Unknown catalog format {catalog_format}, expected one of {", ".join(CATALOG_FORMATS)}')
+        self.catalog_format = catalog_format
+        self._lines = FedLines()
+        self._reader = csv.DictReader(self._lines)
+        self._line_number = 0
+        # Lines of a CSV record whose quoted field is still open
+        self._record: List[str] = []
+
+    def feed(self, lines: Iterable[str]) -> Iterator[ParsedRow]:
+        """Yield ``(line number, row)`` for each complete row, or the error message for a row that is invalid."""
+        for line in lines:
+            if self.catalog_format == 'jsonl':
+                self._line_number += 1
+                if line.strip():
+                    yield self._validate(self._line_number, line)
+                continue
+            self._record.append(line)
+            # The reader only gets whole records: it ends a record at the end of its input
+            if sum(part.count('"') for part in self._record) % 2:
+                continue
+            yield from self._read_records()
+
+    def close(self) -> Iterator[ParsedRow]:
+        """Yield the rows of a last CSV record left open by an unbalanced quote."""
+        yield from self._read_records()
+
+    def _read_records(self) -> Iterator[ParsedRow]:
+        self._lines.extend(self._record)
+        self._record = []
+        for record in self._reader:
+            yield self._validate(self._reader.line_num, record)
+
+    @staticmethod
+    def _validate(line_number: int, record: Union[str, dict]) -> ParsedRow:
+        try:
+            if isinstance(record, str):
+                return line_number, CatalogImportRow.model_validate_json(record)
+            return line_number, CatalogImportRow.model_validate(record)
+        except ValidationError as err:
+            return line_number, validation_message(err)
+
+
+def parse_catalog(lines: Iterable[str], catalog_format: str) -> Iterator[ParsedRow]:
+    """Yield ``(line number, row)`` for each catalog row, or the error message for a row that is invalid."""
+    parser = CatalogParser(catalog_format)
+    yield from parser.feed(lines)
+    yield from parser.close()
+
+
+def known_instructors(db_connection: Connection, chunk: List[Tuple[int, CatalogImportRow]]) -> Set[int]:
+    instructor_ids = sorted({row.instructor_id for _, row in chunk})
+    return {row[0] for row in execute(db_connection, SELECT_INSTRUCTORS_AMONG, (json.dumps(instructor_ids),))}
+
+
+def class_parameters(chunk: List[Tuple[int, CatalogImportRow]]) -> List[tuple]:
+    # Many sections share a class; the last row for a course wins, as with one upsert per row
+    classes = {row.course_code: (row.course_code, row.class_name, row.department) for _, row in chunk}
+    return list(classes.values())
+
+
+def section_parameters(row: CatalogImportRow) -> tuple:
+    return (row.section_number, row.course_code, row.instructor_id, row.max_enrollment)
+
+
+@retry_on_busy
+def write_chunk(db_connection: Connection, chunk: List[Tuple[int, CatalogImportRow]]) -> bool:
+    """Upsert a whole chunk with executemany in one transaction; False if a row was rejected."""
+    cursor = db_connection.cursor()
+    cursor.execute("BEGIN IMMEDIATE")
+    try:
+        execute_many(cursor, UPSERT_CLASS, class_parameters(chunk))
+        sections = execute_many(cursor, UPSERT_SECTION, [section_parameters(row) for _, row in chunk])
+        if sections.rowcount < len(chunk):
+            # The upsert skipped a section whose new capacity is below its enrollment
+            cursor.execute("ROLLBACK")
+            logger.info('Catalog chunk lowers a section below its enrollment, retrying row by row')
+            return False
+        cursor.execute("COMMIT")
+        return True
+    except ROW_ERRORS as err:
+        cursor.execute("ROLLBACK")
+        logger.info(f'Catalog chunk rejected ({err}), retrying row by row')
+        return False
+    except Exception as err:
+        logger.error(err)
+        cursor.execute("ROLLBACK")
+        logger.info('Rolling back transaction')
+        raise DBException(error_detail = 'Fail to import catalog')
+    finally:
+        cursor.close()
+
+
+@retry_on_busy
+def write_rows(db_connection: Connection, chunk: List[Tuple[int, CatalogImportRow]],
+               failures: List[CatalogImportFailure]) -> int:
+    """Upsert a chunk one row per savepoint, recording the rows that fail. Returns rows written."""
+    written = 0
+    cursor = db_connection.cursor()
+    cursor.execute("BEGIN IMMEDIATE")
+    try:
+        for line_number, row in chunk:
+            cursor.execute("SAVEPOINT catalog_row")
+            try:
+                execute(cursor, UPSERT_CLASS, (row.course_code, row.class_name, row.department))
+                if execute(cursor, UPSERT_SECTION, section_parameters(row)).rowcount == 0:
+                    cursor.execute("ROLLBACK TO catalog_row")
+                    failures.append(CatalogImportFailure(
+                        line = line_number,
+                        error = f'max_enrollment: {row.max_enrollment} is below the current enrollment of the section'))
+                else:
+                    written += 1
+            except ROW_ERRORS as err:
+                cursor.execute("ROLLBACK TO catalog_row")
+                failures.append(CatalogImportFailure(line = line_number, error = str(err)))
+            cursor.execute("RELEASE catalog_row")
+        cursor.execute("COMMIT")
+    except Exception as err:
+        logger.error(err)
+        cursor.execute("ROLLBACK")
+        logger.info('Rolling back transaction')
+        raise DBException(error_detail = 'Fail to import catalog')
+    finally:
+        cursor.close()
+    return written
+
+
+class CatalogImport:
+    """One import: parses lines into chunks, writes each chunk and reports the result.
+
+    Parsing needs no connection, so the endpoint parses on the event loop as the
+    body arrives and only hands complete chunks to ``write`` on a database thread.
+    """
+
+    def __init__(self, catalog_format: str, chunk_size: int = CATALOG_IMPORT_CHUNK_SIZE) -> None:
+        self.parser = CatalogParser(catalog_format)
+        self.chunk_size = chunk_size
+        self.rows = 0
+        self.imported = 0
+        self.failures: List[CatalogImportFailure] = []
+        self.start = perf_counter()
+        self._chunk: List[Tuple[int, CatalogImportRow]] = []
+        logger.info(f'Starting {catalog_format} catalog import')
+
+    def chunks(self, lines: Iterable[str], final: bool = False) -> Iterator[List[Tuple[int, CatalogImportRow]]]:
+        """Parse ``lines`` and yield each chunk that fills; ``final`` also yields the last, partial one."""
+        parsed_rows = self.parser.feed(lines)
+        if final:
+            parsed_rows = chain(parsed_rows, self.parser.close())
+        for line_number, parsed in parsed_rows:
+            self.rows += 1
+            if isinstance(parsed, str):
+                self.failures.append(CatalogImportFailure(line = line_number, error = parsed))
+                continue
+            self._chunk.append((line_number, parsed))
+            if len(self._chunk) >= self.chunk_size:
+                chunk, self._chunk = self._chunk, []
+                yield chunk
+        if final and self._chunk:
+            chunk, self._chunk = self._chunk, []
+            yield chunk
+
+    def write(self, db_connection: Connection, chunk: List[Tuple[int, CatalogImportRow]]) -> None:
+        """Upsert one chunk, rejecting rows whose instructor_id is not an instructor."""
+        instructors = known_instructors(db_connection, chunk)
+        valid = []
+        for line_number, row in chunk:
+            if row.instructor_id in instructors:
+                valid.append((line_number, row))
+            else:
+                self.failures.append(CatalogImportFailure(line = line_number,
+                                                          error = f'instructor_id: {row.instructor_id} is not an instructor'))
+        if not valid:
+            return
+        written = len(valid) if write_chunk(db_connection, valid) else write_rows(db_connection, valid, self.failures)
+        if written:
+            # Imported rows can change any department's catalog and any section's capacity
+            catalog_cache.clear()
+            section_cache.clear()
+        self.imported += written
+
+    def report(self) -> CatalogImportResponse:
+        seconds = perf_counter() - self.start
+        logger.info(f'Imported {self.imported} of {self.rows} catalog rows in {seconds:.2f}s')
+        return CatalogImportResponse(rows = self.rows, imported = self.imported,
+                                     failures = sorted(self.failures, key = lambda failure: failure.line),
+                                     seconds = seconds, rows_per_second = self.imported / seconds if seconds else 0.0)
+
+
+def import_catalog(db_connection: Connection, lines: Iterable[str], catalog_format: str,
+                   chunk_size: int = CATALOG_IMPORT_CHUNK_SIZE) -> CatalogImportResponse:
+    """Stream a catalog into Class and Section and report throughput and rejected rows."""
+    catalog = CatalogImport(catalog_format, chunk_size)
+    for chunk in catalog.chunks(lines, final=True):
+        catalog.write(db_connection, chunk)
+    return catalog.report()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Import a CSV or JSON-lines catalog into Class and Section.')
+    parser.add_argument('catalog', help='catalog file, one section per row')
+    parser.add_argument('--format', choices=CATALOG_FORMATS, help='default: from the file extension')
+    parser.add_argument('--database', default=DATABASE_URL, help='SQLite database file')
+    parser.add_argument('--chunk-size', type=int, default=CATALOG_IMPORT_CHUNK_SIZE, help='rows per transaction')
+    args = parser.parse_args()
+    catalog_format = args.format or ('jsonl' if os.path.splitext(args.catalog)[1] in ('.jsonl', '.ndjson') else 'csv')
+
+    pool = ConnectionPool(args.database, size=1, timeout=DB_POOL_TIMEOUT)
+    with open(args.catalog, newline='') as catalog_file, pool.connection() as db_connection:
+        report = import_catalog(db_connection, catalog_file, catalog_format, args.chunk_size)
+    pool.close()
+    print(f'Imported {report.imported} of {report.rows} rows in {report.seconds:.2f}s ({report.rows_per_second:.0f} rows/s)')
+    for failure in report.failures:
+        print(f'line {failure.line}: {failure.error}')
+    if report.failures:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
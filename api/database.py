@@ -0,0 +1,333 @@
+"""Bounded SQLite connection pool and the async layer endpoints await."""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import wraps
+import os
+from queue import Empty, LifoQueue
+import random
+import sqlite3
+from sqlite3 import Connection
+from threading import Lock
+from time import perf_counter, sleep
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, Type, Union
+from urllib.request import pathname2url
+from uuid import uuid4
+
+from loguru import logger
+
+from .metrics import executor_wait, pool_wait, query_latency, query_rows, transaction_retries
+from .settings import (
+    DATABASE_URL,
+    DB_BUSY_RETRIES,
+    DB_BUSY_RETRY_DELAY,
+    DB_BUSY_TIMEOUT_MS,
+    DB_CACHE_SIZE_KB,
+    DB_CHECKPOINT_INTERVAL,
+    DB_CHECKPOINT_MODE,
+    DB_EXECUTOR_WORKERS,
+    DB_JOURNAL_MODE,
+    DB_MMAP_SIZE,
+    DB_POOL_SIZE,
+    DB_POOL_TIMEOUT,
+    DB_STATEMENT_CACHE_SIZE,
+    DB_SYNCHRONOUS,
+    DB_TEMP_STORE,
+    DB_WAL_AUTOCHECKPOINT,
+)
+from .statements import STATEMENTS, statement_cache
+
+JOURNAL_MODES = ('DELETE', 'TRUNCATE', 'PERSIST', 'MEMORY', 'WAL', 'OFF')
+SYNCHRONOUS_LEVELS = ('OFF', 'NORMAL', 'FULL', 'EXTRA')
+TEMP_STORES = ('DEFAULT', 'FILE', 'MEMORY')
+CHECKPOINT_MODES = ('PASSIVE', 'FULL', 'RESTART', 'TRUNCATE')
+# Marks the ChangeLog rows this process writes, so its cache sync can skip them
+WRITER_TOKEN = uuid4().hex
+
+
+def choice(name: str, value: str, allowed: tuple) -> str:
+    if value.upper() not in allowed:
+        raise ValueError(f'{name} must be one of {", ".join(allowed)}, not {value!r}')
+    return value.upper()
+
+
+def storage_pragmas(journal_mode: str = DB_JOURNAL_MODE, synchronous: str = DB_SYNCHRONOUS,
+                    cache_size_kb: int = DB_CACHE_SIZE_KB, mmap_size: int = DB_MMAP_SIZE,
+                    temp_store: str = DB_TEMP_STORE, wal_autocheckpoint: int = DB_WAL_AUTOCHECKPOINT,
+                    busy_timeout_ms: int = DB_BUSY_TIMEOUT_MS) -> List[str]:
+    """PRAGMAs for a storage profile; the defaults are the profile configured in settings."""
+    return [
+        f"PRAGMA journal_mode = {choice('DB_JOURNAL_MODE', journal_mode, JOURNAL_MODES)}",
+        f"PRAGMA synchronous = {choice('DB_SYNCHRONOUS', synchronous, SYNCHRONOUS_LEVELS)}",
+        # A negative cache_size is in KiB rather than pages
+        f"PRAGMA cache_size = {-int(cache_size_kb)}",
+        f"PRAGMA mmap_size = {int(mmap_size)}",
+        f"PRAGMA temp_store = {choice('DB_TEMP_STORE', temp_store, TEMP_STORES)}",
+        f"PRAGMA wal_autocheckpoint = {int(wal_autocheckpoint)}",
+        f"PRAGMA busy_timeout = {int(busy_timeout_ms)}",
+    ]
+
+
+DEFAULT_PRAGMAS = storage_pragmas()
+# Read-only connections cannot change the journal mode or checkpoint; query_only guards against stray writes
+READ_PRAGMAS = [pragma for pragma in DEFAULT_PRAGMAS
+                if not pragma.startswith(("PRAGMA journal_mode", "PRAGMA wal_autocheckpoint"))] + ["PRAGMA query_only = ON"]
+
+
+def read_only_url(path: str, immutable: bool = False) -> str:
+    """``file:`` URI opening ``path`` read-only; ``immutable`` also skips locking, for files nothing writes."""
+    return f"file:{pathname2url(os.path.abspath(path))}?mode=ro" + ("&immutable=1" if immutable else "")
+
+
+class SnapshotConnection(Connection):
+    """Connection to a point-in-time copy of the database; its reads must not fill the shared caches."""
+
+
+def is_snapshot(db_connection: Union[Connection, sqlite3.Cursor]) -> bool:
+    return isinstance(getattr(db_connection, 'connection', db_connection), SnapshotConnection)
+
+
+class PoolTimeout(Exception):
+    def __init__(self, error_detail: str) -> None:
+        self.error_detail = error_detail
+
+
+class DatabaseBusy(Exception):
+    def __init__(self, error_detail: str) -> None:
+        self.error_detail = error_detail
+
+
+def is_busy(err: sqlite3.OperationalError) -> bool:
+    message = str(err)
+    return 'database is locked' in message or 'database is busy' in message
+
+
+def retry_on_busy(fn: Callable) -> Callable:
+    """Retry a write function whose BEGIN IMMEDIATE failed with SQLITE_BUSY.
+
+    busy_timeout already makes SQLite wait for the write lock; with several
+    worker processes a burst of writers can still outlast it. The write
+    functions take the lock before their ``try``, so a busy error means nothing
+    was written and the whole call can run again. After ``DB_BUSY_RETRIES``
+    retries with doubling, jittered delays, ``DatabaseBusy`` is raised.
+    """
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        delay = DB_BUSY_RETRY_DELAY
+        for attempt in range(DB_BUSY_RETRIES + 1):
+            try:
+                return fn(*args, **kwargs)
+            except sqlite3.OperationalError as err:
+                if not is_busy(err):
+                    raise
+                if attempt == DB_BUSY_RETRIES:
+                    logger.error(f'{fn.__name__} gave up after {attempt} retries: {err}')
+                    raise DatabaseBusy(error_detail='Database is busy, try again later')
+            transaction_retries.inc(fn.__name__)
+            sleep(delay * random.uniform(0.5, 1.5))
+            delay *= 2
+    return wrapper
+
+
+def tag_change_log(db_connection: Connection) -> None:
+    """Record WRITER_TOKEN as the Writer of every ChangeLog row this connection inserts.
+
+    A TEMP trigger only fires for its own connection. Before migration 0005 there
+    is no Writer column and nothing is tagged.
+    """
+    if db_connection.execute("SELECT 1 FROM pragma_table_info('ChangeLog') WHERE name = 'Writer'").fetchone() is None:
+        return
+    db_connection.execute(f"""
+        CREATE TEMP TRIGGER IF NOT EXISTS change_log_writer AFTER INSERT ON main.ChangeLog
+        BEGIN
+            UPDATE ChangeLog SET Writer = '{WRITER_TOKEN}' WHERE Seq = NEW.Seq;
+        END
+    """)
+
+
+class ConnectionPool:
+    """Fixed-size pool of SQLite connections.
+
+    Connections are opened lazily up to ``size`` and handed out one request at a
+    time, so every transaction owns its connection from ``BEGIN`` to ``COMMIT``.
+    They run in autocommit mode (``isolation_level=None``) because the query
+    functions issue their own ``BEGIN``/``COMMIT``. Pools that write tag their
+    ChangeLog rows (``tag_writes``); read-only pools cannot create the trigger.
+    """
+
+    def __init__(self, database_url: str, size: int, timeout: float, pragmas: Optional[List[str]] = None,
+                 statement_cache_size: int = DB_STATEMENT_CACHE_SIZE, uri: bool = False,
+                 factory: Type[Connection] = Connection, tag_writes: bool = True) -> None:
+        self.database_url = database_url
+        self.size = size
+        self.timeout = timeout
+        self.pragmas = DEFAULT_PRAGMAS if pragmas is None else pragmas
+        self.statement_cache_size = statement_cache_size
+        self.uri = uri
+        self.factory = factory
+        self.tag_writes = tag_writes
+        if statement_cache_size < len(STATEMENTS):
+            logger.warning(f'Statement cache holds {statement_cache_size} statements but {len(STATEMENTS)} are registered')
+        self._idle: LifoQueue = LifoQueue(maxsize=size)
+        self._opened = 0
+        self._lock = Lock()
+        self._closed = False
+
+    def _connect(self) -> Connection:
+        connection = sqlite3.connect(self.database_url, check_same_thread=False, isolation_level=None,
+                                     cached_statements=self.statement_cache_size, uri=self.uri, factory=self.factory)
+        for pragma in self.pragmas:
+            connection.execute(pragma)
+        if self.tag_writes:
+            tag_change_log(connection)
+        statement_cache.track(connection, self.statement_cache_size)
+        return connection
+
+    def acquire(self) -> Connection:
+        """Check out a connection, opening a new one while the pool is below its size."""
+        start = perf_counter()
+        try:
+            return self._checkout()
+        finally:
+            pool_wait.observe(perf_counter() - start)
+
+    def _checkout(self) -> Connection:
+        if self._closed:
+            raise PoolTimeout(error_detail='Connection pool is closed')
+        try:
+            return self._idle.get_nowait()
+        except Empty:
+            pass
+        with self._lock:
+            if self._opened < self.size:
+                self._opened += 1
+                try:
+                    return self._connect()
+                except Exception:
+                    self._opened -= 1
+                    raise
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except Empty:
+            logger.error('Timed out waiting for a database connection')
+            raise PoolTimeout(error_detail='Database is busy, try again later')
+
+    def release(self, connection: Connection) -> None:
+        """Return a connection to the pool, rolling back anything left open."""
+        if connection.in_transaction:
+            connection.execute("ROLLBACK")
+        if self._closed:
+            statement_cache.forget(connection)
+            connection.close()
+            return
+        self._idle.put_nowait(connection)
+
+    @contextmanager
+    def connection(self) -> Iterator[Connection]:
+        connection = self.acquire()
+        try:
+            yield connection
+        finally:
+            self.release(connection)
+
+    def close(self) -> None:
+        self._closed = True
+        while True:
+            try:
+                connection = self._idle.get_nowait()
+            except Empty:
+                break
+            statement_cache.forget(connection)
+            connection.close()
+
+
+class AsyncDatabase:
+    """Runs the blocking query functions on a dedicated thread pool.
+
+    ``await database.run(fn, *args)`` checks a connection out of the pool on a
+    worker thread, calls ``fn(connection, *args)`` there and returns its result,
+    so a slow query only occupies one worker instead of the event loop.
+    """
+
+    def __init__(self, pool: Optional[ConnectionPool], max_workers: int) -> None:
+        self.pool = pool
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='db')
+        self._lock = Lock()
+        self._queued = 0
+        self._running = 0
+        self._max_queued = 0
+        self._completed = 0
+
+    def _call(self, fn: Callable, submitted: float, args: tuple, kwargs: dict) -> Any:
+        with self._lock:
+            self._queued -= 1
+            self._running += 1
+        start = perf_counter()
+        executor_wait.observe(start - submitted)
+        name = getattr(fn, '__name__', 'query')
+        try:
+            with self.current_pool().connection() as connection:
+                result = fn(connection, *args, **kwargs)
+            if isinstance(result, list):
+                query_rows.inc(name, len(result))
+            return result
+        finally:
+            query_latency.observe(perf_counter() - start, name)
+            with self._lock:
+                self._running -= 1
+                self._completed += 1
+
+    def current_pool(self) -> ConnectionPool:
+        return self.pool
+
+    async def run(self, fn: Callable, *args, **kwargs) -> Any:
+        with self._lock:
+            self._queued += 1
+            self._max_queued = max(self._max_queued, self._queued)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self._call, fn, perf_counter(), args, kwargs)
+
+    def stats(self) -> Dict[str, int]:
+        """Queue-depth counters: calls waiting for a worker, calls running, and totals."""
+        with self._lock:
+            return {'workers': self.max_workers,
+                    'queued': self._queued,
+                    'running': self._running,
+                    'max_queued': self._max_queued,
+                    'completed': self._completed}
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True)
+        if self.pool is not None:
+            self.pool.close()
+
+
+pool = ConnectionPool(DATABASE_URL, size=DB_POOL_SIZE, timeout=DB_POOL_TIMEOUT)
+database = AsyncDatabase(pool, max_workers=DB_EXECUTOR_WORKERS)
+
+
+def get_database() -> AsyncDatabase:
+    """FastAPI dependency returning the shared async data-access layer."""
+    return database
+
+
+def wal_checkpoint(db_connection: Connection, mode: str = DB_CHECKPOINT_MODE) -> Tuple[int, int, int]:
+    """Checkpoint the WAL; returns (busy, pages in the WAL, pages checkpointed) as reported by SQLite."""
+    row = db_connection.execute(f"PRAGMA wal_checkpoint({choice('DB_CHECKPOINT_MODE', mode, CHECKPOINT_MODES)})").fetchone()
+    return row[0], row[1], row[2]
+
+
+async def checkpoint_in_background(db: AsyncDatabase, interval: float = DB_CHECKPOINT_INTERVAL,
+                                   mode: str = DB_CHECKPOINT_MODE) -> None:
+    """Checkpoint the WAL every ``interval`` seconds, so commits rarely pay for one."""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            busy, wal_pages, checkpointed = await db.run(wal_checkpoint, mode)
+        except (sqlite3.Error, PoolTimeout) as err:
+            logger.error(f'WAL checkpoint failed: {err}')
+            continue
+        if busy or checkpointed < wal_pages:
+            logger.debug(f'WAL checkpoint copied {checkpointed} of {wal_pages} pages')
@@ -1,12 +1,30 @@
-from sqlite3 import Connection
-from typing import List, Union
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import datetime
+import json
+from sqlite3 import Connection, Cursor
+from typing import Dict, List, Set, Union
 
 from fastapi import HTTPException, status
 from loguru import logger
-from typing import Optional
-
+from typing import Optional, Tuple
+
+from .cache import (
+    CatalogEntry,
+    SectionState,
+    catalog_cache,
+    catalog_entry,
+    invalidate_section,
+    role_cache,
+    section_cache,
+    section_key,
+)
+from .database import is_snapshot, retry_on_busy
 from .models import (
     AvailableClass,
+    AvailableClassResponse,
+    BatchEnrollmentRequest,
+    BatchEnrollmentResponse,
+    BatchEnrollmentResult,
     EnrollmentRequest,
     EnrollmentResponse,
     QueryStatus,
@@ -18,18 +36,42 @@ from .models import (
     WaitlistPositionList,
     DropStudentRequest
 )
+from .responses import dumps
+from .settings import FAST_RESPONSES, LOG_ROWS
+from .statements import (
+    CLAIM_SEAT,
+    CLAIM_WAITLIST_SPOT,
+    DECREMENT_CURRENT_ENROLLMENT,
+    DECREMENT_WAITLIST,
+    DELETE_SECTION,
+    INCREMENT_CURRENT_ENROLLMENT,
+    INCREMENT_WAITLIST,
+    INSERT_CLASS,
+    INSERT_REGISTRATION,
+    INSERT_SECTION,
+    LIST_AVAILABLE_CLASSES,
+    PROMOTE_SECTION_COUNTERS,
+    PROMOTE_WAITLIST_HEAD,
+    SELECT_ACTIVE_REGISTRATION,
+    SELECT_CART_STATE,
+    SELECT_CLASS_EXISTS,
+    SELECT_INSTRUCTOR_COURSE_ROSTER,
+    SELECT_INSTRUCTOR_ROSTER,
+    SELECT_INSTRUCTOR_SECTION_NUMBER_ROSTER,
+    SELECT_INSTRUCTOR_SECTION_ROSTER,
+    SELECT_REGISTRATION_STATUS,
+    SELECT_SECTION_CAPACITY,
+    SELECT_SECTION_EXISTS,
+    SELECT_SECTION_INSTRUCTOR,
+    SELECT_SECTION_WAITLIST,
+    SELECT_USER_ROLE,
+    SELECT_WAITLIST_POSITIONS,
+    UPDATE_REGISTRATION_DROPPED,
+    UPDATE_SECTION_CLOSED,
+    UPDATE_SECTION_INSTRUCTOR,
+    execute,
+)
 
-LIST_AVAILABLE_SQL_QUERY = """
-	SELECT available_classes.name as 'course_name', available_classes.coursecode as 'course_code', 
-    available_classes.department, available_classes.currentenrollment as 'current_enrollment', 
-    available_classes.waitlist, available_classes.maxenrollment as "max_enrollment", 
-    available_classes.sectionnumber as "section_number", 
-    ur.name as "instructor_first_name", ur.lastname as "instructor_last_name"  
-    FROM Users ur, (SELECT cl.coursecode, cl.name, cl.department, sc.currentenrollment, 
-    sc.maxenrollment, sc.waitlist, sc.sectionnumber, sc.instructorid FROM "Class" as cl 
-    join section as sc on cl.coursecode = sc.coursecode WHERE cl.Department = '{department_name}') 
-    as available_classes where ur.cwid = available_classes.instructorid
-"""
 WAITLIST_ALLOWED = 15
 class DBException(Exception):
     def __init__(self, error_detail:str) -> None:
@@ -37,6 +79,25 @@ class DBException(Exception):
 
 
     
+def available_class_rows(db_connection: Connection, department_name: str) -> List[dict]:
+    """Available classes for a department as dicts keyed and ordered like AvailableClass."""
+    cursor = db_connection.cursor()
+    rows = execute(cursor, LIST_AVAILABLE_CLASSES, (department_name,))
+    if rows.arraysize == 0:
+        raise HTTPException(status_code= status.HTTP_400_BAD_REQUEST, detail= f'Record not found for given department_name:{department_name}')
+    result = [{"course_code": row[1],
+               "course_name": row[0],
+               "department": row[2],
+               "instructor_first_name": row[7],
+               "instructor_last_name": row[8],
+               "current_enrollment": row[3],
+               "max_enrollment": row[5],
+               "waitlist": row[4],
+               "section_number": row[6]} for row in rows]
+    cursor.close()
+    return result
+
+
 def get_available_classes(db_connection: Connection, department_name: str) -> List[AvailableClass]:
     """Query database to get available classes for a given department name
 
@@ -47,116 +108,259 @@ def get_available_classes(db_connection: Connection, department_name: str) -> Li
     Returns:
         List[AvailableClass]: List of available classes
     """
-    result = []
-    query = LIST_AVAILABLE_SQL_QUERY.format(department_name=department_name)
-    cursor = db_connection.cursor()
-    rows =  cursor.execute(query)
-    if rows.arraysize == 0:
-        raise HTTPException(status_code= status.HTTP_400_BAD_REQUEST, detail= f'Record not found for given department_name:{department_name}')
-    for row in rows:
-        available_class = AvailableClass(course_name=row[0], 
-                                     course_code=row[1],
-                                     department=row[2],
-                                     current_enrollment=row[3],
-                                     waitlist=row[4],
-                                     max_enrollment=row[5],
-                                     section_number=row[6],
-                                     instructor_first_name=row[7],
-                                     instructor_last_name=row[8])
-        result.append(available_class)
-    cursor.close()
-    return result
-    
+    return [AvailableClass(**row) for row in available_class_rows(db_connection, department_name)]
 
-def check_user_role(db_connection: Connection, student_id: int)-> Union[str, None]:
-    logger.info('Checking user role')
-    query = f"""
-            SELECT role FROM Users where CWID = {student_id} 
-            """
-    cursor = db_connection.cursor()
-    rows =  cursor.execute(query)
-    if rows.arraysize == 0:
-        raise HTTPException(status_code= status.HTTP_400_BAD_REQUEST, detail= f'Record not found for given student_id:{student_id}')
-    result = UserRole.NOT_FOUND
-    for row in rows:
-        result = row[0]
-    return result
 
+def load_catalog(db_connection: Connection, department_name: str) -> CatalogEntry:
+    """Build the serialized GET /classes response for a department and cache it.
 
-def count_waitlist_registration(db_connection: Connection, section_id: int)->int:
-    logger.info('Checking waitlist registration')
-    query = f"""SELECT COUNT(*) FROM RegistrationList WHERE ClassID = {section_id} and Status = 'waitlisted'
-    """
-    cursor = db_connection.cursor()
-    rows =  cursor.execute(query)
-    if rows.arraysize == 0:
-        raise HTTPException(status_code= status.HTTP_400_BAD_REQUEST, detail= f'Record not found for given section_id:{section_id}')
-    result = 0
-    for row in rows:
-        result = row[0]
-    return result
+    Args:
+        db_connection (Connection): SQLite Connection
+        department_name (str): Department name
 
-def check_enrollment_eligibility(db_connection: Connection, section_number: int, course_code: str)->str:
-    logger.info('Checking enrollment eligibility')
-    query = f"""SELECT CurrentEnrollment as 'current_enrollment', MaxEnrollment as 'max_enrollment', Waitlist as 'waitlist' FROM "Section" WHERE CourseCode = '{course_code}' and SectionNumber = {section_number}
+    Returns:
+        CatalogEntry: JSON body, ETag and the course codes it lists
     """
-
-    cursor = db_connection.cursor()
-    rows =  cursor.execute(query)
-    if rows.arraysize == 0:
-        raise HTTPException(status_code= status.HTTP_400_BAD_REQUEST, detail= f'Record not found for given section_number:{section_number} and course_code:{course_code}')
-    query_result = {}
-    for row in rows:
-        query_result['current_enrollment'] = row[0]
-        query_result['max_enrollment'] = row[1]
-        query_result['waitlist'] = row[2]
+    token = catalog_cache.token()
+    if FAST_RESPONSES:
+        available_classes = available_class_rows(db_connection, department_name)
+        body = dumps({"available_classes": available_classes})
+        course_codes = frozenset(available_class["course_code"] for available_class in available_classes)
+    else:
+        available_classes = get_available_classes(db_connection, department_name)
+        body = AvailableClassResponse(available_classes = available_classes).model_dump_json().encode()
+        course_codes = frozenset(available_class.course_code for available_class in available_classes)
+    entry = catalog_entry(body, course_codes)
+    # Unknown department names are not cached so they cannot evict real catalogs; a snapshot
+    # may predate invalidations the token cannot see, so its catalogs are not cached either
+    if available_classes and not is_snapshot(db_connection):
+        catalog_cache.put(department_name, entry, token)
+    return entry
     
+
+def resolve_role(db_connection: Union[Connection, Cursor], cwid: int) -> str:
+    """Return the user's role, or UserRole.NOT_FOUND, reading Users only on a role cache miss."""
+    role = role_cache.get(cwid)
+    if role is not None:
+        return role
+    token = role_cache.token()
+    row = execute(db_connection, SELECT_USER_ROLE, (cwid,)).fetchone()
+    if row is None:
+        # Not cached, so a user created later is seen on the next request
+        return UserRole.NOT_FOUND
+    if not is_snapshot(db_connection):
+        role_cache.put(cwid, row[0], token)
+    return row[0]
+
+
+def eligibility_for(state: SectionState) -> str:
     # First check whether there is capacity to enroll in a section
-    if query_result['max_enrollment'] - query_result['current_enrollment'] >= 1:
+    if state.max_enrollment - state.current_enrollment >= 1:
         return RegistrationStatus.ENROLLED
     
-    if query_result['waitlist'] <= WAITLIST_ALLOWED:
+    if state.waitlist <= WAITLIST_ALLOWED:
         return RegistrationStatus.WAITLISTED
     
     return RegistrationStatus.NOT_ELIGIBLE
 
-def check_status_query(db_connection: Connection, enrollment_request: EnrollmentRequest) -> Union[EnrollmentResponse, None]:
-    check_status_query = f""" SELECT Status, EnrollmentDate FROM RegistrationList where StudentID = {enrollment_request.student_id} and SectionNumber = {enrollment_request.section_number} and CourseCode = '{enrollment_request.course_code}'"""
+def enroll_in_transaction(cursor: Cursor, student_id: int, course_code: str, section_number: int,
+                          section_full: bool = False) -> Tuple[EnrollmentResponse, Optional[SectionState]]:
+    """Decide and record one enrollment on a cursor that already holds the write lock.
+
+    The seat (or waitlist spot) is claimed with a conditional UPDATE that only
+    matches while the section has room, so the decision and the write can never
+    disagree. ``section_full`` skips the claims when the section cache already
+    knows there is no room. Returns the response and, when a claim was made, the
+    section's current counters.
+    """
+    row = execute(cursor, SELECT_ACTIVE_REGISTRATION, (student_id, section_number, course_code)).fetchone()
+    if row is not None:
+        if row[0] == RegistrationStatus.ENROLLED:
+            return EnrollmentResponse(enrollment_status="already enrolled", enrollment_date=row[1]), None
+        return EnrollmentResponse(enrollment_status="already waitlisted", enrollment_date=row[1]), None
+    if section_full:
+        return EnrollmentResponse(enrollment_status = 'not eligible'), None
+
+    section_params = (section_number, course_code)
+    enrollment_status = RegistrationStatus.ENROLLED
+    claimed = execute(cursor, CLAIM_SEAT, section_params).fetchone()
+    if claimed is None:
+        enrollment_status = RegistrationStatus.WAITLISTED
+        claimed = execute(cursor, CLAIM_WAITLIST_SPOT, section_params + (WAITLIST_ALLOWED,)).fetchone()
+        if claimed is None:
+            full_state = execute(cursor, SELECT_SECTION_CAPACITY, (course_code, section_number)).fetchone()
+            if full_state is None:
+                raise HTTPException(status_code= status.HTTP_400_BAD_REQUEST, detail= f'Record not found for given section_number:{section_number} and course_code:{course_code}')
+            return EnrollmentResponse(enrollment_status = 'not eligible'), SectionState(*full_state)
+    execute(cursor, INSERT_REGISTRATION, (student_id, course_code, section_number, enrollment_status))
+    return EnrollmentResponse(enrollment_date = datetime.utcnow(), enrollment_status = enrollment_status), SectionState(*claimed)
+
+@retry_on_busy
+def enroll_student(db_connection: Connection, enrollment_request: EnrollmentRequest) -> EnrollmentResponse:
+    """Check the role, then decide enrolled/waitlisted/not eligible and register in one transaction.
+
+    BEGIN IMMEDIATE takes SQLite's write lock up front, so no other enrollment
+    can read the section counters between our check and our write. When the
+    section cache says the section and its waitlist are full, the request only
+    needs reads and runs in a plain BEGIN without taking the write lock.
+    """
+    logger.info('Starting enrollment')
+    key = section_key(enrollment_request.course_code, enrollment_request.section_number)
+    cached_state = section_cache.get(key)
+    section_full = cached_state is not None and eligibility_for(cached_state) == RegistrationStatus.NOT_ELIGIBLE
+    role = resolve_role(db_connection, enrollment_request.student_id)
+    if role != UserRole.STUDENT:
+        raise HTTPException(status_code = status.HTTP_401_UNAUTHORIZED, detail= f'Enrollment not authorized for role:{role}')
     cursor = db_connection.cursor()
+    cursor.execute("BEGIN" if section_full else "BEGIN IMMEDIATE")
+    token = section_cache.token()
     try:
-        rows =  cursor.execute(check_status_query)
-        if rows.arraysize == 0:
-            raise HTTPException(status_code= status.HTTP_400_BAD_REQUEST, detail= f'Record not found')
-        row = rows.fetchone()
-        if row[0] == RegistrationStatus.ENROLLED:
-            return EnrollmentResponse(enrollment_status="already enrolled", enrollment_date=row[1])
+        response, state = enroll_in_transaction(cursor, enrollment_request.student_id, enrollment_request.course_code,
+                                                enrollment_request.section_number, section_full)
+        cursor.execute("COMMIT")
+    except HTTPException:
+        cursor.execute("ROLLBACK")
+        raise
     except Exception as err:
         logger.error(err)
+        cursor.execute("ROLLBACK")
+        logger.info('Rolling back transaction')
+        invalidate_section(enrollment_request.course_code, enrollment_request.section_number)
         raise DBException(error_detail = 'Fail to register')
-    return None
+    finally:
+        cursor.close()
+    if state is not None:
+        section_cache.put(key, state, token)
+    if response.enrollment_status in (RegistrationStatus.ENROLLED, RegistrationStatus.WAITLISTED):
+        catalog_cache.invalidate_course(enrollment_request.course_code)
+    return response
 
+def drop_registration(cursor: Cursor, student_id: int, course_code: str, section_number: int) -> Optional[str]:
+    """Mark an active registration dropped and release its seat or waitlist spot.
 
-def complete_registration(db_connection: Connection, registration: Registration) -> str:
-    logger.info('Starting registration')
-    insert_query = f"""
-    INSERT INTO RegistrationList (StudentID,CourseCode, SectionNumber, Status) VALUES ({registration.student_id},'{registration.course_code}', {registration.section_number}, '{registration.enrollment_status}')
+    Must run inside a write transaction. Returns the status the registration had
+    before the drop, or None when the student had no registration in the section.
     """
-    update_current_enrollment_query = f"""
-    UPDATE "Section" SET CurrentEnrollment = CurrentEnrollment + 1 WHERE SectionNumber = {registration.section_number} and CourseCode = '{registration.course_code}'
-    """
-    update_waitlist_query = f"""
-    UPDATE "Section" SET Waitlist = Waitlist + 1 WHERE SectionNumber = {registration.section_number} and CourseCode = '{registration.course_code}'
+    # A student who dropped and enrolled again has both rows; only the active one can be dropped
+    row = execute(cursor, SELECT_ACTIVE_REGISTRATION, (student_id, section_number, course_code)).fetchone()
+    if row is None:
+        row = execute(cursor, SELECT_REGISTRATION_STATUS, (student_id, section_number, course_code)).fetchone()
+        return RegistrationStatus.DROPPED if row is not None else None
+    execute(cursor, UPDATE_REGISTRATION_DROPPED, (student_id, section_number, course_code, row[0]))
+    if row[0] == RegistrationStatus.ENROLLED:
+        execute(cursor, DECREMENT_CURRENT_ENROLLMENT, (section_number, course_code))
+    elif row[0] == RegistrationStatus.WAITLISTED:
+        execute(cursor, DECREMENT_WAITLIST, (section_number, course_code))
+    return row[0]
+
+def promote_waitlist(cursor: Cursor, course_code: str, section_number: int) -> List[int]:
+    """Enroll waitlisted students, in waitlist order, until the section is full or its waitlist is empty.
+
+    Must run inside the write transaction that freed the seats, so no new
+    enrollment can take a seat ahead of the waitlist. Returns the promoted students.
     """
+    promoted = []
+    while True:
+        row = execute(cursor, PROMOTE_WAITLIST_HEAD, (course_code, section_number)).fetchone()
+        if row is None:
+            break
+        execute(cursor, PROMOTE_SECTION_COUNTERS, (section_number, course_code))
+        promoted.append(row[0])
+    if promoted:
+        logger.info(f'Promoted {promoted} from the waitlist of {course_code} section {section_number}')
+    return promoted
+
+def release_registration(cursor: Cursor, student_id: int, course_code: str, section_number: int) -> Optional[str]:
+    """Drop a registration and, when it held a seat, promote from the waitlist; returns its previous status."""
+    previous_status = drop_registration(cursor, student_id, course_code, section_number)
+    if previous_status == RegistrationStatus.ENROLLED:
+        promote_waitlist(cursor, course_code, section_number)
+    return previous_status
+
+def enroll_step(cursor: Cursor, enrollment_request: EnrollmentRequest) -> Tuple[EnrollmentResponse, Optional[SectionState]]:
+    """enroll_student's role check and enrollment, on a cursor whose transaction someone else commits."""
+    role = resolve_role(cursor, enrollment_request.student_id)
+    if role != UserRole.STUDENT:
+        raise HTTPException(status_code = status.HTTP_401_UNAUTHORIZED, detail= f'Enrollment not authorized for role:{role}')
+    cached_state = section_cache.get(section_key(enrollment_request.course_code, enrollment_request.section_number))
+    section_full = cached_state is not None and eligibility_for(cached_state) == RegistrationStatus.NOT_ELIGIBLE
+    return enroll_in_transaction(cursor, enrollment_request.student_id, enrollment_request.course_code,
+                                 enrollment_request.section_number, section_full)
+
+def drop_course_step(cursor: Cursor, registration: Registration) -> str:
+    """update_student_registration_status's drop, on a cursor whose transaction someone else commits."""
+    previous_status = release_registration(cursor, registration.student_id, registration.course_code, registration.section_number)
+    if previous_status is None:
+        raise HTTPException(status_code= status.HTTP_400_BAD_REQUEST, detail= f'Record not found')
+    if previous_status == RegistrationStatus.DROPPED:
+        return RegistrationStatus.DROPPED
+    return QueryStatus.SUCCESS
+
+def drop_student_step(cursor: Cursor, DropRequest: DropStudentRequest) -> str:
+    """drop_student's drop, on a cursor whose transaction someone else commits."""
+    release_registration(cursor, DropRequest.student_id, DropRequest.course_code, DropRequest.section_number)
+    return QueryStatus.SUCCESS
+
+@retry_on_busy
+def enroll_cart(db_connection: Connection, batch_request: BatchEnrollmentRequest) -> BatchEnrollmentResponse:
+    """Enroll one student in every section of a cart in a single transaction.
 
+    The role is checked once, and one query reads the counters and the student's
+    active registrations for all sections. BEGIN IMMEDIATE holds the write lock
+    from that read to COMMIT, so each section is decided from the counters read
+    and updated in place. A full or unknown section gets its own result without
+    failing the rest of the cart.
+    """
+    logger.info(f'Starting batch enrollment of {len(batch_request.sections)} sections')
+    student_id = batch_request.student_id
+    cart = json.dumps([[item.course_code, item.section_number] for item in batch_request.sections])
+    results = []
+    registered = set()
+    role = resolve_role(db_connection, student_id)
+    if role != UserRole.STUDENT:
+        raise HTTPException(status_code = status.HTTP_401_UNAUTHORIZED, detail= f'Enrollment not authorized for role:{role}')
     cursor = db_connection.cursor()
-    cursor.execute("BEGIN")
+    cursor.execute("BEGIN IMMEDIATE")
     try:
-        cursor.execute(insert_query)
-        if registration.enrollment_status == RegistrationStatus.ENROLLED:
-            cursor.execute(update_current_enrollment_query)
-        elif registration.enrollment_status == RegistrationStatus.WAITLISTED:
-            cursor.execute(update_waitlist_query)
+        states = {}
+        active = {}
+        for item, current_enrollment, max_enrollment, waitlist, registration_status, enrollment_date in execute(cursor, SELECT_CART_STATE, (student_id, cart)):
+            key = section_key(batch_request.sections[item].course_code, batch_request.sections[item].section_number)
+            if current_enrollment is not None:
+                states[key] = SectionState(current_enrollment, max_enrollment, waitlist)
+            if registration_status is not None:
+                active[key] = (registration_status, enrollment_date)
+
+        for item in batch_request.sections:
+            key = section_key(item.course_code, item.section_number)
+            enrollment_date = None
+            if key in active:
+                registration_status, enrollment_date = active[key]
+                enrollment_status = f'already {registration_status}'
+            elif key not in states:
+                enrollment_status = 'not found'
+            elif eligibility_for(states[key]) == RegistrationStatus.NOT_ELIGIBLE:
+                enrollment_status = 'not eligible'
+            else:
+                state = states[key]
+                section_params = (item.section_number, item.course_code)
+                enrollment_status = eligibility_for(state).value
+                if enrollment_status == RegistrationStatus.ENROLLED:
+                    execute(cursor, INCREMENT_CURRENT_ENROLLMENT, section_params)
+                    states[key] = state._replace(current_enrollment = state.current_enrollment + 1)
+                else:
+                    execute(cursor, INCREMENT_WAITLIST, section_params)
+                    states[key] = state._replace(waitlist = state.waitlist + 1)
+                execute(cursor, INSERT_REGISTRATION, (student_id, item.course_code, item.section_number, enrollment_status))
+                enrollment_date = datetime.utcnow()
+                active[key] = (enrollment_status, enrollment_date)
+                registered.add(key)
+            results.append(BatchEnrollmentResult(course_code = item.course_code, section_number = item.section_number,
+                                                 enrollment_status = enrollment_status, enrollment_date = enrollment_date))
         cursor.execute("COMMIT")
+    except HTTPException:
+        cursor.execute("ROLLBACK")
+        raise
     except Exception as err:
         logger.error(err)
         cursor.execute("ROLLBACK")
@@ -164,32 +368,21 @@ def complete_registration(db_connection: Connection, registration: Registration)
         raise DBException(error_detail = 'Fail to register')
     finally:
         cursor.close()
+    for course_code, section_number in registered:
+        invalidate_section(course_code, section_number)
+    return BatchEnrollmentResponse(student_id = student_id, results = results)
 
-    return QueryStatus.SUCCESS
-
+@retry_on_busy
 def update_student_registration_status(db_connection:Connection, registration: Registration)-> str:
     logger.info('Upadting the registration status')
-    check_status_query = f""" SELECT Status FROM RegistrationList where StudentID = {registration.student_id} and SectionNumber = {registration.section_number} and CourseCode = '{registration.course_code}'"""
-    update_status_query = f""" UPDATE RegistrationList SET Status = 'dropped' where StudentID = {registration.student_id} and 
-                               SectionNumber = {registration.section_number} and CourseCode = '{registration.course_code}' and status = 'enrolled' """
-    update_current_enrollment_query = f"""UPDATE SECTION set CurrentEnrollment = CurrentEnrollment -1 where SectionNumber = {registration.section_number} and CourseCode = '{registration.course_code}'"""
-    update_waitlist_count_query = f"""UPDATE "Section" SET Waitlist = Waitlist - 1 WHERE SectionNumber = {registration.section_number} and CourseCode = '{registration.course_code}'"""
     cursor = db_connection.cursor()
-    cursor.execute("BEGIN")
+    cursor.execute("BEGIN IMMEDIATE")
     try:
-        rows =  cursor.execute(check_status_query)
-        if rows.arraysize == 0:
-            raise HTTPException(status_code= status.HTTP_400_BAD_REQUEST, detail= f'Record not found')
-        row = rows.fetchone()
-        if row[0] == RegistrationStatus.DROPPED:
-            return RegistrationStatus.DROPPED
-        else:
-            cursor.execute(update_status_query)
-            if row[0] == RegistrationStatus.ENROLLED:
-                cursor.execute(update_current_enrollment_query)
-            elif row[0] == RegistrationStatus.WAITLISTED:
-                cursor.execute(update_waitlist_count_query)
+        result = drop_course_step(cursor, registration)
         cursor.execute("COMMIT")
+    except HTTPException:
+        cursor.execute("ROLLBACK")
+        raise
     except Exception as err:
         logger.error(err)
         cursor.execute("ROLLBACK")
@@ -197,17 +390,15 @@ def update_student_registration_status(db_connection:Connection, registration: R
         raise DBException(error_detail = 'Fail to drop the class')
     finally:
         cursor.close()
-    return QueryStatus.SUCCESS
+        invalidate_section(registration.course_code, registration.section_number)
+    return result
         
     
 def check_class_exists(db_connection: Connection, course_code: str)-> bool:
     logger.info('Checking if class exists')
     result = False
-    query = f"""
-            SELECT CourseCode FROM Class where CourseCode = '{course_code}' 
-            """
     cursor = db_connection.cursor()
-    cursor.execute(query)
+    execute(cursor, SELECT_CLASS_EXISTS, (course_code,))
     rows = cursor.fetchall()
     if len(rows) > 0:
         result = True
@@ -217,43 +408,22 @@ def check_class_exists(db_connection: Connection, course_code: str)-> bool:
 def check_section_exists(db_connection: Connection, course_code: str, section_number: int)-> bool:
     logger.info('Checking if section exists')
     result = False
-    query = f"""
-            SELECT SectionNumber FROM Section where CourseCode = '{course_code}' and SectionNumber = {section_number}
-            """
     cursor = db_connection.cursor()
-    cursor.execute(query)
+    execute(cursor, SELECT_SECTION_EXISTS, (course_code, section_number))
     rows = cursor.fetchall()
     if len(rows) > 0:
         result = True
     return result
 
 
-def check_is_instructor(db_connection: Connection, instructor_id: int)-> Union[str, None]:
-    logger.info('Checking if user is instructor')
-    query = f"""
-            SELECT role FROM Users where CWID = {instructor_id}
-            """
-    cursor = db_connection.cursor()
-    rows =  cursor.execute(query)
-    if rows.arraysize == 0:
-        raise HTTPException(status_code= status.HTTP_400_BAD_REQUEST, detail= f'Record not found for given CWID: {instructor_id}')
-    result = UserRole.NOT_FOUND
-    for row in rows:
-        result = row[0]
-    return result
-
-
+@retry_on_busy
 def addClass(db_connection: Connection, course_code, class_name, department) -> str:
     logger.info('Starting to add class')
-    insert_query = f"""
-    INSERT INTO Class (CourseCode, Name, Department) VALUES ('{course_code}', '{class_name}', '{department}')
-    """
-
     cursor = db_connection.cursor()
 
-    cursor.execute("BEGIN")
+    cursor.execute("BEGIN IMMEDIATE")
     try:
-        cursor.execute(insert_query)
+        execute(cursor, INSERT_CLASS, (course_code, class_name, department))
         cursor.execute("COMMIT")
     except Exception as err:
         logger.error(err)
@@ -262,18 +432,17 @@ def addClass(db_connection: Connection, course_code, class_name, department) ->
         raise DBException(error_detail = 'Fail to add class')
     finally:
         cursor.close()
+        catalog_cache.invalidate_department(department)
 
     return QueryStatus.SUCCESS
 
+@retry_on_busy
 def addSection(db_connection: Connection, section_number, course_code, instructor_id, max_enrollment) -> str:
     logger.info('Starting to add section')
-    insert_query = f"""
-    INSERT INTO Section (SectionNumber, CourseCode, InstructorID, MaxEnrollment, CurrentEnrollment, Waitlist, SectionStatus) VALUES ({section_number}, '{course_code}', {instructor_id}, {max_enrollment}, 0, 0, 'open')
-    """
     cursor = db_connection.cursor()
-    cursor.execute("BEGIN")
+    cursor.execute("BEGIN IMMEDIATE")
     try:
-        cursor.execute(insert_query)
+        execute(cursor, INSERT_SECTION, (section_number, course_code, instructor_id, max_enrollment))
         cursor.execute("COMMIT")
     except Exception as err:
         logger.error(err)
@@ -282,19 +451,19 @@ def addSection(db_connection: Connection, section_number, course_code, instructo
         raise DBException(error_detail = 'Fail to add section')
     finally:
         cursor.close()
+        section_cache.invalidate(section_key(course_code, section_number))
+        # A class without sections is not listed in any cached catalog yet
+        catalog_cache.clear()
 
     return QueryStatus.SUCCESS
 
+@retry_on_busy
 def deleteSection(db_connection: Connection, course_code: str, section_number: int) -> str:
     logger.info('Starting to delete section')
-    delete_query = f"""
-    DELETE FROM Section WHERE CourseCode = '{course_code}' and SectionNumber = {section_number}
-    """
-
     cursor = db_connection.cursor()
-    cursor.execute("BEGIN")
+    cursor.execute("BEGIN IMMEDIATE")
     try:
-        cursor.execute(delete_query)
+        execute(cursor, DELETE_SECTION, (course_code, section_number))
         cursor.execute("COMMIT")
     except Exception as err:
         logger.error(err)
@@ -303,19 +472,17 @@ def deleteSection(db_connection: Connection, course_code: str, section_number: i
         raise DBException(error_detail = 'Fail to delete section')
     finally:
         cursor.close()
+        invalidate_section(course_code, section_number)
 
     return QueryStatus.SUCCESS
 
+@retry_on_busy
 def changeSectionInstructor(db_connection: Connection, course_code: str, section_number: int, instructor_id: int) -> str:
-    logger.info('Starting to change instructor for section ', str(section_number))
-    update_query = f"""
-    UPDATE Section SET InstructorID = {instructor_id} WHERE SectionNumber = {section_number} and CourseCode = '{course_code}'
-    """
-
+    logger.info(f'Starting to change instructor for section {section_number}')
     cursor = db_connection.cursor()
-    cursor.execute("BEGIN")
+    cursor.execute("BEGIN IMMEDIATE")
     try:
-        cursor.execute(update_query)
+        execute(cursor, UPDATE_SECTION_INSTRUCTOR, (instructor_id, section_number, course_code))
         cursor.execute("COMMIT")
     except Exception as err:
         logger.error(err)
@@ -324,19 +491,17 @@ def changeSectionInstructor(db_connection: Connection, course_code: str, section
         raise DBException(error_detail = 'Fail to change instructor')
     finally:
         cursor.close()
+        catalog_cache.invalidate_course(course_code)
 
     return QueryStatus.SUCCESS
 
+@retry_on_busy
 def freezeEnrollment(db_connection: Connection, course_code: str, section_number: int) -> str:
-    logger.info('Starting to freeze enrollment for section ', str(section_number))
-    update_query = f"""
-    UPDATE Section SET SectionStatus = 'closed' WHERE SectionNumber = {section_number} and CourseCode = '{course_code}'
-    """
-
+    logger.info(f'Starting to freeze enrollment for section {section_number}')
     cursor = db_connection.cursor()
-    cursor.execute("BEGIN")
+    cursor.execute("BEGIN IMMEDIATE")
     try:
-        cursor.execute(update_query)
+        execute(cursor, UPDATE_SECTION_CLOSED, (section_number, course_code))
         cursor.execute("COMMIT")
     except Exception as err:
         logger.error(err)
@@ -348,233 +513,132 @@ def freezeEnrollment(db_connection: Connection, course_code: str, section_number
 
     return QueryStatus.SUCCESS
 
-# enrolled students
-def get_enrolled_students(db_connection: Connection, instructor_id: int, course_code: Optional[str] = None, section_number: Optional[int] = None) -> List[EnrollmentListResponse]:
-    logger.info('Getting enrolled students for instructor with CWID:')
-    query = """
-                SELECT
-                    Users.CWID AS StudentCWID,
-                    Users.Name AS StudentFirstName,
-                    Users.LastName AS StudentLastName,
-                    Class.CourseCode AS CourseCode,
-                    Section.SectionNumber AS SectionNumber,
-                    Class.Name AS ClassName,
-                    RegistrationList.Status AS Status
-                FROM
-                    RegistrationList
-                    JOIN Users ON RegistrationList.StudentID = Users.CWID
-                    JOIN Section ON RegistrationList.CourseCode = Section.CourseCode AND RegistrationList.SectionNumber = Section.SectionNumber
-                    JOIN Class ON Section.CourseCode = Class.CourseCode
-                WHERE
-                    Section.InstructorID = ?
-                    AND RegistrationList.Status = 'enrolled'
-            """
-    params = [instructor_id]
+RosterKey = Tuple[str, int, str, str, int]
+
+
+def roster_key(row: dict) -> RosterKey:
+    """Keyset of a roster row, in the roster's ORDER BY order."""
+    return (row["course_code"], row["section_number"], row["student_last_name"], row["student_first_name"], row["student_cwid"])
+
+def encode_roster_cursor(row: dict) -> str:
+    return urlsafe_b64encode(json.dumps(roster_key(row)).encode()).decode()
+
+def decode_roster_cursor(cursor: str) -> RosterKey:
+    try:
+        course_code, section_number, last_name, first_name, cwid = json.loads(urlsafe_b64decode(cursor.encode()))
+    except (TypeError, ValueError):
+        raise HTTPException(status_code= status.HTTP_400_BAD_REQUEST, detail= 'Invalid cursor')
+    return (course_code, section_number, last_name, first_name, cwid)
+
+def get_roster(db_connection: Connection, instructor_id: int, registration_status: str, course_code: Optional[str] = None,
+               section_number: Optional[int] = None, after: Optional[RosterKey] = None, limit: Optional[int] = None) -> List[dict]:
+    """Roster rows for an instructor ordered by course, section and student name.
+
+    Pages are read with a keyset: pass the ``roster_key`` of the last row
+    already returned as ``after`` and at most ``limit`` following rows are read.
+    """
     if course_code is not None:
-        query += " AND Section.CourseCode = ?"
-        params.append(course_code)
-    if section_number is not None:
-        query += " AND Section.SectionNumber = ?"
-        params.append(section_number)
+        statement = SELECT_INSTRUCTOR_COURSE_ROSTER if section_number is None else SELECT_INSTRUCTOR_SECTION_ROSTER
     else:
-        query += " ORDER BY Class.CourseCode, Section.SectionNumber, Users.LastName, Users.Name"
-    cur = db_connection.execute(query, tuple(params))
-    enrollment = cur.fetchall()
-    if not enrollment:
+        statement = SELECT_INSTRUCTOR_ROSTER if section_number is None else SELECT_INSTRUCTOR_SECTION_NUMBER_ROSTER
+    # Every course code sorts after '', so the first page starts below every row
+    keyset = after if after is not None else ('', 0, '', '', 0)
+    cur = execute(db_connection, statement,
+                  (instructor_id, registration_status, course_code, section_number) + tuple(keyset) + (-1 if limit is None else limit,))
+    return [{"student_cwid": row[0],
+             "student_first_name": row[1],
+             "student_last_name": row[2],
+             "course_code": row[3],
+             "section_number": row[4],
+             "class_name": row[5],
+             "status": row[6]} for row in cur.fetchall()]
+
+# enrolled students
+def get_enrolled_students(db_connection: Connection, instructor_id: int, course_code: Optional[str] = None, section_number: Optional[int] = None,
+                          after: Optional[RosterKey] = None, limit: Optional[int] = None) -> List[EnrollmentListResponse]:
+    logger.info('Getting enrolled students for instructor with CWID:')
+    results = get_roster(db_connection, instructor_id, RegistrationStatus.ENROLLED, course_code, section_number, after, limit)
+    if not results and after is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Enrollment for instructor not found"
         )
-    results = [{"student_cwid": row[0],
-                      "student_first_name": row[1],
-                      "student_last_name": row[2],
-                      "course_code": row[3],
-                      "section_number": row[4],
-                      "class_name": row[5],
-                      "status": row[6]} for row in enrollment]
     return results
 
 # waitlisted students
-def get_waitlisted_students(db_connection: Connection, instructor_id: int, course_code: Optional[str] = None, section_number: Optional[int] = None) -> List[EnrollmentListResponse]:
+def get_waitlisted_students(db_connection: Connection, instructor_id: int, course_code: Optional[str] = None, section_number: Optional[int] = None,
+                            after: Optional[RosterKey] = None, limit: Optional[int] = None) -> List[EnrollmentListResponse]:
     logger.info('Getting enrolled students for instructor with CWID:')
-    query = """
-                SELECT
-                    Users.CWID AS StudentCWID,
-                    Users.Name AS StudentFirstName,
-                    Users.LastName AS StudentLastName,
-                    Class.CourseCode AS CourseCode,
-                    Section.SectionNumber AS SectionNumber,
-                    Class.Name AS ClassName,
-                    RegistrationList.Status AS Status
-                FROM
-                    RegistrationList
-                    JOIN Users ON RegistrationList.StudentID = Users.CWID
-                    JOIN Section ON RegistrationList.CourseCode = Section.CourseCode AND RegistrationList.SectionNumber = Section.SectionNumber
-                    JOIN Class ON Section.CourseCode = Class.CourseCode
-                WHERE
-                    Section.InstructorID = ?
-                    AND RegistrationList.Status = 'waitlisted'
-            """
-    params = [instructor_id]
-    if course_code is not None:
-        query += " AND Section.CourseCode = ?"
-        params.append(course_code)
-    if section_number is not None:
-        query += " AND Section.SectionNumber = ?"
-        params.append(section_number)
-    else:
-        query += " ORDER BY Class.CourseCode, Section.SectionNumber, Users.LastName, Users.Name"
-    cur = db_connection.execute(query, tuple(params))
-    enrollment = cur.fetchall()
-    if not enrollment:
+    results = get_roster(db_connection, instructor_id, RegistrationStatus.WAITLISTED, course_code, section_number, after, limit)
+    if not results and after is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Waitlist for instructor not found"
         )
-    results = [{"student_cwid": row[0],
-                      "student_first_name": row[1],
-                      "student_last_name": row[2],
-                      "course_code": row[3],
-                      "section_number": row[4],
-                      "class_name": row[5],
-                      "status": row[6]} for row in enrollment]
     return results
 
 # dropped students 
-def get_dropped_students(db_connection: Connection, instructor_id: int,course_code: Optional[str] = None, section_number: Optional[int] = None) -> List[EnrollmentListResponse]:
+def get_dropped_students(db_connection: Connection, instructor_id: int,course_code: Optional[str] = None, section_number: Optional[int] = None,
+                         after: Optional[RosterKey] = None, limit: Optional[int] = None) -> List[EnrollmentListResponse]:
     logger.info('Getting dropped students for instructor')
-    query = """
-                SELECT
-                    Users.CWID AS StudentCWID,
-                    Users.Name AS StudentFirstName,
-                    Users.LastName AS StudentLastName,
-                    Class.CourseCode AS CourseCode,
-                    Section.SectionNumber AS SectionNumber,
-                    Class.Name AS ClassName,
-                    RegistrationList.Status AS Status
-                FROM
-                    RegistrationList
-                    JOIN Users ON RegistrationList.StudentID = Users.CWID
-                    JOIN Section ON RegistrationList.CourseCode = Section.CourseCode AND RegistrationList.SectionNumber = Section.SectionNumber
-                    JOIN Class ON Section.CourseCode = Class.CourseCode
-                WHERE
-                    Section.InstructorID = ?
-                    AND RegistrationList.Status = 'dropped' 
-            """
-    params = [instructor_id]
-    if course_code is not None:
-        query += " AND Section.CourseCode = ?"
-        params.append(course_code)
-    if section_number is not None:
-        query += " AND Section.SectionNumber = ?"
-        params.append(section_number)
-    else:
-        query += " ORDER BY Class.CourseCode, Section.SectionNumber, Users.LastName, Users.Name"
-    cur = db_connection.execute(query, tuple(params))
-    enrollment = cur.fetchall()
-    if not enrollment:
+    results = get_roster(db_connection, instructor_id, RegistrationStatus.DROPPED, course_code, section_number, after, limit)
+    if not results and after is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="No students that dropped found for instructor"
         )
-    results = [{"student_cwid": row[0],
-                      "student_first_name": row[1],
-                      "student_last_name": row[2],
-                      "course_code": row[3],
-                      "section_number": row[4],
-                      "class_name": row[5],
-                      "status": row[6]} for row in enrollment]
     return results
 
-def get_waitlist_status(db_connection: Connection, student_id: int) -> str:
-    logger.info('Checking waitlist position for student ', str(student_id))
-    query = f"""
-        WITH WaitlistPosition AS (
-        SELECT
-            rl.StudentID,
-            rl.CourseCode,
-            rl.SectionNumber,
-            rl.Status,
-            ROW_NUMBER() OVER (PARTITION BY rl.CourseCode, rl.SectionNumber ORDER BY rl.EnrollmentDate) AS Position
-        FROM
-            RegistrationList rl
-        WHERE
-            rl.Status = 'waitlisted'
-        )
-        SELECT
-            wlp.Position,
-            wlp.CourseCode,
-            wlp.SectionNumber
-        FROM
-            WaitlistPosition wlp
-        WHERE
-            wlp.StudentID = {student_id}
-    """
+def waitlist_position_rows(db_connection: Connection, student_id: int) -> List[dict]:
+    """A student's waitlist positions as dicts keyed and ordered like WaitlistPositionList."""
+    logger.info(f'Checking waitlist position for student {student_id}')
     cursor = db_connection.cursor()
-    rows =  cursor.execute(query)
+    rows = execute(cursor, SELECT_WAITLIST_POSITIONS, (student_id,))
     if rows.arraysize == 0:
         raise HTTPException(status_code= status.HTTP_400_BAD_REQUEST, detail= f'Record not found.')
     result = []
     for row in rows:
-        logger.info(str(row))
-        waitlist = WaitlistPositionList(
-            waitlist_position = row[0],
-            section_number = row[2],
-            course_code = row[1]
-        )
-        result.append(waitlist)
-    print(result)
+        if LOG_ROWS:
+            logger.debug(f'Waitlist position row {row}')
+        result.append({"section_number": row[2],
+                       "course_code": row[1],
+                       "waitlist_position": row[0]})
+    logger.info(f'Found {len(result)} waitlist positions')
     return result
 
-def get_waitlist(db_connection: Connection, course_code: str, section_number: int) -> list:
+def get_waitlist_status(db_connection: Connection, student_id: int) -> List[WaitlistPositionList]:
+    return [WaitlistPositionList(**row) for row in waitlist_position_rows(db_connection, student_id)]
+
+def waitlist_rows(db_connection: Connection, course_code: str, section_number: int) -> List[dict]:
+    """A section's waitlist as dicts keyed and ordered like WaitlistStudents."""
     logger.info(f'fetching  the students on the waitlist with coursecode and section no {course_code}, {section_number}')
-    query = f"""
-        SELECT
-            r.StudentID,
-            u.Name AS StudentName,
-            r.EnrollmentDate,
-            r.Status
-        FROM
-            RegistrationList r
-        JOIN
-            Users u ON r.StudentID = u.CWID
-        WHERE
-            r.CourseCode = "{course_code}"
-            AND r.SectionNumber = {section_number}
-            AND r.Status = 'waitlisted'
-        ORDER BY
-            r.EnrollmentDate;
-    """
     cursor = db_connection.cursor()
-    rows =  cursor.execute(query)
+    rows = execute(cursor, SELECT_SECTION_WAITLIST, (course_code, section_number))
     if rows.arraysize == 0:
         raise HTTPException(status_code= status.HTTP_400_BAD_REQUEST, detail= f'Records not found.')
         # todo: throw appropriate error messages
     result = []
     for row in rows:
-        logger.info(str(row))
-        student = WaitlistStudents(
-            student_id = row[0],
-            student_name = row[1],
-            enrollment_date = row[2]
-        )
-        result.append(student)
-    logger.info(result)
+        if LOG_ROWS:
+            logger.debug(f'Waitlist row {row}')
+        # SQLite keeps "YYYY-MM-DD HH:MM:SS"; the model serializes the same value in ISO 8601 form
+        result.append({"student_id": row[0],
+                       "student_name": row[1],
+                       "enrollment_date": row[2].replace(' ', 'T', 1)})
+    logger.info(f'Found {len(result)} waitlisted students')
     return result
 
+def get_waitlist(db_connection: Connection, course_code: str, section_number: int) -> List[WaitlistStudents]:
+    return [WaitlistStudents(**row) for row in waitlist_rows(db_connection, course_code, section_number)]
+
 # check if student is enrolled 
 def check_is_enrolled(db_connection, DropRequest) -> bool:
-    query = """SELECT Status FROM RegistrationList WHERE StudentID = ? AND CourseCode = ? AND SectionNumber = ?"""
     cursor = db_connection.cursor()
-    cursor.execute(query, (DropRequest.student_id, DropRequest.course_code, DropRequest.section_number))
-    result = cursor.fetchone()
-    if result is not None and (result[0] == "enrolled" or result[0] == "waitlisted"):
-        return True
-    else:
-        return False
+    # A dropped row from an earlier registration may sit next to the active one
+    execute(cursor, SELECT_ACTIVE_REGISTRATION, (DropRequest.student_id, DropRequest.section_number, DropRequest.course_code))
+    return cursor.fetchone() is not None
     
 # check if instructor is the instructor of the section 
 def check_is_instructor_of_section(db_connection, DropRequest) -> bool:
-    query = """SELECT InstructorID FROM Section WHERE CourseCode = ? AND SectionNumber = ?"""
     cursor = db_connection.cursor()
-    cursor.execute(query, (DropRequest.course_code, DropRequest.section_number))
+    execute(cursor, SELECT_SECTION_INSTRUCTOR, (DropRequest.course_code, DropRequest.section_number))
     result = cursor.fetchone()
     if result is not None and result[0] == DropRequest.instructor_id:
         return True
@@ -582,20 +646,13 @@ def check_is_instructor_of_section(db_connection, DropRequest) -> bool:
         return False
 
 # drop a student 
+@retry_on_busy
 def drop_student(db_connection: Connection, DropRequest: DropStudentRequest) -> str:
     logger.info('Dropping student')
-    drop = """
-                UPDATE RegistrationList SET Status = 'dropped' WHERE StudentID = ? AND CourseCode = ? AND SectionNumber = ?
-    """
-    update_enrollment = """
-                UPDATE Section SET CurrentEnrollment = CurrentEnrollment - 1 WHERE CourseCode = ? AND SectionNumber = ?
-    """
-    params = [DropRequest.student_id, DropRequest.course_code, DropRequest.section_number]
     cursor = db_connection.cursor()
-    cursor.execute("BEGIN")
+    cursor.execute("BEGIN IMMEDIATE")
     try:
-        cursor.execute(drop, tuple(params))
-        cursor.execute(update_enrollment, (DropRequest.course_code, DropRequest.section_number))
+        result = drop_student_step(cursor, DropRequest)
         cursor.execute("COMMIT")
     except Exception as err:
         logger.error(err)
@@ -604,4 +661,39 @@ def drop_student(db_connection: Connection, DropRequest: DropStudentRequest) ->
         raise DBException(error_detail = 'Fail to drop student')
     finally:
         cursor.close()
-    return QueryStatus.SUCCESS
+        invalidate_section(DropRequest.course_code, DropRequest.section_number)
+    return result
+
+@retry_on_busy
+def drop_students(db_connection: Connection, drop_requests: List[DropStudentRequest]) -> Dict[str, int]:
+    """Drop many registrations in one transaction, then refill each affected section once.
+
+    Promotion runs per section after all drops, so a section losing several
+    students is refilled in one pass instead of once per drop.
+    """
+    logger.info(f'Dropping {len(drop_requests)} students')
+    freed_sections: Set[Tuple[str, int]] = set()
+    dropped = 0
+    promoted = 0
+    cursor = db_connection.cursor()
+    cursor.execute("BEGIN IMMEDIATE")
+    try:
+        for drop_request in drop_requests:
+            previous_status = drop_registration(cursor, drop_request.student_id, drop_request.course_code, drop_request.section_number)
+            if previous_status in (RegistrationStatus.ENROLLED, RegistrationStatus.WAITLISTED):
+                dropped += 1
+            if previous_status == RegistrationStatus.ENROLLED:
+                freed_sections.add((drop_request.course_code, drop_request.section_number))
+        for course_code, section_number in freed_sections:
+            promoted += len(promote_waitlist(cursor, course_code, section_number))
+        cursor.execute("COMMIT")
+    except Exception as err:
+        logger.error(err)
+        cursor.execute("ROLLBACK")
+        logger.info('Rolling back transaction')
+        raise DBException(error_detail = 'Fail to drop students')
+    finally:
+        cursor.close()
+        for course_code, section_number in {(drop_request.course_code, drop_request.section_number) for drop_request in drop_requests}:
+            invalidate_section(course_code, section_number)
+    return {'dropped': dropped, 'promoted': promoted}
@@ -0,0 +1,58 @@
+"""Logging configuration for the API.
+
+Records go to stderr through loguru. With ``LOG_ENQUEUE`` the sink is fed
+through a queue and written by loguru's background thread, so a request only
+pays for building the record, never for the write. ``LOG_FORMAT=json`` emits
+one JSON object per record. ``LOG_SAMPLE_RATES`` keeps a share of the records
+at chosen levels; WARNING and above are never sampled out.
+
+Per-row records in query functions are guarded by ``LOG_ROWS`` at the call
+site, so with it off (the default) no record is built for each row.
+"""
+
+import random
+import sys
+from typing import Dict
+
+from loguru import logger
+
+from .metrics import log_sampled_out
+from .settings import LOG_ENQUEUE, LOG_FORMAT, LOG_LEVEL, LOG_SAMPLE_RATES
+
+TEXT_FORMAT = '{time:YYYY-MM-DD HH:mm:ss.SSS} | {level: <8} | {name}:{function}:{line} - {message}'
+# Levels that are always kept, whatever LOG_SAMPLE_RATES says
+UNSAMPLED_LEVEL = logger.level('WARNING').no
+
+
+def parse_sample_rates(value: str) -> Dict[str, float]:
+    """``"INFO=0.1,DEBUG=0.01"`` as ``{'INFO': 0.1, 'DEBUG': 0.01}``."""
+    rates = {}
+    for item in value.split(','):
+        if not item.strip():
+            continue
+        level, _, rate = item.partition('=')
+        rates[level.strip().upper()] = min(1.0, max(0.0, float(rate)))
+    return rates
+
+
+class Sampler:
+    """loguru filter that keeps each record at a sampled level with that level's probability."""
+
+    def __init__(self, rates: Dict[str, float]) -> None:
+        self.rates = {level: rate for level, rate in rates.items()
+                      if rate < 1.0 and logger.level(level).no < UNSAMPLED_LEVEL}
+
+    def __call__(self, record) -> bool:
+        rate = self.rates.get(record['level'].name)
+        if rate is None or random.random() < rate:
+            return True
+        log_sampled_out.inc(record['level'].name)
+        return False
+
+
+def configure_logging() -> None:
+    """Replace loguru's default handler with the configured stderr sink."""
+    logger.remove()
+    sampler = Sampler(parse_sample_rates(LOG_SAMPLE_RATES))
+    logger.add(sys.stderr, level=LOG_LEVEL, enqueue=LOG_ENQUEUE, serialize=LOG_FORMAT == 'json',
+               format=TEXT_FORMAT, filter=sampler if sampler.rates else None, backtrace=False, diagnose=False)
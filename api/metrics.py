@@ -0,0 +1,181 @@
+"""In-process metrics rendered in the Prometheus text exposition format.
+
+Request latency is recorded by ``MetricsMiddleware`` per ``operation_id``, the
+time each database_query function holds its connection by ``AsyncDatabase``,
+and the wait for a pooled connection by ``ConnectionPool``. Per-statement
+counters come from ``statement_stats``. Recording is a bisect and a few
+additions under a lock, so it is cheap enough to leave on for every request.
+"""
+
+from bisect import bisect_left
+from threading import Lock
+from time import perf_counter
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from .statements import statement_stats
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def labels(label: Optional[str], value: Optional[str], extra: str = '') -> str:
+    pairs = [f'{label}="{escape(value)}"'] if label is not None else []
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Histogram:
+    """Cumulative-bucket histogram, optionally split by one label."""
+
+    def __init__(self, name: str, description: str, label: Optional[str] = None,
+                 buckets: Sequence[float] = LATENCY_BUCKETS) -> None:
+        self.name = name
+        self.description = description
+        self.label = label
+        self.buckets = tuple(buckets)
+        self._lock = Lock()
+        self._series: Dict[Optional[str], Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, label_value: Optional[str] = None) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_value)
+            if series is None:
+                series = self._series[label_value] = ([0] * (len(self.buckets) + 1), [0.0])
+            series[0][index] += 1
+            series[1][0] += value
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.description}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = {label_value: (list(counts), total[0]) for label_value, (counts, total) in self._series.items()}
+        for label_value, (counts, total) in sorted(series.items(), key=lambda item: item[0] or ''):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = 'le="+Inf"' if bound == float('inf') else f'le="{bound!r}"'
+                lines.append(f'{self.name}_bucket{labels(self.label, label_value, le)} {cumulative}')
+            lines.append(f'{self.name}_sum{labels(self.label, label_value)} {total}')
+            lines.append(f'{self.name}_count{labels(self.label, label_value)} {cumulative}')
+        return lines
+
+
+class LabeledCounter:
+    """Monotonic counter split by one label."""
+
+    def __init__(self, name: str, description: str, label: str) -> None:
+        self.name = name
+        self.description = description
+        self.label = label
+        self._lock = Lock()
+        self._values: Dict[str, float] = {}
+
+    def inc(self, label_value: str, amount: float = 1) -> None:
+        with self._lock:
+            self._values[label_value] = self._values.get(label_value, 0) + amount
+
+    def value(self, label_value: str) -> float:
+        with self._lock:
+            return self._values.get(label_value, 0)
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.description}', f'# TYPE {self.name} counter']
+        with self._lock:
+            values = dict(self._values)
+        for label_value, value in sorted(values.items()):
+            lines.append(f'{self.name}{labels(self.label, label_value)} {value}')
+        return lines
+
+
+request_latency = Histogram('http_request_duration_seconds', 'Request latency by operation_id.', 'operation_id')
+request_errors = LabeledCounter('http_request_errors_total', 'Responses with a 5xx status by operation_id.', 'operation_id')
+query_latency = Histogram('db_query_duration_seconds', 'Time a database_query function held its connection.', 'function')
+query_rows = LabeledCounter('db_query_rows_total', 'Rows returned by database_query functions that return lists.', 'function')
+executor_wait = Histogram('db_executor_wait_seconds', 'Time a query function waited for an executor thread.')
+pool_wait = Histogram('db_pool_wait_seconds', 'Time spent checking a connection out of the pool.')
+transaction_retries = LabeledCounter('db_transaction_retries_total', 'Transactions retried after SQLITE_BUSY.', 'function')
+counter_repairs = LabeledCounter('section_counter_repairs_total', 'Section counters rewritten by reconciliation.', 'counter')
+write_batch_size = Histogram('db_write_batch_size', 'Operations per group-committed write transaction.',
+                             buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256))
+admission_shed = LabeledCounter('admission_requests_shed_total', 'Requests answered 429 by admission control.', 'reason')
+replica_reads = LabeledCounter('db_read_replica_calls_total', 'Read-only query functions by the pool they ran on.', 'pool')
+log_sampled_out = LabeledCounter('log_records_sampled_out_total', 'Log records dropped by sampling.', 'level')
+
+
+def statement_lines() -> List[str]:
+    snapshot = statement_stats.snapshot()
+    lines = []
+    for metric, key, description in (
+            ('db_statement_executions_total', 'calls', 'Executions of each registered statement.'),
+            ('db_statement_seconds_total', 'seconds', 'Time spent executing each registered statement.'),
+            ('db_statement_errors_total', 'errors', 'Executions of each registered statement that raised.'),
+            ('db_statement_rows_total', 'rows', 'Rows changed by each registered INSERT, UPDATE or DELETE.'),
+            ('db_statement_cache_hits_total', 'cache_hits',
+             'Executions on pooled connections that found the statement compiled in the statement cache.'),
+            ('db_statement_cache_misses_total', 'cache_misses',
+             'Executions on pooled connections that had to compile the statement.')):
+        lines += [f'# HELP {metric} {description}', f'# TYPE {metric} counter']
+        lines += [f'{metric}{labels("statement", name)} {stats[key]}' for name, stats in sorted(snapshot.items())]
+    return lines
+
+
+def sample_lines(metric_type: str, samples: Dict[str, Tuple[str, float]]) -> List[str]:
+    lines = []
+    for name, (description, value) in samples.items():
+        lines += [f'# HELP {name} {description}', f'# TYPE {name} {metric_type}', f'{name} {value}']
+    return lines
+
+
+def render_metrics(gauges: Optional[Dict[str, Tuple[str, float]]] = None,
+                   counters: Optional[Dict[str, Tuple[str, float]]] = None) -> str:
+    """All metrics in text format; ``gauges`` and ``counters`` map a name to its help text and current value."""
+    metrics: Iterable = (request_latency, request_errors, query_latency, query_rows, executor_wait, pool_wait,
+                         transaction_retries, write_batch_size, counter_repairs, admission_shed,
+                         replica_reads, log_sampled_out)
+    lines = [line for metric in metrics for line in metric.render()]
+    lines += statement_lines()
+    lines += sample_lines('gauge', gauges or {})
+    lines += sample_lines('counter', counters or {})
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsMiddleware:
+    """ASGI middleware timing every HTTP request, labelled with the matched route's operation_id."""
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        response_status = 500
+
+        async def send_with_status(message) -> None:
+            nonlocal response_status
+            if message['type'] == 'http.response.start':
+                response_status = message['status']
+            await send(message)
+
+        start = perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            operation_id = operation_for(scope)
+            request_latency.observe(perf_counter() - start, operation_id)
+            if response_status >= 500:
+                request_errors.inc(operation_id)
+
+
+def operation_for(scope) -> str:
+    route = scope.get('route')
+    operation_id = getattr(route, 'operation_id', None)
+    if operation_id:
+        return operation_id
+    endpoint = scope.get('endpoint')
+    return getattr(endpoint, '__name__', 'unmatched')
@@ -0,0 +1,143 @@
+"""Versioned schema migrations applied at startup.
+
+Migration files live in ``api/share/migrations`` and are named
+``NNNN_description.sql``. The number of the last applied file is stored in
+``PRAGMA user_version``, so each file runs exactly once per database.
+
+Run ``python -m api.migrations --seed`` to create a development database, or
+``python -m api.migrations --check-plans`` to verify every registered statement
+uses an index and none sorts its whole result.
+"""
+
+import argparse
+import os
+import re
+import sqlite3
+from sqlite3 import Connection
+from typing import Dict, List, Tuple
+
+from loguru import logger
+
+from .settings import DATABASE_URL
+from .statements import STATEMENTS, Statement
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(__file__), 'share', 'migrations')
+SEED_FILE = os.path.join(os.path.dirname(__file__), 'share', 'classes.sql')
+MIGRATION_FILE_PATTERN = re.compile(r'^(\d{4})_\w+\.sql$')
+
+def list_migrations() -> List[Tuple[int, str]]:
+    """Return ``(version, path)`` for every migration file, in version order."""
+    migrations = []
+    for file_name in os.listdir(MIGRATIONS_DIR):
+        match = MIGRATION_FILE_PATTERN.match(file_name)
+        if match:
+            migrations.append((int(match.group(1)), os.path.join(MIGRATIONS_DIR, file_name)))
+    return sorted(migrations)
+
+
+def split_statements(script: str) -> List[str]:
+    """Split a SQL script into complete statements (trigger bodies stay whole)."""
+    statements = []
+    pending = ''
+    for line in script.splitlines(keepends=True):
+        pending += line
+        if sqlite3.complete_statement(pending):
+            statements.append(pending.strip())
+            pending = ''
+    leftover = [line for line in pending.splitlines() if line.strip() and not line.strip().startswith('--')]
+    if leftover:
+        raise ValueError(f'Incomplete SQL statement: {pending.strip()[:80]}')
+    return statements
+
+
+def current_version(db_connection: Connection) -> int:
+    return db_connection.execute("PRAGMA user_version").fetchone()[0]
+
+
+def apply_migrations(db_connection: Connection) -> int:
+    """Apply pending migrations in one write transaction and return the new version.
+
+    ``BEGIN IMMEDIATE`` takes the write lock before the version is read, so when
+    several workers start together only the first one applies the files.
+    """
+    cursor = db_connection.cursor()
+    cursor.execute("BEGIN IMMEDIATE")
+    try:
+        version = current_version(db_connection)
+        for migration_version, path in list_migrations():
+            if migration_version <= version:
+                continue
+            logger.info(f'Applying migration {os.path.basename(path)}')
+            with open(path) as migration_file:
+                for statement in split_statements(migration_file.read()):
+                    cursor.execute(statement)
+            version = migration_version
+            cursor.execute(f"PRAGMA user_version = {version}")
+        cursor.execute("COMMIT")
+    except Exception as err:
+        logger.error(err)
+        cursor.execute("ROLLBACK")
+        logger.info('Rolling back migrations')
+        raise
+    finally:
+        cursor.close()
+    return version
+
+
+def seed_database(db_connection: Connection) -> bool:
+    """Load the sample rows from classes.sql into an empty database."""
+    if db_connection.execute("SELECT COUNT(*) FROM Users").fetchone()[0] > 0:
+        logger.info('Database already has data, skipping seed')
+        return False
+    with open(SEED_FILE) as seed_file:
+        db_connection.executescript(seed_file.read())
+    return True
+
+
+def check_query_plans(db_connection: Connection, statements: Dict[str, Statement] = STATEMENTS) -> Dict[str, List[str]]:
+    """Return the full-table scans and whole-result sorts found in ``EXPLAIN QUERY PLAN`` for each registered statement.
+
+    An empty result means every table access is served by an index and every
+    ORDER BY is at least partly read in index order.
+    """
+    failures = {}
+    for name, statement in statements.items():
+        parameters = [None] * statement.parameter_count
+        plan = [row[3] for row in db_connection.execute(f"EXPLAIN QUERY PLAN {statement.sql}", parameters)]
+        # Scans of CTEs and subqueries read rows already produced through an index,
+        # and virtual tables such as json_each read a bound parameter, not a table.
+        derived = {detail.split(' ', 1)[1] for detail in plan if detail.startswith(('CO-ROUTINE ', 'MATERIALIZE '))}
+        scans = [detail for detail in plan
+                 if detail.startswith('SCAN ') and ' USING ' not in detail and ' VIRTUAL TABLE' not in detail
+                 and detail[len('SCAN '):] not in derived and detail != 'SCAN CONSTANT ROW']
+        # "FOR RIGHT PART OF ORDER BY" only sorts the rows sharing a prefix read in index order
+        scans += [detail for detail in plan if detail == 'USE TEMP B-TREE FOR ORDER BY']
+        if scans:
+            failures[name] = scans
+    return failures
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Apply schema migrations to the classes database.')
+    parser.add_argument('--database', default=DATABASE_URL, help='SQLite database file')
+    parser.add_argument('--seed', action='store_true', help='load api/share/classes.sql into an empty database')
+    parser.add_argument('--check-plans', action='store_true', help='fail if any query does a full table scan or sort')
+    args = parser.parse_args()
+
+    db_connection = sqlite3.connect(args.database, isolation_level=None)
+    version = apply_migrations(db_connection)
+    print(f'{args.database} is at schema version {version}')
+    if args.seed and seed_database(db_connection):
+        print('Loaded seed data from classes.sql')
+    if args.check_plans:
+        failures = check_query_plans(db_connection)
+        for name, scans in failures.items():
+            print(f'{name}: {"; ".join(scans)}')
+        if failures:
+            raise SystemExit(1)
+        print(f'All {len(STATEMENTS)} statements use an index')
+    db_connection.close()
+
+
+if __name__ == '__main__':
+    main()
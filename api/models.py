@@ -1,9 +1,11 @@
 from datetime import datetime
 from typing import List, Optional
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from enum import Enum
 
+from .settings import ENROLLMENT_BATCH_MAX_SIZE
+
 class AvailableClass(BaseModel):
     course_code: str
     course_name: str
@@ -29,6 +31,24 @@ class EnrollmentRequest(BaseModel):
     course_code: str
     student_id: int
 
+class CartSection(BaseModel):
+    course_code: str
+    section_number: int
+
+class BatchEnrollmentRequest(BaseModel):
+    student_id: int
+    sections: List[CartSection] = Field(min_length=1, max_length=ENROLLMENT_BATCH_MAX_SIZE)
+
+class BatchEnrollmentResult(BaseModel):
+    course_code: str
+    section_number: int
+    enrollment_status: str
+    enrollment_date: Optional[datetime] = None
+
+class BatchEnrollmentResponse(BaseModel):
+    student_id: int
+    results: List[BatchEnrollmentResult]
+
 class RegistrationStatus(str, Enum):
     ENROLLED = 'enrolled'
     WAITLISTED = 'waitlisted'
@@ -68,6 +88,25 @@ class AddClassRequest(BaseModel):
 class AddClassResponse(BaseModel):
     addClass_status: str
 
+class CatalogImportRow(BaseModel):
+    course_code: str
+    class_name: str
+    department: str
+    section_number: int
+    instructor_id: int
+    max_enrollment: int = Field(ge=1)
+
+class CatalogImportFailure(BaseModel):
+    line: int
+    error: str
+
+class CatalogImportResponse(BaseModel):
+    rows: int
+    imported: int
+    failures: List[CatalogImportFailure]
+    seconds: float
+    rows_per_second: float
+
 class DeleteSectionResponse(BaseModel):
     deleteSection_status: str
 
@@ -102,12 +141,15 @@ class EnrollmentListResponse(BaseModel):
 
 class RecordsEnrollmentResponse(BaseModel):
     enrolled_students: List[EnrollmentListResponse]
+    next_cursor: Optional[str] = None
 
 class RecordsDroppedResponse(BaseModel):
     dropped_students: List[EnrollmentListResponse]
+    next_cursor: Optional[str] = None
 
 class RecordsWaitlistResponse(BaseModel):
     waitlisted_students: List[EnrollmentListResponse]
+    next_cursor: Optional[str] = None
 
 class WaitlistPositionReq(BaseModel):
     # section_number: int
@@ -0,0 +1,159 @@
+"""Read path for the endpoints that never write.
+
+``GET /classes``, the waitlist views and the roster endpoints only read, but
+by default they share the main pool and executor with enrollments. A
+``ReadReplica`` gives them their own threads and connections, so reads scale
+independently of the writer.
+
+- ``READ_REPLICA=ro`` opens the same file read-only (``mode=ro``). In WAL
+  mode readers never block the writer and see every committed write, so
+  nothing gets staler than before.
+- ``READ_REPLICA=snapshot`` copies the database with the backup API into a
+  file that nothing writes, and readers open it immutable, with no locking
+  at all. A background task takes a new copy every
+  ``READ_SNAPSHOT_INTERVAL`` seconds and swaps the readers onto it. Once the
+  copy is older than ``READ_SNAPSHOT_MAX_AGE`` seconds (a refresh failing or
+  falling behind), reads go to the main pool until a refresh succeeds.
+  Snapshot reads never fill the shared caches, because a copy can predate
+  invalidations the cache tokens cannot see.
+"""
+
+import asyncio
+import os
+import sqlite3
+import tempfile
+from threading import Lock
+from time import monotonic
+from typing import Dict, Optional
+
+from loguru import logger
+
+from .database import (
+    AsyncDatabase,
+    ConnectionPool,
+    DEFAULT_PRAGMAS,
+    READ_PRAGMAS,
+    SnapshotConnection,
+    database,
+    read_only_url,
+)
+from .metrics import replica_reads
+from .settings import (
+    DATABASE_URL,
+    DB_POOL_TIMEOUT,
+    READ_POOL_SIZE,
+    READ_REPLICA,
+    READ_SNAPSHOT_DIR,
+    READ_SNAPSHOT_INTERVAL,
+    READ_SNAPSHOT_MAX_AGE,
+)
+
+REPLICA_MODES = ('off', 'ro', 'snapshot')
+
+
+class ReadReplica(AsyncDatabase):
+    """AsyncDatabase for read-only query functions, on its own executor and connections."""
+
+    def __init__(self, primary: AsyncDatabase, database_url: str, mode: str = READ_REPLICA, size: int = READ_POOL_SIZE,
+                 timeout: float = DB_POOL_TIMEOUT, max_age: float = READ_SNAPSHOT_MAX_AGE,
+                 snapshot_dir: str = READ_SNAPSHOT_DIR) -> None:
+        if mode not in REPLICA_MODES:
+            raise ValueError(f'READ_REPLICA must be one of {", ".join(REPLICA_MODES)}, not {mode!r}')
+        super().__init__(None, max_workers=size)
+        self.primary = primary
+        self.database_url = database_url
+        self.mode = mode
+        self.size = size
+        self.timeout = timeout
+        self.max_age = max_age
+        self.snapshot_dir = snapshot_dir
+        self.taken_at: Optional[float] = None
+        self._snapshot_path: Optional[str] = None
+        self._generation = 0
+        self._swap_lock = Lock()
+
+    @property
+    def started(self) -> bool:
+        return self.pool is not None
+
+    def start(self) -> None:
+        """Open the read-only connections, or take the first snapshot."""
+        if self.mode == 'ro':
+            self.pool = ConnectionPool(read_only_url(self.database_url), size=self.size, timeout=self.timeout,
+                                       pragmas=READ_PRAGMAS, uri=True, tag_writes=False)
+        elif self.mode == 'snapshot':
+            self.snapshot_dir = self.snapshot_dir or tempfile.mkdtemp(prefix='classes-snapshot-')
+            self.refresh()
+
+    def age(self) -> float:
+        """Seconds since the current snapshot was started; 0 for read-only connections to the live file."""
+        return 0.0 if self.taken_at is None else monotonic() - self.taken_at
+
+    def refresh(self) -> None:
+        """Copy the database into a new snapshot file and move the readers onto it."""
+        taken_at = monotonic()
+        self._generation += 1
+        path = os.path.join(self.snapshot_dir, f'snapshot-{self._generation}.db')
+        source = sqlite3.connect(self.database_url)
+        target = sqlite3.connect(path)
+        try:
+            for pragma in DEFAULT_PRAGMAS:
+                source.execute(pragma)
+            # One step: a single read transaction on the source, which in WAL mode never blocks the writer
+            source.backup(target)
+            # Readers open the copy immutable, which needs a rollback journal rather than WAL
+            target.execute("PRAGMA journal_mode = DELETE")
+        except Exception:
+            target.close()
+            os.remove(path)
+            raise
+        finally:
+            source.close()
+            target.close()
+        snapshot_pool = ConnectionPool(read_only_url(path, immutable=True), size=self.size, timeout=self.timeout,
+                                       pragmas=READ_PRAGMAS, uri=True, factory=SnapshotConnection, tag_writes=False)
+        with self._swap_lock:
+            old_pool, old_path = self.pool, self._snapshot_path
+            self.pool, self._snapshot_path, self.taken_at = snapshot_pool, path, taken_at
+        if old_pool is not None:
+            # Connections still in use are closed when they are released
+            old_pool.close()
+            os.remove(old_path)
+
+    def current_pool(self) -> ConnectionPool:
+        with self._swap_lock:
+            if self.taken_at is not None and monotonic() - self.taken_at > self.max_age:
+                replica_reads.inc('primary')
+                return self.primary.pool
+            replica_reads.inc(self.mode)
+            return self.pool
+
+    def stats(self) -> Dict[str, float]:
+        stats = super().stats()
+        stats['mode'] = self.mode
+        stats['age'] = self.age()
+        return stats
+
+    def close(self) -> None:
+        super().close()
+        if self._snapshot_path is not None and os.path.exists(self._snapshot_path):
+            os.remove(self._snapshot_path)
+
+
+async def refresh_snapshots(replica: ReadReplica, interval: float = READ_SNAPSHOT_INTERVAL) -> None:
+    """Take a new snapshot every ``interval`` seconds until cancelled."""
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await loop.run_in_executor(None, replica.refresh)
+        except (sqlite3.Error, OSError) as err:
+            logger.error(f'Read snapshot refresh failed, snapshot is {replica.age():.1f}s old: {err}')
+
+
+read_replica = ReadReplica(database, DATABASE_URL)
+
+
+def get_read_database() -> AsyncDatabase:
+    """FastAPI dependency for read-only endpoints: the read replica when it is running, else the main database."""
+    return read_replica if read_replica.started else database
@@ -0,0 +1,152 @@
+"""Reconciliation of Section enrollment counters with RegistrationList.
+
+Section.CurrentEnrollment and Section.Waitlist are maintained by the write
+paths. If one of them ever misses an update, eligibility decisions go wrong.
+This module recounts enrolled and waitlisted registrations in one GROUP BY per
+batch of sections and reports every section whose counters drifted. With
+``repair`` it rewrites those counters.
+
+Reading the counts takes no lock. A repair recomputes the counters inside its
+own UPDATE, in a short write transaction per batch, so a registration written
+in between is never lost. The batches can therefore run in the background
+while the API serves writes.
+
+    python -m api.reconcile               # report drift
+    python -m api.reconcile --repair      # report and repair drift
+"""
+
+import argparse
+import asyncio
+from sqlite3 import Connection
+from typing import List, NamedTuple, Optional, Tuple
+
+from loguru import logger
+
+from .cache import invalidate_section
+from .database import AsyncDatabase, ConnectionPool, DatabaseBusy, PoolTimeout, retry_on_busy
+from .database_query import DBException
+from .metrics import counter_repairs
+from .settings import DATABASE_URL, DB_POOL_TIMEOUT, RECONCILE_BATCH_SIZE, RECONCILE_INTERVAL
+from .statements import REPAIR_SECTION_COUNTERS, SELECT_SECTION_COUNTS, execute
+
+SectionKey = Tuple[str, int]
+
+
+class CounterDrift(NamedTuple):
+    course_code: str
+    section_number: int
+    current_enrollment: int
+    waitlist: int
+    enrolled: int
+    waitlisted: int
+
+
+class BatchResult(NamedTuple):
+    checked: int
+    drift: List[CounterDrift]
+    last: Optional[SectionKey]
+
+
+def find_drift(db_connection: Connection, after: Optional[SectionKey] = None, limit: int = -1) -> BatchResult:
+    """Check up to ``limit`` sections after ``after`` (every section by default) and return the drifted ones."""
+    keyset = after if after is not None else (None, None)
+    rows = execute(db_connection, SELECT_SECTION_COUNTS, keyset + (limit,)).fetchall()
+    drift = [CounterDrift(*row) for row in rows if row[2] != row[4] or row[3] != row[5]]
+    return BatchResult(checked = len(rows), drift = drift, last = (rows[-1][0], rows[-1][1]) if rows else None)
+
+
+@retry_on_busy
+def repair_drift(db_connection: Connection, drift: List[CounterDrift]) -> List[CounterDrift]:
+    """Recompute the counters of drifted sections and return them with the values written."""
+    repaired = []
+    cursor = db_connection.cursor()
+    cursor.execute("BEGIN IMMEDIATE")
+    try:
+        for section in drift:
+            row = execute(cursor, REPAIR_SECTION_COUNTERS, (section.course_code, section.section_number)).fetchone()
+            if row is not None:
+                repaired.append(section._replace(enrolled = row[0], waitlisted = row[1]))
+        cursor.execute("COMMIT")
+    except Exception as err:
+        logger.error(err)
+        cursor.execute("ROLLBACK")
+        logger.info('Rolling back transaction')
+        raise DBException(error_detail = 'Fail to repair section counters')
+    finally:
+        cursor.close()
+    for section in repaired:
+        invalidate_section(section.course_code, section.section_number)
+        if section.current_enrollment != section.enrolled:
+            counter_repairs.inc('CurrentEnrollment')
+        if section.waitlist != section.waitlisted:
+            counter_repairs.inc('Waitlist')
+        logger.warning(f'Repaired counters of {section.course_code} section {section.section_number}: '
+                       f'enrolled {section.current_enrollment} -> {section.enrolled}, '
+                       f'waitlist {section.waitlist} -> {section.waitlisted}')
+    return repaired
+
+
+def reconcile_batch(db_connection: Connection, after: Optional[SectionKey] = None, limit: int = -1,
+                    repair: bool = False) -> BatchResult:
+    """Check one batch of sections and, with ``repair``, fix the ones that drifted."""
+    result = find_drift(db_connection, after, limit)
+    if repair and result.drift:
+        result = result._replace(drift = repair_drift(db_connection, result.drift))
+    return result
+
+
+async def reconcile_in_background(db: AsyncDatabase, batch_size: int = RECONCILE_BATCH_SIZE,
+                                  interval: float = RECONCILE_INTERVAL) -> None:
+    """Sweep every section in batches, repairing drift, then wait ``interval`` seconds and sweep again."""
+    while True:
+        after = None
+        checked = 0
+        repaired = 0
+        while True:
+            try:
+                result = await db.run(reconcile_batch, after, batch_size, True)
+            except (DBException, DatabaseBusy, PoolTimeout) as err:
+                logger.error(f'Counter reconciliation batch failed: {err.error_detail}')
+                break
+            checked += result.checked
+            repaired += len(result.drift)
+            if result.checked < batch_size:
+                break
+            after = result.last
+            # Let queued requests run between batches
+            await asyncio.sleep(0)
+        logger.info(f'Counter reconciliation checked {checked} sections, repaired {repaired}')
+        await asyncio.sleep(interval)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Compare Section counters with RegistrationList and repair drift.')
+    parser.add_argument('--database', default=DATABASE_URL, help='SQLite database file')
+    parser.add_argument('--repair', action='store_true', help='rewrite the counters of drifted sections')
+    parser.add_argument('--batch-size', type=int, default=0, help='sections per batch; 0 checks every section in one pass')
+    args = parser.parse_args()
+
+    pool = ConnectionPool(args.database, size=1, timeout=DB_POOL_TIMEOUT)
+    checked = 0
+    drift: List[CounterDrift] = []
+    with pool.connection() as db_connection:
+        after = None
+        while True:
+            result = reconcile_batch(db_connection, after, args.batch_size or -1, args.repair)
+            checked += result.checked
+            drift += result.drift
+            if not args.batch_size or result.checked < args.batch_size:
+                break
+            after = result.last
+    pool.close()
+    for section in drift:
+        print(f'{section.course_code} section {section.section_number}: '
+              f'CurrentEnrollment {section.current_enrollment} vs {section.enrolled} enrolled, '
+              f'Waitlist {section.waitlist} vs {section.waitlisted} waitlisted')
+    print(f'{len(drift)} of {checked} sections drifted{", repaired" if args.repair and drift else ""}')
+    if drift and not args.repair:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,32 @@
+"""Pre-validated JSON responses for the fast serialization path.
+
+With ``FAST_RESPONSES`` on, list endpoints build their rows as plain dicts
+straight from the cursor and return a ``FastJSONResponse``, so FastAPI does not
+validate them against ``response_model`` and re-encode them. The rows come
+from typed columns and carry the same keys, in the same order, as the response
+models. orjson encodes them when it is installed; otherwise the stdlib encoder
+is used with the same compact output.
+"""
+
+import json
+from typing import Any
+
+from fastapi.responses import Response
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def dumps(content: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, ensure_ascii=False, separators=(',', ':')).encode()
+
+
+class FastJSONResponse(Response):
+    media_type = 'application/json'
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
@@ -0,0 +1,117 @@
+"""Runtime settings for the API, read from environment variables.
+
+Variables missing from the environment are taken from ``api/.env`` (or the
+file named by ``ENV_FILE``) when it sets them.
+"""
+
+import os
+
+
+def load_env_file(path: str) -> None:
+    """Set ``KEY=VALUE`` lines from ``path`` that the environment does not already set."""
+    if not os.path.exists(path):
+        return
+    with open(path) as env_file:
+        for line in env_file:
+            line = line.strip()
+            if not line or line.startswith('#') or '=' not in line:
+                continue
+            key, value = line.split('=', 1)
+            os.environ.setdefault(key.strip(), value.strip().strip('"\''))
+
+
+load_env_file(os.environ.get("ENV_FILE", os.path.join(os.path.dirname(__file__), ".env")))
+
+DATABASE_URL = os.environ.get("DATABASE_URL", "./api/share/classes.db")
+
+# Connection pool
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "8"))
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", "5"))
+DB_BUSY_TIMEOUT_MS = int(os.environ.get("DB_BUSY_TIMEOUT_MS", "5000"))
+# Storage profile applied to every connection: journal mode, synchronous level, page cache
+# (KiB), memory-mapped I/O (bytes), temp_store, and WAL pages written before SQLite
+# checkpoints on commit (0 leaves checkpoints to the background task below)
+DB_JOURNAL_MODE = os.environ.get("DB_JOURNAL_MODE", "WAL")
+DB_SYNCHRONOUS = os.environ.get("DB_SYNCHRONOUS", "NORMAL")
+DB_CACHE_SIZE_KB = int(os.environ.get("DB_CACHE_SIZE_KB", "65536"))
+DB_MMAP_SIZE = int(os.environ.get("DB_MMAP_SIZE", "268435456"))
+DB_TEMP_STORE = os.environ.get("DB_TEMP_STORE", "MEMORY")
+DB_WAL_AUTOCHECKPOINT = int(os.environ.get("DB_WAL_AUTOCHECKPOINT", "1000"))
+# Seconds between background WAL checkpoints (0 turns them off) and their mode
+DB_CHECKPOINT_INTERVAL = float(os.environ.get("DB_CHECKPOINT_INTERVAL", "0"))
+DB_CHECKPOINT_MODE = os.environ.get("DB_CHECKPOINT_MODE", "PASSIVE")
+# Compiled statements kept per connection; should cover every registered statement
+DB_STATEMENT_CACHE_SIZE = int(os.environ.get("DB_STATEMENT_CACHE_SIZE", "256"))
+
+# Threads that run blocking query functions off the event loop
+DB_EXECUTOR_WORKERS = int(os.environ.get("DB_EXECUTOR_WORKERS", str(DB_POOL_SIZE)))
+
+# Sections whose enrollment counters are cached in memory
+SECTION_CACHE_SIZE = int(os.environ.get("SECTION_CACHE_SIZE", "10000"))
+# Departments whose GET /classes response is cached as serialized JSON
+CATALOG_CACHE_SIZE = int(os.environ.get("CATALOG_CACHE_SIZE", "256"))
+# Users whose role is cached, and how long a cached role is trusted (seconds)
+ROLE_CACHE_SIZE = int(os.environ.get("ROLE_CACHE_SIZE", "50000"))
+ROLE_CACHE_TTL = float(os.environ.get("ROLE_CACHE_TTL", "300"))
+
+# Sections a student may register for in one POST /enrollment/batch
+ENROLLMENT_BATCH_MAX_SIZE = int(os.environ.get("ENROLLMENT_BATCH_MAX_SIZE", "12"))
+
+# Catalog rows written per transaction by the bulk import
+CATALOG_IMPORT_CHUNK_SIZE = int(os.environ.get("CATALOG_IMPORT_CHUNK_SIZE", "1000"))
+
+# Rows read per query when a roster is streamed as NDJSON
+ROSTER_STREAM_PAGE_SIZE = int(os.environ.get("ROSTER_STREAM_PAGE_SIZE", "500"))
+
+# Log sink: level, "json" or "text" records, and whether records are written by a background thread
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO")
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "json")
+LOG_ENQUEUE = os.environ.get("LOG_ENQUEUE", "1") == "1"
+# Share of records kept per level, e.g. "INFO=0.1,DEBUG=0.01"; unlisted levels keep everything
+LOG_SAMPLE_RATES = os.environ.get("LOG_SAMPLE_RATES", "")
+# Per-row debug records in query functions; off unless set, so large results skip them entirely
+LOG_ROWS = os.environ.get("LOG_ROWS", "0") == "1"
+
+# Build list responses as plain rows and encode them directly (orjson when installed), skipping response_model validation
+FAST_RESPONSES = os.environ.get("FAST_RESPONSES", "0") == "1"
+
+# Sections checked per batch by the counter reconciliation, and seconds between
+# background sweeps of every section (0 leaves the background sweep off)
+RECONCILE_BATCH_SIZE = int(os.environ.get("RECONCILE_BATCH_SIZE", "500"))
+RECONCILE_INTERVAL = float(os.environ.get("RECONCILE_INTERVAL", "0"))
+
+# Server worker processes started by `python -m api`
+WEB_WORKERS = int(os.environ.get("WEB_WORKERS", "1"))
+# Write transactions retried when SQLite still reports the database busy after busy_timeout,
+# starting after this many seconds and doubling each attempt
+DB_BUSY_RETRIES = int(os.environ.get("DB_BUSY_RETRIES", "3"))
+DB_BUSY_RETRY_DELAY = float(os.environ.get("DB_BUSY_RETRY_DELAY", "0.05"))
+# Seconds between checks of the change log for rows other processes changed (0 turns it off)
+CACHE_SYNC_INTERVAL = float(os.environ.get("CACHE_SYNC_INTERVAL", "0.1"))
+
+# Group commit: enrollments and drops queued by the endpoints are written by one
+# writer, up to WRITE_QUEUE_MAX_BATCH per transaction, waiting at most
+# WRITE_QUEUE_MAX_WAIT seconds for a batch to fill
+WRITE_QUEUE = os.environ.get("WRITE_QUEUE", "0") == "1"
+WRITE_QUEUE_MAX_BATCH = int(os.environ.get("WRITE_QUEUE_MAX_BATCH", "64"))
+WRITE_QUEUE_MAX_WAIT = float(os.environ.get("WRITE_QUEUE_MAX_WAIT", "0.002"))
+
+# Admission control for POST /enrollment and PUT /dropcourse: requests per second and burst
+# allowed per student and per section (a rate of 0 turns that limit off), and how many
+# students and sections are tracked
+ADMISSION_STUDENT_RATE = float(os.environ.get("ADMISSION_STUDENT_RATE", "0"))
+ADMISSION_STUDENT_BURST = float(os.environ.get("ADMISSION_STUDENT_BURST", "5"))
+ADMISSION_SECTION_RATE = float(os.environ.get("ADMISSION_SECTION_RATE", "0"))
+ADMISSION_SECTION_BURST = float(os.environ.get("ADMISSION_SECTION_BURST", "100"))
+ADMISSION_MAX_KEYS = int(os.environ.get("ADMISSION_MAX_KEYS", "100000"))
+
+# Read path for GET /classes, the waitlist views and the rosters: "off" reads through the
+# main pool, "ro" through read-only connections to the same file, "snapshot" through a copy
+# taken with the backup API every READ_SNAPSHOT_INTERVAL seconds. Snapshot reads fall back
+# to the main pool once the copy is older than READ_SNAPSHOT_MAX_AGE seconds.
+READ_REPLICA = os.environ.get("READ_REPLICA", "off")
+READ_POOL_SIZE = int(os.environ.get("READ_POOL_SIZE", str(DB_POOL_SIZE)))
+READ_SNAPSHOT_INTERVAL = float(os.environ.get("READ_SNAPSHOT_INTERVAL", "2"))
+READ_SNAPSHOT_MAX_AGE = float(os.environ.get("READ_SNAPSHOT_MAX_AGE", "10"))
+# Directory for snapshot files; empty uses a new temporary directory
+READ_SNAPSHOT_DIR = os.environ.get("READ_SNAPSHOT_DIR", "")
@@ -3,52 +3,7 @@
 PRAGMA foreign_keys=ON;
 BEGIN TRANSACTION;
 
--- Create the Users table
-DROP TABLE IF EXISTS Users;
-CREATE TABLE IF NOT EXISTS Users (
-    CWID INTEGER PRIMARY KEY AUTOINCREMENT,
-    Name TEXT NOT NULL,
-    Middle TEXT NULL,
-    LastName TEXT NOT NULL,
-    Role TEXT NOT NULL CHECK (role IN ('instructor', 'registrar', 'student'))
-);
-
--- Create the Class table
-DROP TABLE IF EXISTS Class;
-CREATE TABLE IF NOT EXISTS Class (
-    CourseCode TEXT PRIMARY KEY,
-    Name TEXT NOT NULL,
-    Department TEXT NOT NULL
-);
-
--- Create the Section table
-DROP TABLE IF EXISTS Section;
-CREATE TABLE IF NOT EXISTS Section (
-    SectionNumber INTEGER NOT NULL,
-    CourseCode TEXT NOT NULL,
-    InstructorID INTEGER NOT NULL,
-    CurrentEnrollment INTEGER NOT NULL,
-    MaxEnrollment INTEGER NOT NULL,
-    Waitlist INTEGER NOT NULL,
-    SectionStatus TEXT NOT NULL CHECK (SectionStatus IN ('open', 'closed')),
-    PRIMARY KEY (SectionNumber, CourseCode),
-    FOREIGN KEY (CourseCode) REFERENCES Class (CourseCode),
-    FOREIGN KEY (InstructorID) REFERENCES Users (CWID)
-);
-
-
--- Create the RegistrationList table
-DROP TABLE IF EXISTS RegistrationList;
-CREATE TABLE IF NOT EXISTS RegistrationList (
-    RecordID INTEGER PRIMARY KEY AUTOINCREMENT,
-    StudentID INTEGER NOT NULL,
-    CourseCode TEXT NOT NULL,
-    SectionNumber INTEGER NOT NULL,
-    EnrollmentDate DATETIME DEFAULT (CURRENT_TIMESTAMP),
-    Status TEXT NOT NULL CHECK (Status IN ('enrolled', 'waitlisted', 'dropped')),
-    FOREIGN KEY (StudentID) REFERENCES Users (CWID),
-    FOREIGN KEY (CourseCode, SectionNumber) REFERENCES Section (CourseCode, SectionNumber)
-);
+-- Schema lives in api/share/migrations and is applied by `python -m api.migrations`.
 
 -- pre populate database 
 -- chatGPT was used to generate some of the data
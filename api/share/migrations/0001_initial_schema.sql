@@ -0,0 +1,45 @@
+-- 0001_initial_schema.sql
+-- Tables as originally defined in classes.sql.
+
+-- Create the Users table
+CREATE TABLE IF NOT EXISTS Users (
+    CWID INTEGER PRIMARY KEY AUTOINCREMENT,
+    Name TEXT NOT NULL,
+    Middle TEXT NULL,
+    LastName TEXT NOT NULL,
+    Role TEXT NOT NULL CHECK (role IN ('instructor', 'registrar', 'student'))
+);
+
+-- Create the Class table
+CREATE TABLE IF NOT EXISTS Class (
+    CourseCode TEXT PRIMARY KEY,
+    Name TEXT NOT NULL,
+    Department TEXT NOT NULL
+);
+
+-- Create the Section table
+CREATE TABLE IF NOT EXISTS Section (
+    SectionNumber INTEGER NOT NULL,
+    CourseCode TEXT NOT NULL,
+    InstructorID INTEGER NOT NULL,
+    CurrentEnrollment INTEGER NOT NULL,
+    MaxEnrollment INTEGER NOT NULL,
+    Waitlist INTEGER NOT NULL,
+    SectionStatus TEXT NOT NULL CHECK (SectionStatus IN ('open', 'closed')),
+    PRIMARY KEY (SectionNumber, CourseCode),
+    FOREIGN KEY (CourseCode) REFERENCES Class (CourseCode),
+    FOREIGN KEY (InstructorID) REFERENCES Users (CWID)
+);
+
+
+-- Create the RegistrationList table
+CREATE TABLE IF NOT EXISTS RegistrationList (
+    RecordID INTEGER PRIMARY KEY AUTOINCREMENT,
+    StudentID INTEGER NOT NULL,
+    CourseCode TEXT NOT NULL,
+    SectionNumber INTEGER NOT NULL,
+    EnrollmentDate DATETIME DEFAULT (CURRENT_TIMESTAMP),
+    Status TEXT NOT NULL CHECK (Status IN ('enrolled', 'waitlisted', 'dropped')),
+    FOREIGN KEY (StudentID) REFERENCES Users (CWID),
+    FOREIGN KEY (CourseCode, SectionNumber) REFERENCES Section (CourseCode, SectionNumber)
+);
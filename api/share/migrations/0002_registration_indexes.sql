@@ -0,0 +1,29 @@
+-- 0002_registration_indexes.sql
+-- Indexes for the RegistrationList and Section access paths used in database_query.py.
+
+-- A student's own registrations: check_status_query, check_is_enrolled,
+-- update_student_registration_status, drop_student and get_waitlist_status.
+CREATE INDEX IF NOT EXISTS idx_registrationlist_student
+    ON RegistrationList (StudentID, CourseCode, SectionNumber, Status, EnrollmentDate);
+
+-- A section's registrations by status in enrollment order: get_waitlist,
+-- count_waitlist_registration and the instructor roster joins.
+CREATE INDEX IF NOT EXISTS idx_registrationlist_section_status
+    ON RegistrationList (CourseCode, SectionNumber, Status, EnrollmentDate, StudentID);
+
+-- Waitlisted rows only, in waitlist order per section: get_waitlist_status.
+CREATE INDEX IF NOT EXISTS idx_registrationlist_waitlisted
+    ON RegistrationList (CourseCode, SectionNumber, EnrollmentDate, StudentID)
+    WHERE Status = 'waitlisted';
+
+-- Sections of a course (the primary key leads with SectionNumber).
+CREATE INDEX IF NOT EXISTS idx_section_course
+    ON Section (CourseCode, SectionNumber);
+
+-- Instructor rosters filter sections by instructor.
+CREATE INDEX IF NOT EXISTS idx_section_instructor
+    ON Section (InstructorID, CourseCode, SectionNumber);
+
+-- Department catalog: get_available_classes.
+CREATE INDEX IF NOT EXISTS idx_class_department
+    ON Class (Department, CourseCode);
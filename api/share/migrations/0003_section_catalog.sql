@@ -0,0 +1,137 @@
+-- 0003_section_catalog.sql
+-- Denormalized catalog of sections for get_available_classes, kept in sync by triggers.
+
+-- One row per section whose class and instructor exist, clustered by department
+-- so a department's catalog is a single range scan of the table.
+CREATE TABLE IF NOT EXISTS SectionCatalog (
+    Department TEXT NOT NULL,
+    CourseCode TEXT NOT NULL,
+    SectionNumber INTEGER NOT NULL,
+    CourseName TEXT NOT NULL,
+    InstructorID INTEGER NOT NULL,
+    InstructorFirstName TEXT NOT NULL,
+    InstructorLastName TEXT NOT NULL,
+    CurrentEnrollment INTEGER NOT NULL,
+    MaxEnrollment INTEGER NOT NULL,
+    Waitlist INTEGER NOT NULL,
+    SectionStatus TEXT NOT NULL,
+    PRIMARY KEY (Department, CourseCode, SectionNumber)
+) WITHOUT ROWID;
+
+-- Triggers find the rows of a section, a class or an instructor through these.
+CREATE UNIQUE INDEX IF NOT EXISTS idx_sectioncatalog_section
+    ON SectionCatalog (CourseCode, SectionNumber);
+
+CREATE INDEX IF NOT EXISTS idx_sectioncatalog_instructor
+    ON SectionCatalog (InstructorID);
+
+INSERT INTO SectionCatalog
+    SELECT c.Department, s.CourseCode, s.SectionNumber, c.Name, s.InstructorID, u.Name, u.LastName,
+           s.CurrentEnrollment, s.MaxEnrollment, s.Waitlist, s.SectionStatus
+    FROM Section s
+    JOIN Class c ON c.CourseCode = s.CourseCode
+    JOIN Users u ON u.CWID = s.InstructorID;
+
+-- Section: enrollment counters and status are copied on every change; a new
+-- key or instructor rebuilds the row from the joined tables.
+CREATE TRIGGER IF NOT EXISTS section_catalog_section_insert AFTER INSERT ON Section
+BEGIN
+    INSERT OR REPLACE INTO SectionCatalog
+        SELECT c.Department, NEW.CourseCode, NEW.SectionNumber, c.Name, NEW.InstructorID, u.Name, u.LastName,
+               NEW.CurrentEnrollment, NEW.MaxEnrollment, NEW.Waitlist, NEW.SectionStatus
+        FROM Class c
+        JOIN Users u ON u.CWID = NEW.InstructorID
+        WHERE c.CourseCode = NEW.CourseCode;
+END;
+
+CREATE TRIGGER IF NOT EXISTS section_catalog_section_counters
+AFTER UPDATE OF CurrentEnrollment, MaxEnrollment, Waitlist, SectionStatus ON Section
+BEGIN
+    UPDATE SectionCatalog
+    SET CurrentEnrollment = NEW.CurrentEnrollment, MaxEnrollment = NEW.MaxEnrollment,
+        Waitlist = NEW.Waitlist, SectionStatus = NEW.SectionStatus
+    WHERE CourseCode = NEW.CourseCode AND SectionNumber = NEW.SectionNumber;
+END;
+
+CREATE TRIGGER IF NOT EXISTS section_catalog_section_key
+AFTER UPDATE OF CourseCode, SectionNumber, InstructorID ON Section
+BEGIN
+    DELETE FROM SectionCatalog WHERE CourseCode = OLD.CourseCode AND SectionNumber = OLD.SectionNumber;
+    INSERT OR REPLACE INTO SectionCatalog
+        SELECT c.Department, NEW.CourseCode, NEW.SectionNumber, c.Name, NEW.InstructorID, u.Name, u.LastName,
+               NEW.CurrentEnrollment, NEW.MaxEnrollment, NEW.Waitlist, NEW.SectionStatus
+        FROM Class c
+        JOIN Users u ON u.CWID = NEW.InstructorID
+        WHERE c.CourseCode = NEW.CourseCode;
+END;
+
+CREATE TRIGGER IF NOT EXISTS section_catalog_section_delete AFTER DELETE ON Section
+BEGIN
+    DELETE FROM SectionCatalog WHERE CourseCode = OLD.CourseCode AND SectionNumber = OLD.SectionNumber;
+END;
+
+-- Class: sections inserted before their class appear once it exists.
+CREATE TRIGGER IF NOT EXISTS section_catalog_class_insert AFTER INSERT ON Class
+BEGIN
+    INSERT OR REPLACE INTO SectionCatalog
+        SELECT NEW.Department, s.CourseCode, s.SectionNumber, NEW.Name, s.InstructorID, u.Name, u.LastName,
+               s.CurrentEnrollment, s.MaxEnrollment, s.Waitlist, s.SectionStatus
+        FROM Section s
+        JOIN Users u ON u.CWID = s.InstructorID
+        WHERE s.CourseCode = NEW.CourseCode;
+END;
+
+CREATE TRIGGER IF NOT EXISTS section_catalog_class_update AFTER UPDATE OF Name, Department ON Class
+BEGIN
+    UPDATE SectionCatalog SET CourseName = NEW.Name, Department = NEW.Department
+    WHERE CourseCode = NEW.CourseCode;
+END;
+
+CREATE TRIGGER IF NOT EXISTS section_catalog_class_key AFTER UPDATE OF CourseCode ON Class
+BEGIN
+    DELETE FROM SectionCatalog WHERE CourseCode = OLD.CourseCode;
+    INSERT OR REPLACE INTO SectionCatalog
+        SELECT NEW.Department, s.CourseCode, s.SectionNumber, NEW.Name, s.InstructorID, u.Name, u.LastName,
+               s.CurrentEnrollment, s.MaxEnrollment, s.Waitlist, s.SectionStatus
+        FROM Section s
+        JOIN Users u ON u.CWID = s.InstructorID
+        WHERE s.CourseCode = NEW.CourseCode;
+END;
+
+CREATE TRIGGER IF NOT EXISTS section_catalog_class_delete AFTER DELETE ON Class
+BEGIN
+    DELETE FROM SectionCatalog WHERE CourseCode = OLD.CourseCode;
+END;
+
+-- Users: instructor names are copied onto every section they teach.
+CREATE TRIGGER IF NOT EXISTS section_catalog_user_insert AFTER INSERT ON Users
+BEGIN
+    INSERT OR REPLACE INTO SectionCatalog
+        SELECT c.Department, s.CourseCode, s.SectionNumber, c.Name, NEW.CWID, NEW.Name, NEW.LastName,
+               s.CurrentEnrollment, s.MaxEnrollment, s.Waitlist, s.SectionStatus
+        FROM Section s
+        JOIN Class c ON c.CourseCode = s.CourseCode
+        WHERE s.InstructorID = NEW.CWID;
+END;
+
+CREATE TRIGGER IF NOT EXISTS section_catalog_user_update AFTER UPDATE OF Name, LastName ON Users
+BEGIN
+    UPDATE SectionCatalog SET InstructorFirstName = NEW.Name, InstructorLastName = NEW.LastName
+    WHERE InstructorID = NEW.CWID;
+END;
+
+CREATE TRIGGER IF NOT EXISTS section_catalog_user_key AFTER UPDATE OF CWID ON Users
+BEGIN
+    DELETE FROM SectionCatalog WHERE InstructorID = OLD.CWID;
+    INSERT OR REPLACE INTO SectionCatalog
+        SELECT c.Department, s.CourseCode, s.SectionNumber, c.Name, NEW.CWID, NEW.Name, NEW.LastName,
+               s.CurrentEnrollment, s.MaxEnrollment, s.Waitlist, s.SectionStatus
+        FROM Section s
+        JOIN Class c ON c.CourseCode = s.CourseCode
+        WHERE s.InstructorID = NEW.CWID;
+END;
+
+CREATE TRIGGER IF NOT EXISTS section_catalog_user_delete AFTER DELETE ON Users
+BEGIN
+    DELETE FROM SectionCatalog WHERE InstructorID = OLD.CWID;
+END;
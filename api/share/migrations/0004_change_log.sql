@@ -0,0 +1,60 @@
+-- 0004_change_log.sql
+-- Rows changed in the tables the API caches, so every worker process can
+-- invalidate its in-memory caches (api/cache_sync.py).
+
+-- Kind is 'section' (CourseCode, SectionNumber), 'class' (CourseCode) or 'user' (CWID).
+-- Seq only grows: commits are serialized and the newest row is never pruned.
+CREATE TABLE IF NOT EXISTS ChangeLog (
+    Seq INTEGER PRIMARY KEY,
+    Kind TEXT NOT NULL,
+    CourseCode TEXT NULL,
+    SectionNumber INTEGER NULL,
+    CWID INTEGER NULL
+);
+
+-- Keep the last 10000 changes; a worker that falls further behind clears its caches.
+CREATE TRIGGER IF NOT EXISTS change_log_prune AFTER INSERT ON ChangeLog
+BEGIN
+    DELETE FROM ChangeLog WHERE Seq <= NEW.Seq - 10000;
+END;
+
+CREATE TRIGGER IF NOT EXISTS change_log_section_insert AFTER INSERT ON Section
+BEGIN
+    INSERT INTO ChangeLog (Kind, CourseCode, SectionNumber) VALUES ('section', NEW.CourseCode, NEW.SectionNumber);
+END;
+
+CREATE TRIGGER IF NOT EXISTS change_log_section_update AFTER UPDATE ON Section
+BEGIN
+    INSERT INTO ChangeLog (Kind, CourseCode, SectionNumber) VALUES ('section', NEW.CourseCode, NEW.SectionNumber);
+END;
+
+CREATE TRIGGER IF NOT EXISTS change_log_section_delete AFTER DELETE ON Section
+BEGIN
+    INSERT INTO ChangeLog (Kind, CourseCode, SectionNumber) VALUES ('section', OLD.CourseCode, OLD.SectionNumber);
+END;
+
+CREATE TRIGGER IF NOT EXISTS change_log_class_insert AFTER INSERT ON Class
+BEGIN
+    INSERT INTO ChangeLog (Kind, CourseCode) VALUES ('class', NEW.CourseCode);
+END;
+
+CREATE TRIGGER IF NOT EXISTS change_log_class_update AFTER UPDATE ON Class
+BEGIN
+    INSERT INTO ChangeLog (Kind, CourseCode) VALUES ('class', NEW.CourseCode);
+END;
+
+CREATE TRIGGER IF NOT EXISTS change_log_class_delete AFTER DELETE ON Class
+BEGIN
+    INSERT INTO ChangeLog (Kind, CourseCode) VALUES ('class', OLD.CourseCode);
+END;
+
+-- New users need no entry: an unknown CWID is never cached.
+CREATE TRIGGER IF NOT EXISTS change_log_user_update AFTER UPDATE ON Users
+BEGIN
+    INSERT INTO ChangeLog (Kind, CWID) VALUES ('user', OLD.CWID);
+END;
+
+CREATE TRIGGER IF NOT EXISTS change_log_user_delete AFTER DELETE ON Users
+BEGIN
+    INSERT INTO ChangeLog (Kind, CWID) VALUES ('user', OLD.CWID);
+END;
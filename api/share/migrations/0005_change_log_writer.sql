@@ -0,0 +1,6 @@
+-- 0005_change_log_writer.sql
+-- The process that wrote each ChangeLog row, so a worker skips its own changes
+-- (its caches already saw them). Pooled connections fill it in with a TEMP
+-- trigger (database.tag_change_log); rows from any other connection stay NULL
+-- and every worker applies them.
+ALTER TABLE ChangeLog ADD COLUMN Writer TEXT NULL;
@@ -0,0 +1,402 @@
+"""Registry of the named, parameterized SQL statements run by database_query.py.
+
+Every statement is a module constant with ``?`` placeholders, so its text is
+identical on every call and sqlite3's per-connection statement cache reuses the
+compiled statement instead of parsing it again. ``execute`` runs a registered
+statement and records how often and how long it ran, and whether its compiled
+form was still in that cache.
+"""
+
+from collections import OrderedDict
+from dataclasses import dataclass
+import re
+from sqlite3 import Connection, Cursor
+from threading import Lock
+from time import perf_counter
+from typing import Dict, Iterable, Optional, Sequence, Union
+
+NUMBERED_PARAMETER = re.compile(r'\?(\d+)')
+
+
+@dataclass(frozen=True)
+class Statement:
+    name: str
+    sql: str
+
+    @property
+    def parameter_count(self) -> int:
+        numbered = [int(number) for number in NUMBERED_PARAMETER.findall(self.sql)]
+        return max(numbered) if numbered else self.sql.count('?')
+
+
+class StatementStats:
+    """Execution count, cumulative latency, rows changed and statement cache hits per statement name."""
+
+    def __init__(self) -> None:
+        self._lock = Lock()
+        self._calls: Dict[str, int] = {}
+        self._seconds: Dict[str, float] = {}
+        self._errors: Dict[str, int] = {}
+        self._rows: Dict[str, int] = {}
+        self._cache_hits: Dict[str, int] = {}
+        self._cache_misses: Dict[str, int] = {}
+
+    def record(self, name: str, seconds: float, failed: bool = False, rows: int = -1,
+               cache_hit: Optional[bool] = None) -> None:
+        with self._lock:
+            self._calls[name] = self._calls.get(name, 0) + 1
+            self._seconds[name] = self._seconds.get(name, 0.0) + seconds
+            if failed:
+                self._errors[name] = self._errors.get(name, 0) + 1
+            if rows > 0:
+                self._rows[name] = self._rows.get(name, 0) + rows
+            if cache_hit is not None:
+                counts = self._cache_hits if cache_hit else self._cache_misses
+                counts[name] = counts.get(name, 0) + 1
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            return {name: {'calls': calls,
+                           'seconds': self._seconds[name],
+                           'errors': self._errors.get(name, 0),
+                           'rows': self._rows.get(name, 0),
+                           'cache_hits': self._cache_hits.get(name, 0),
+                           'cache_misses': self._cache_misses.get(name, 0)}
+                    for name, calls in self._calls.items()}
+
+
+class StatementCacheModel:
+    """Mirror of sqlite3's per-connection statement cache, used to count its hits.
+
+    sqlite3 keeps the last ``cached_statements`` distinct SQL texts each
+    connection ran, compiled, in an LRU, but exposes no hit counter. Pooled
+    connections are tracked here with the same size and the same LRU order, so
+    an execution is a hit when its text is among them. Connections that are not
+    tracked (command-line tools) are not counted.
+    """
+
+    def __init__(self) -> None:
+        self._lock = Lock()
+        self._connections: Dict[int, OrderedDict] = {}
+        self._sizes: Dict[int, int] = {}
+
+    def track(self, connection: Connection, size: int) -> None:
+        with self._lock:
+            self._connections[id(connection)] = OrderedDict()
+            self._sizes[id(connection)] = size
+
+    def forget(self, connection: Connection) -> None:
+        with self._lock:
+            self._connections.pop(id(connection), None)
+            self._sizes.pop(id(connection), None)
+
+    def lookup(self, db_connection: Union[Connection, Cursor], sql: str) -> Optional[bool]:
+        """Record that ``sql`` ran on the connection; True if it was cached, None if the connection is not tracked."""
+        key = id(getattr(db_connection, 'connection', db_connection))
+        with self._lock:
+            texts = self._connections.get(key)
+            if texts is None:
+                return None
+            if sql in texts:
+                texts.move_to_end(sql)
+                return True
+            texts[sql] = None
+            if len(texts) > self._sizes[key]:
+                texts.popitem(last=False)
+            return False
+
+
+STATEMENTS: Dict[str, Statement] = {}
+statement_stats = StatementStats()
+statement_cache = StatementCacheModel()
+
+
+def register(name: str, sql: str) -> Statement:
+    if name in STATEMENTS:
+        raise ValueError(f'Statement {name} is already registered')
+    statement = Statement(name=name, sql=sql)
+    STATEMENTS[name] = statement
+    return statement
+
+
+def execute(db_connection: Union[Connection, Cursor], statement: Statement, parameters: Sequence = ()) -> Cursor:
+    """Run a registered statement on a connection or cursor and time it."""
+    cache_hit = statement_cache.lookup(db_connection, statement.sql)
+    start = perf_counter()
+    try:
+        cursor = db_connection.execute(statement.sql, parameters)
+    except Exception:
+        statement_stats.record(statement.name, perf_counter() - start, failed=True, cache_hit=cache_hit)
+        raise
+    # rowcount is the number of rows changed by DML and -1 for queries; a statement
+    # with RETURNING only sets it once its rows are fetched, so it records none here
+    statement_stats.record(statement.name, perf_counter() - start, rows=cursor.rowcount, cache_hit=cache_hit)
+    return cursor
+
+
+def execute_many(db_connection: Union[Connection, Cursor], statement: Statement, parameters: Iterable[Sequence]) -> Cursor:
+    """Run a registered statement once per parameter row with ``executemany`` and time the batch."""
+    cache_hit = statement_cache.lookup(db_connection, statement.sql)
+    start = perf_counter()
+    try:
+        cursor = db_connection.executemany(statement.sql, parameters)
+    except Exception:
+        statement_stats.record(statement.name, perf_counter() - start, failed=True, cache_hit=cache_hit)
+        raise
+    # rowcount is the number of rows changed by DML and -1 for queries
+    statement_stats.record(statement.name, perf_counter() - start, rows=cursor.rowcount, cache_hit=cache_hit)
+    return cursor
+
+
+##########   CATALOG     ######################
+# SectionCatalog is kept in sync with Class, Section and Users by triggers
+# (migration 0003) and clustered by department, so this is one range scan.
+LIST_AVAILABLE_CLASSES = register('list_available_classes', """
+    SELECT CourseName, CourseCode, Department, CurrentEnrollment, Waitlist, MaxEnrollment,
+        SectionNumber, InstructorFirstName, InstructorLastName
+    FROM SectionCatalog
+    WHERE Department = ?
+    ORDER BY CourseCode, SectionNumber
+""")
+
+##########   USERS     ######################
+SELECT_USER_ROLE = register('select_user_role', """
+    SELECT role FROM Users where CWID = ?
+""")
+# Which CWIDs in a JSON array belong to instructors
+SELECT_INSTRUCTORS_AMONG = register('select_instructors_among', """
+    SELECT CWID FROM Users WHERE CWID IN (SELECT value FROM json_each(?)) AND Role = 'instructor'
+""")
+
+##########   SECTIONS     ######################
+SELECT_SECTION_CAPACITY = register('select_section_capacity', """
+    SELECT CurrentEnrollment as 'current_enrollment', MaxEnrollment as 'max_enrollment', Waitlist as 'waitlist'
+    FROM "Section" WHERE CourseCode = ? and SectionNumber = ?
+""")
+SELECT_SECTION_INSTRUCTOR = register('select_section_instructor', """
+    SELECT InstructorID FROM Section WHERE CourseCode = ? AND SectionNumber = ?
+""")
+SELECT_CLASS_EXISTS = register('select_class_exists', """
+    SELECT CourseCode FROM Class where CourseCode = ?
+""")
+SELECT_SECTION_EXISTS = register('select_section_exists', """
+    SELECT SectionNumber FROM Section where CourseCode = ? and SectionNumber = ?
+""")
+INSERT_CLASS = register('insert_class', """
+    INSERT INTO Class (CourseCode, Name, Department) VALUES (?, ?, ?)
+""")
+# Bulk catalog import: insert or update in place, keeping a section's counters.
+# A section is left unchanged (no row counted) if its new capacity is below its enrollment.
+UPSERT_CLASS = register('upsert_class', """
+    INSERT INTO Class (CourseCode, Name, Department) VALUES (?, ?, ?)
+    ON CONFLICT (CourseCode) DO UPDATE SET Name = excluded.Name, Department = excluded.Department
+""")
+UPSERT_SECTION = register('upsert_section', """
+    INSERT INTO Section (SectionNumber, CourseCode, InstructorID, MaxEnrollment, CurrentEnrollment, Waitlist, SectionStatus)
+    VALUES (?, ?, ?, ?, 0, 0, 'open')
+    ON CONFLICT (SectionNumber, CourseCode) DO UPDATE SET InstructorID = excluded.InstructorID, MaxEnrollment = excluded.MaxEnrollment
+        WHERE excluded.MaxEnrollment >= Section.CurrentEnrollment
+""")
+INSERT_SECTION = register('insert_section', """
+    INSERT INTO Section (SectionNumber, CourseCode, InstructorID, MaxEnrollment, CurrentEnrollment, Waitlist, SectionStatus)
+    VALUES (?, ?, ?, ?, 0, 0, 'open')
+""")
+DELETE_SECTION = register('delete_section', """
+    DELETE FROM Section WHERE CourseCode = ? and SectionNumber = ?
+""")
+UPDATE_SECTION_INSTRUCTOR = register('update_section_instructor', """
+    UPDATE Section SET InstructorID = ? WHERE SectionNumber = ? and CourseCode = ?
+""")
+UPDATE_SECTION_CLOSED = register('update_section_closed', """
+    UPDATE Section SET SectionStatus = 'closed' WHERE SectionNumber = ? and CourseCode = ?
+""")
+INCREMENT_CURRENT_ENROLLMENT = register('increment_current_enrollment', """
+    UPDATE "Section" SET CurrentEnrollment = CurrentEnrollment + 1 WHERE SectionNumber = ? and CourseCode = ?
+""")
+DECREMENT_CURRENT_ENROLLMENT = register('decrement_current_enrollment', """
+    UPDATE "Section" SET CurrentEnrollment = CurrentEnrollment - 1 WHERE SectionNumber = ? and CourseCode = ?
+""")
+INCREMENT_WAITLIST = register('increment_waitlist', """
+    UPDATE "Section" SET Waitlist = Waitlist + 1 WHERE SectionNumber = ? and CourseCode = ?
+""")
+DECREMENT_WAITLIST = register('decrement_waitlist', """
+    UPDATE "Section" SET Waitlist = Waitlist - 1 WHERE SectionNumber = ? and CourseCode = ?
+""")
+# Conditional claims used by the enrollment transaction: they only match while
+# the section still has room, so two concurrent enrollments can never take the same seat.
+CLAIM_SEAT = register('claim_seat', """
+    UPDATE "Section" SET CurrentEnrollment = CurrentEnrollment + 1
+    WHERE SectionNumber = ? and CourseCode = ? and CurrentEnrollment < MaxEnrollment
+    RETURNING CurrentEnrollment, MaxEnrollment, Waitlist
+""")
+CLAIM_WAITLIST_SPOT = register('claim_waitlist_spot', """
+    UPDATE "Section" SET Waitlist = Waitlist + 1
+    WHERE SectionNumber = ? and CourseCode = ? and Waitlist <= ?
+    RETURNING CurrentEnrollment, MaxEnrollment, Waitlist
+""")
+# Counter side of a waitlist promotion: one waitlisted student takes a seat.
+PROMOTE_SECTION_COUNTERS = register('promote_section_counters', """
+    UPDATE "Section" SET CurrentEnrollment = CurrentEnrollment + 1, Waitlist = Waitlist - 1
+    WHERE SectionNumber = ? and CourseCode = ?
+""")
+
+##########   REGISTRATIONS     ######################
+SELECT_REGISTRATION_STATUS = register('select_registration_status', """
+    SELECT Status, EnrollmentDate FROM RegistrationList where StudentID = ? and SectionNumber = ? and CourseCode = ?
+""")
+SELECT_ACTIVE_REGISTRATION = register('select_active_registration', """
+    SELECT Status, EnrollmentDate FROM RegistrationList
+    where StudentID = ? and SectionNumber = ? and CourseCode = ? and Status IN ('enrolled', 'waitlisted')
+""")
+INSERT_REGISTRATION = register('insert_registration', """
+    INSERT INTO RegistrationList (StudentID, CourseCode, SectionNumber, Status) VALUES (?, ?, ?, ?)
+""")
+UPDATE_REGISTRATION_DROPPED = register('update_registration_dropped', """
+    UPDATE RegistrationList SET Status = 'dropped' where StudentID = ? and SectionNumber = ? and CourseCode = ? and Status = ?
+""")
+# Enrolls the head of a section's waitlist while the section has a free seat.
+# ?1 course code, ?2 section number; returns the promoted student.
+PROMOTE_WAITLIST_HEAD = register('promote_waitlist_head', """
+    UPDATE RegistrationList SET Status = 'enrolled'
+    WHERE RecordID = (
+        SELECT waitlisted.RecordID
+        FROM RegistrationList waitlisted
+        JOIN Section ON Section.CourseCode = waitlisted.CourseCode AND Section.SectionNumber = waitlisted.SectionNumber
+        WHERE waitlisted.CourseCode = ?1
+            AND waitlisted.SectionNumber = ?2
+            AND waitlisted.Status = 'waitlisted'
+            AND Section.CurrentEnrollment < Section.MaxEnrollment
+        ORDER BY waitlisted.EnrollmentDate, waitlisted.RecordID
+        LIMIT 1)
+    RETURNING StudentID
+""")
+# Counters and the student's active registration for every section in a cart.
+# ?1 student, ?2 JSON array of [course_code, section_number] pairs; Item is the pair's index.
+SELECT_CART_STATE = register('select_cart_state', """
+    WITH cart(Item, CourseCode, SectionNumber) AS (
+        SELECT key, json_extract(value, '$[0]'), json_extract(value, '$[1]') FROM json_each(?2))
+    SELECT cart.Item, Section.CurrentEnrollment, Section.MaxEnrollment, Section.Waitlist,
+        RegistrationList.Status, RegistrationList.EnrollmentDate
+    FROM cart
+    LEFT JOIN Section ON Section.CourseCode = cart.CourseCode AND Section.SectionNumber = cart.SectionNumber
+    LEFT JOIN RegistrationList ON RegistrationList.StudentID = ?1
+        AND RegistrationList.CourseCode = cart.CourseCode
+        AND RegistrationList.SectionNumber = cart.SectionNumber
+        AND RegistrationList.Status IN ('enrolled', 'waitlisted')
+""")
+
+##########   WAITLIST     ######################
+# A waitlist is ordered by (EnrollmentDate, RecordID). A student's position is
+# one plus the waitlisted rows ahead of theirs, counted on the section's index
+# range, so the cost is bounded by the waitlist cap rather than the table size.
+SELECT_WAITLIST_POSITIONS = register('select_waitlist_positions', """
+    SELECT
+        (SELECT COUNT(*) FROM RegistrationList ahead
+         WHERE ahead.CourseCode = mine.CourseCode
+            AND ahead.SectionNumber = mine.SectionNumber
+            AND ahead.Status = 'waitlisted'
+            AND (ahead.EnrollmentDate, ahead.RecordID) <= (mine.EnrollmentDate, mine.RecordID)) AS Position,
+        mine.CourseCode,
+        mine.SectionNumber
+    FROM
+        RegistrationList mine
+    WHERE
+        mine.StudentID = ?
+        AND mine.Status = 'waitlisted'
+    ORDER BY mine.CourseCode, mine.SectionNumber
+""")
+SELECT_SECTION_WAITLIST = register('select_section_waitlist', """
+    SELECT
+        r.StudentID,
+        u.Name AS StudentName,
+        r.EnrollmentDate,
+        r.Status
+    FROM
+        RegistrationList r
+    JOIN
+        Users u ON r.StudentID = u.CWID
+    WHERE
+        r.CourseCode = ?
+        AND r.SectionNumber = ?
+        AND r.Status = 'waitlisted'
+    ORDER BY
+        r.EnrollmentDate, r.RecordID
+""")
+
+##########   INSTRUCTOR ROSTERS     ######################
+# ?1 instructor, ?2 registration status, ?3 course code, ?4 section number (each only where the
+# variant filters on it), ?5-?9 keyset of the last row already returned, ?10 page size (-1 for no limit).
+# There is one statement per filter rather than optional "?3 IS NULL OR ..." terms, which stop the
+# planner from reading sections in idx_section_instructor order and sort the whole roster instead.
+# CROSS JOIN keeps Section as the outer loop, so only each section's students are sorted by name.
+ROSTER_SQL = """
+    SELECT
+        Users.CWID AS StudentCWID,
+        Users.Name AS StudentFirstName,
+        Users.LastName AS StudentLastName,
+        Section.CourseCode AS CourseCode,
+        Section.SectionNumber AS SectionNumber,
+        Class.Name AS ClassName,
+        RegistrationList.Status AS Status
+    FROM
+        Section
+        CROSS JOIN RegistrationList ON RegistrationList.CourseCode = Section.CourseCode AND RegistrationList.SectionNumber = Section.SectionNumber
+        JOIN Class ON Section.CourseCode = Class.CourseCode
+        JOIN Users ON RegistrationList.StudentID = Users.CWID
+    WHERE
+        Section.InstructorID = ?1
+        AND RegistrationList.Status = ?2{filters}
+        AND (Section.CourseCode, Section.SectionNumber, Users.LastName, Users.Name, Users.CWID) > (?5, ?6, ?7, ?8, ?9)
+    ORDER BY Section.CourseCode, Section.SectionNumber, Users.LastName, Users.Name, Users.CWID
+    LIMIT ?10
+"""
+SELECT_INSTRUCTOR_ROSTER = register('select_instructor_roster', ROSTER_SQL.format(filters=''))
+SELECT_INSTRUCTOR_COURSE_ROSTER = register('select_instructor_course_roster', ROSTER_SQL.format(filters="""
+        AND Section.CourseCode = ?3"""))
+SELECT_INSTRUCTOR_SECTION_NUMBER_ROSTER = register('select_instructor_section_number_roster', ROSTER_SQL.format(filters="""
+        AND Section.SectionNumber = ?4"""))
+SELECT_INSTRUCTOR_SECTION_ROSTER = register('select_instructor_section_roster', ROSTER_SQL.format(filters="""
+        AND Section.CourseCode = ?3
+        AND Section.SectionNumber = ?4"""))
+
+
+##########   COUNTER RECONCILIATION     ######################
+# ?1, ?2 optional keyset of the last section already checked, ?3 batch size (-1 for every section).
+# Each section's counters next to its enrolled and waitlisted registrations, in one GROUP BY.
+SELECT_SECTION_COUNTS = register('select_section_counts', """
+    WITH batch AS (
+        SELECT CourseCode, SectionNumber, CurrentEnrollment, Waitlist
+        FROM Section
+        WHERE ?1 IS NULL OR (CourseCode, SectionNumber) > (?1, ?2)
+        ORDER BY CourseCode, SectionNumber
+        LIMIT ?3
+    )
+    SELECT batch.CourseCode, batch.SectionNumber, batch.CurrentEnrollment, batch.Waitlist,
+        COUNT(CASE WHEN RegistrationList.Status = 'enrolled' THEN 1 END) AS Enrolled,
+        COUNT(CASE WHEN RegistrationList.Status = 'waitlisted' THEN 1 END) AS Waitlisted
+    FROM batch
+    LEFT JOIN RegistrationList ON RegistrationList.CourseCode = batch.CourseCode
+        AND RegistrationList.SectionNumber = batch.SectionNumber
+        AND RegistrationList.Status IN ('enrolled', 'waitlisted')
+    GROUP BY batch.CourseCode, batch.SectionNumber
+    ORDER BY batch.CourseCode, batch.SectionNumber
+""")
+# ?1 course code, ?2 section number. Recomputes both counters in the statement
+# itself, so a registration written after the counts were read is still included.
+REPAIR_SECTION_COUNTERS = register('repair_section_counters', """
+    UPDATE Section SET
+        CurrentEnrollment = (SELECT COUNT(*) FROM RegistrationList
+                             WHERE CourseCode = ?1 AND SectionNumber = ?2 AND Status = 'enrolled'),
+        Waitlist = (SELECT COUNT(*) FROM RegistrationList
+                    WHERE CourseCode = ?1 AND SectionNumber = ?2 AND Status = 'waitlisted')
+    WHERE CourseCode = ?1 AND SectionNumber = ?2
+    RETURNING CurrentEnrollment, Waitlist
+""")
+
+##########   CHANGE LOG     ######################
+SELECT_CHANGE_LOG_HEAD = register('select_change_log_head', """
+    SELECT MAX(Seq) FROM ChangeLog
+""")
+SELECT_CHANGES_SINCE = register('select_changes_since', """
+    SELECT Seq, Kind, CourseCode, SectionNumber, CWID, Writer FROM ChangeLog WHERE Seq > ? ORDER BY Seq
+""")
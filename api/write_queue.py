@@ -0,0 +1,158 @@
+"""Single-writer queue that group-commits enrollments and drops.
+
+At registration open many requests want SQLite's one write lock at the same
+moment. Each would otherwise run its own BEGIN IMMEDIATE/COMMIT and wait on
+busy_timeout for the others. With ``WRITE_QUEUE`` on, the endpoints queue the
+operation instead. One writer task takes everything queued, up to
+``WRITE_QUEUE_MAX_BATCH`` operations after waiting at most
+``WRITE_QUEUE_MAX_WAIT`` seconds for more, and runs it as one transaction.
+
+Every operation runs under its own savepoint, so one that fails (an unknown
+section, a student without the role) is rolled back alone and only its caller
+gets the error. The others are committed together, and every caller gets its
+own result.
+"""
+
+import asyncio
+import sqlite3
+from typing import Any, Callable, List, NamedTuple, Optional, Tuple
+
+from fastapi import HTTPException
+from loguru import logger
+
+from .cache import catalog_cache, invalidate_section, section_cache, section_key
+from .database import AsyncDatabase, database, retry_on_busy
+from .database_query import DBException, drop_course_step, drop_student_step, enroll_step
+from .metrics import write_batch_size
+from .models import DropStudentRequest, EnrollmentRequest, EnrollmentResponse, Registration, RegistrationStatus
+from .settings import WRITE_QUEUE_MAX_BATCH, WRITE_QUEUE_MAX_WAIT
+
+
+class WriteOperation(NamedTuple):
+    step: Callable
+    request: Any
+    course_code: str
+    section_number: int
+
+
+@retry_on_busy
+def run_write_batch(db_connection: sqlite3.Connection, operations: List[WriteOperation]) -> List[Any]:
+    """Run the operations in one transaction, each under a savepoint; returns a result or exception per operation."""
+    outcomes: List[Any] = []
+    puts: List[Tuple[tuple, Any]] = []
+    cursor = db_connection.cursor()
+    cursor.execute("BEGIN IMMEDIATE")
+    token = section_cache.token()
+    try:
+        for operation in operations:
+            cursor.execute("SAVEPOINT write_operation")
+            try:
+                outcome = operation.step(cursor, operation.request)
+            except (HTTPException, sqlite3.Error) as err:
+                cursor.execute("ROLLBACK TO write_operation")
+                if isinstance(err, sqlite3.Error):
+                    logger.error(err)
+                    err = DBException(error_detail = 'Fail to write')
+                outcome = err
+            cursor.execute("RELEASE write_operation")
+            if operation.step is enroll_step and not isinstance(outcome, Exception):
+                outcome, state = outcome
+                if state is not None:
+                    puts.append((section_key(operation.course_code, operation.section_number), state))
+            outcomes.append(outcome)
+        cursor.execute("COMMIT")
+    except Exception as err:
+        logger.error(err)
+        cursor.execute("ROLLBACK")
+        logger.info('Rolling back transaction')
+        raise DBException(error_detail = 'Fail to write')
+    finally:
+        cursor.close()
+    # The token was taken under the write lock, so every put stores unless another thread invalidated since.
+    # Puts go first: a section that was also dropped in this batch is then invalidated after its put.
+    for key, state in puts:
+        section_cache.put(key, state, token)
+    for operation, outcome in zip(operations, outcomes):
+        if operation.step is enroll_step:
+            if isinstance(outcome, EnrollmentResponse) and outcome.enrollment_status in (RegistrationStatus.ENROLLED,
+                                                                                          RegistrationStatus.WAITLISTED):
+                catalog_cache.invalidate_course(operation.course_code)
+        else:
+            invalidate_section(operation.course_code, operation.section_number)
+    return outcomes
+
+
+class WriteQueue:
+    """Queues write operations from the event loop and group-commits them on one writer task."""
+
+    def __init__(self, db: AsyncDatabase, max_batch: int = WRITE_QUEUE_MAX_BATCH,
+                 max_wait: float = WRITE_QUEUE_MAX_WAIT) -> None:
+        self.db = db
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._pending: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        self._pending = asyncio.Queue()
+        self._task = asyncio.create_task(self._write_batches())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        while not self._pending.empty():
+            _, future = self._pending.get_nowait()
+            if not future.done():
+                future.set_exception(DBException(error_detail = 'Write queue stopped'))
+
+    async def submit(self, operation: WriteOperation) -> Any:
+        future = asyncio.get_running_loop().create_future()
+        self._pending.put_nowait((operation, future))
+        return await future
+
+    async def enroll(self, enrollment_request: EnrollmentRequest) -> EnrollmentResponse:
+        return await self.submit(WriteOperation(enroll_step, enrollment_request, enrollment_request.course_code,
+                                                enrollment_request.section_number))
+
+    async def drop_course(self, registration: Registration) -> str:
+        return await self.submit(WriteOperation(drop_course_step, registration, registration.course_code,
+                                                registration.section_number))
+
+    async def drop_student(self, drop_request: DropStudentRequest) -> str:
+        return await self.submit(WriteOperation(drop_student_step, drop_request, drop_request.course_code,
+                                                drop_request.section_number))
+
+    async def _write_batches(self) -> None:
+        while True:
+            batch = [await self._pending.get()]
+            if self.max_wait > 0 and self._pending.qsize() < self.max_batch - 1:
+                await asyncio.sleep(self.max_wait)
+            while len(batch) < self.max_batch and not self._pending.empty():
+                batch.append(self._pending.get_nowait())
+            write_batch_size.observe(len(batch))
+            try:
+                outcomes = await self.db.run(run_write_batch, [operation for operation, _ in batch])
+            except Exception as err:
+                outcomes = [err] * len(batch)
+            for (_, future), outcome in zip(batch, outcomes):
+                # A caller that disconnected has cancelled its future
+                if future.done():
+                    continue
+                if isinstance(outcome, Exception):
+                    future.set_exception(outcome)
+                else:
+                    future.set_result(outcome)
+
+
+write_queue = WriteQueue(database)
+
+
+def get_write_queue() -> WriteQueue:
+    """FastAPI dependency returning the process' write queue."""
+    return write_queue